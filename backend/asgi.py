@@ -13,4 +13,6 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
+# Needed for the /api/async/ views and the /api/blogs/events stream, e.g.
+# ``uvicorn backend.asgi:application``
 application = get_asgi_application()
@@ -48,10 +48,15 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework_simplejwt',
     'blog',
-    'storages'
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the stack
+    'blog.metrics.MetricsMiddleware',
+    # Before anything that reads or writes the body, so it compresses last
+    'blog.compression.CompressionMiddleware',
+    # Decides which database the request's reads may use
+    'blog.routers.ReplicaMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -65,7 +70,7 @@ MIDDLEWARE = [
 REST_FRAMEWORK = {
     
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'blog.authentication.TokenUserAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -76,9 +81,19 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    # Refuses revoked, inactive and deleted users (see blog/authentication.py)
+    'TOKEN_REFRESH_SERIALIZER': 'blog.serializers.RevocationCheckedTokenRefreshSerializer',
     # Add other JWT settings as needed
 }
 
+# blog/authentication.py: revoked users and tokens are kept in the database;
+# each process reloads its copy of them every BLOG_AUTH_REVOCATION_REFRESH
+# seconds, so that is how long a revocation takes to reach the others. A TTL
+# above 0 makes request.user the full User, cached per process for that many
+# seconds, instead of a TokenUser.
+BLOG_AUTH_REVOCATION_REFRESH = env.int("BLOG_AUTH_REVOCATION_REFRESH", default=5)
+BLOG_AUTH_USER_CACHE_TTL = env.int("BLOG_AUTH_USER_CACHE_TTL", default=0)
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
@@ -114,10 +129,95 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 #     }
 # }
 
+# Connections are kept open for BLOG_DB_CONN_MAX_AGE seconds and checked
+# before reuse, instead of one per request. With BLOG_DB_POOL on PostgreSQL,
+# Django's psycopg pool is used instead (persistent connections must be off
+# for that); use it under ASGI, where persistent connections don't fit.
+# The pool is per process: size it to one gunicorn worker's threads and keep
+# workers * BLOG_DB_POOL_MAX_SIZE below the server's max_connections.
+BLOG_DB_POOL = env.bool("BLOG_DB_POOL", default=False)
+
+
+
+def database(url):
+    config = dj_database_url.parse(
+        url,
+        conn_max_age=0 if BLOG_DB_POOL else env.int("BLOG_DB_CONN_MAX_AGE", default=600),
+        conn_health_checks=True,
+    )
+    if BLOG_DB_POOL and config["ENGINE"] == "django.db.backends.postgresql":
+        config.setdefault("OPTIONS", {})["pool"] = {
+            "min_size": env.int("BLOG_DB_POOL_MIN_SIZE", default=2),
+            "max_size": env.int("BLOG_DB_POOL_MAX_SIZE", default=4),
+            # Seconds a request waits for a free connection before failing
+            "timeout": env.int("BLOG_DB_POOL_TIMEOUT", default=10),
+        }
+    return config
+
+
 DATABASES = {
-    "default": dj_database_url.parse(env("DATABASE_URL"))
+    "default": database(env("DATABASE_URL")),
+}
+
+# Read replicas (blog/routers.py), as comma-separated database URLs. Reads
+# made while serving GET and HEAD requests go to a replica; everything else,
+# and any read inside a transaction, stays on the primary. A user who wrote
+# is pinned to the primary for BLOG_DB_PIN_SECONDS, so they read their own
+# writes; share the pin cache between workers for that to hold across them.
+# Each replica's lag is checked at most every BLOG_DB_REPLICA_CHECK_INTERVAL
+# seconds, and one lagging more than BLOG_DB_REPLICA_MAX_LAG seconds, or not
+# answering, is skipped until it catches up. Keep the pin longer than the
+# lag allowance plus the check interval. The check runs on the request path,
+# so a replica that doesn't answer within BLOG_DB_REPLICA_CONNECT_TIMEOUT
+# seconds counts as down (PostgreSQL waits at least 2).
+BLOG_DB_REPLICAS = []
+BLOG_DB_REPLICA_CONNECT_TIMEOUT = env.int("BLOG_DB_REPLICA_CONNECT_TIMEOUT", default=2)
+for index, url in enumerate(env.list("DATABASE_REPLICA_URLS", default=[])):
+    alias = f"replica{index}"
+    DATABASES[alias] = database(url)
+    if DATABASES[alias]["ENGINE"] == "django.db.backends.postgresql":
+        options = DATABASES[alias].setdefault("OPTIONS", {})
+        options.setdefault("connect_timeout", BLOG_DB_REPLICA_CONNECT_TIMEOUT)
+        if "pool" in options:
+            options["pool"]["timeout"] = BLOG_DB_REPLICA_CONNECT_TIMEOUT
+    # Tests read the primary's test database through it
+    DATABASES[alias]["TEST"] = {"MIRROR": "default"}
+    BLOG_DB_REPLICAS.append(alias)
+BLOG_DB_REPLICA_MAX_LAG = env.float("BLOG_DB_REPLICA_MAX_LAG", default=2)
+BLOG_DB_REPLICA_CHECK_INTERVAL = env.float("BLOG_DB_REPLICA_CHECK_INTERVAL", default=3)
+BLOG_DB_PIN_SECONDS = env.int("BLOG_DB_PIN_SECONDS", default=10)
+BLOG_DB_PIN_CACHE = 'default'
+
+DATABASE_ROUTERS = ['blog.routers.ReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Local memory by default; point CACHE_URL at redis:// or memcache:// to share
+# cached feed pages between workers.
+
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='locmemcache://'),
 }
 
+BLOG_FEED_CACHE = 'default'
+# Also how far behind a cached page's save_count may be (see blog/cache.py)
+BLOG_FEED_CACHE_TIMEOUT = env.int('BLOG_FEED_CACHE_TIMEOUT', default=300)
+
+# Real-time feed events (blog/events.py), streamed at /api/blogs/events by the
+# ASGI app. The 'local' broker only reaches streams in the publishing process;
+# with several workers or nodes use 'postgres' (LISTEN/NOTIFY on the primary),
+# or a dotted path to a broker class.
+BLOG_EVENTS_BROKER = env("BLOG_EVENTS_BROKER", default="local")
+BLOG_EVENTS_CHANNEL = 'blog_events'
+BLOG_EVENTS_MAX_CONNECTIONS = env.int("BLOG_EVENTS_MAX_CONNECTIONS", default=10000)  # Per process
+BLOG_EVENTS_BUFFER = env.int("BLOG_EVENTS_BUFFER", default=100)  # Events held for a slow client before it's reset
+BLOG_EVENTS_HEARTBEAT = env.int("BLOG_EVENTS_HEARTBEAT", default=15)  # Seconds between keep-alive comments
+
+# Author profile summaries (blog/profiles.py). Dropped when the author writes;
+# the timeout bounds how far behind other users' saves the save totals get.
+BLOG_AUTHOR_PROFILE_CACHE = 'default'
+BLOG_AUTHOR_PROFILE_TIMEOUT = env.int('BLOG_AUTHOR_PROFILE_TIMEOUT', default=60)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -137,6 +237,35 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing (blog/hashers.py). BLOG_PASSWORD_HASHER hashes new
+# passwords, and a login whose password was stored by another hasher or with
+# other costs is rehashed with it. "argon2" needs argon2-cffi installed.
+BLOG_PASSWORD_HASHER = env("BLOG_PASSWORD_HASHER", default="scrypt")
+BLOG_SCRYPT_WORK_FACTOR = env.int("BLOG_SCRYPT_WORK_FACTOR", default=2**14)
+BLOG_SCRYPT_PARALLELISM = env.int("BLOG_SCRYPT_PARALLELISM", default=1)
+BLOG_ARGON2_TIME_COST = env.int("BLOG_ARGON2_TIME_COST", default=2)
+BLOG_ARGON2_MEMORY_COST = env.int("BLOG_ARGON2_MEMORY_COST", default=65536)  # KiB
+BLOG_ARGON2_PARALLELISM = env.int("BLOG_ARGON2_PARALLELISM", default=1)
+BLOG_PBKDF2_ITERATIONS = env.int("BLOG_PBKDF2_ITERATIONS", default=870000)
+_PASSWORD_HASHERS = {
+    'scrypt': 'blog.hashers.TunedScryptPasswordHasher',
+    'argon2': 'blog.hashers.TunedArgon2PasswordHasher',
+    'pbkdf2': 'blog.hashers.TunedPBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[BLOG_PASSWORD_HASHER]] + [
+    hasher for name, hasher in _PASSWORD_HASHERS.items() if name != BLOG_PASSWORD_HASHER
+]
+
+# Login rate limits (blog/throttling.py); 0 turns a limit off. Every attempt
+# counts per IP, failures count per username. Behind a proxy, set
+# BLOG_CLIENT_IP_HEADER (e.g. HTTP_X_FORWARDED_FOR) so clients are told apart.
+BLOG_LOGIN_THROTTLE_CACHE = 'default'
+BLOG_LOGIN_IP_ATTEMPTS = env.int("BLOG_LOGIN_IP_ATTEMPTS", default=30)
+BLOG_LOGIN_IP_WINDOW = env.int("BLOG_LOGIN_IP_WINDOW", default=60)  # seconds
+BLOG_LOGIN_USER_FAILURES = env.int("BLOG_LOGIN_USER_FAILURES", default=10)
+BLOG_LOGIN_USER_WINDOW = env.int("BLOG_LOGIN_USER_WINDOW", default=900)  # seconds
+BLOG_CLIENT_IP_HEADER = env("BLOG_CLIENT_IP_HEADER", default="")
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
@@ -161,12 +290,87 @@ MEDIA_URL = 'media/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CORS_ALLOW_ALL_ORIGINS = True
 
-AWS_ACCESS_KEY_ID = env("AWS_ACCESS_KEY_ID")
-AWS_SECRET_ACCESS_KEY = env("AWS_SECRET_ACCESS_KEY")
+# Credentials may be left out to use boto3's own lookup (e.g. an instance role)
+AWS_ACCESS_KEY_ID = env("AWS_ACCESS_KEY_ID", default="")
+AWS_SECRET_ACCESS_KEY = env("AWS_SECRET_ACCESS_KEY", default="")
 AWS_STORAGE_BUCKET_NAME = env("AWS_STORAGE_BUCKET_NAME")
-AWS_S3_REGION_NAME = env("AWS_S3_REGION_NAME")  # e.g., 'us-west-1'
-AWS_S3_SIGNATURE_VERSION = env("AWS_S3_SIGNATURE_VERSION")
-# AWS_S3_FILE_OVERWRITE = False  # This prevents files from being overwritten
-# AWS_DEFAULT_ACL = 'public-read'  # Make uploaded files public
-AWS_QUERYSTRING_AUTH = False  # Disable query parameter authentication for public files
-DEFAULT_FILE_STORAGE = env("DEFAULT_FILE_STORAGE")
\ No newline at end of file
+AWS_S3_REGION_NAME = env("AWS_S3_REGION_NAME", default="")  # e.g., 'us-west-1'
+AWS_S3_SIGNATURE_VERSION = env("AWS_S3_SIGNATURE_VERSION", default="s3v4")
+
+# Request metrics (blog/metrics.py, served at /metrics). The sample rate is the
+# share of requests whose queries and S3 calls are counted; sampled requests
+# slower than BLOG_SLOW_REQUEST_MS are logged with their queries.
+BLOG_METRICS_SAMPLE_RATE = env.float("BLOG_METRICS_SAMPLE_RATE", default=1.0)
+BLOG_SLOW_REQUEST_MS = env.int("BLOG_SLOW_REQUEST_MS", default=500)
+BLOG_METRICS_TOKEN = env("BLOG_METRICS_TOKEN", default="")  # Bearer token required by /metrics, if set
+
+# Where image objects live (blog/s3.py): "boto3" talks to AWS; "local" keeps
+# them under BLOG_LOCAL_STORAGE_ROOT and serves them at /media/ (single-node
+# and test deployments); "memory" keeps them in-process for offline runs. A
+# dotted path to a factory returning a boto3-like client also works.
+BLOG_S3_CLIENT = env("BLOG_S3_CLIENT", default="boto3")
+BLOG_LOCAL_STORAGE_ROOT = env("BLOG_LOCAL_STORAGE_ROOT", default=str(BASE_DIR / "storage"))
+# Prefix of image URLs, before the object key; may point at a CDN.
+BLOG_MEDIA_URL = env(
+    "BLOG_MEDIA_URL",
+    default="/" if BLOG_S3_CLIENT == "local" else f"https://{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/",
+)
+# S3 calls the async views (/api/async/...) and a batch of uploads run at
+# once. The boto3 connection pool also serves request threads calling S3
+# directly, so it is larger by default.
+BLOG_S3_MAX_CONCURRENCY = env.int("BLOG_S3_MAX_CONCURRENCY", default=10)
+BLOG_S3_MAX_POOL_CONNECTIONS = env.int("BLOG_S3_MAX_POOL_CONNECTIONS", default=2 * BLOG_S3_MAX_CONCURRENCY)
+# Seconds; a stalled request fails over to a retry instead of holding a worker
+BLOG_S3_CONNECT_TIMEOUT = env.float("BLOG_S3_CONNECT_TIMEOUT", default=5)
+BLOG_S3_READ_TIMEOUT = env.float("BLOG_S3_READ_TIMEOUT", default=30)
+BLOG_S3_MAX_ATTEMPTS = env.int("BLOG_S3_MAX_ATTEMPTS", default=3)
+
+# Most items in one request to the batch endpoints (/api/blogs/batch/...).
+# Inline base64 images still count towards DATA_UPLOAD_MAX_MEMORY_SIZE, so
+# large imports should upload images first and post with imageID.
+BLOG_BATCH_MAX_ITEMS = env.int("BLOG_BATCH_MAX_ITEMS", default=100)
+
+# Streamed image uploads (POST /api/blogs/images). Only one part is buffered
+# in memory at a time; S3 requires parts of at least 5 MB.
+BLOG_UPLOAD_MAX_SIZE = env.int("BLOG_UPLOAD_MAX_SIZE", default=10 * 1024 * 1024)
+BLOG_UPLOAD_PART_SIZE = env.int("BLOG_UPLOAD_PART_SIZE", default=8 * 1024 * 1024)
+# Presigned direct-to-S3 uploads (POST /api/blogs/images/presign), in seconds
+BLOG_PRESIGNED_UPLOAD_EXPIRY = env.int("BLOG_PRESIGNED_UPLOAD_EXPIRY", default=900)
+
+# Background image uploads (python manage.py process_image_jobs)
+BLOG_IMAGE_JOB_MAX_ATTEMPTS = env.int("BLOG_IMAGE_JOB_MAX_ATTEMPTS", default=5)
+BLOG_IMAGE_JOB_RETRY_DELAY = env.int("BLOG_IMAGE_JOB_RETRY_DELAY", default=2)  # seconds, doubled per attempt
+BLOG_IMAGE_JOB_LEASE = env.int("BLOG_IMAGE_JOB_LEASE", default=300)  # seconds a claimed job is hidden from other workers
+
+# Resized copies made by the image worker (needs Pillow). Formats Pillow
+# can't encode are skipped.
+BLOG_IMAGE_VARIANT_WIDTHS = [int(width) for width in env.list("BLOG_IMAGE_VARIANT_WIDTHS", default=[320, 640, 1280])]
+BLOG_IMAGE_VARIANT_FORMATS = env.list("BLOG_IMAGE_VARIANT_FORMATS", default=["webp", "avif"])
+BLOG_IMAGE_VARIANT_QUALITY = env.int("BLOG_IMAGE_VARIANT_QUALITY", default=75)
+
+# /api/blogs/changes: changes newer than the settle time wait for the next
+# poll; deletions are remembered for the retention period, and clients that
+# haven't synced for longer start over.
+BLOG_SYNC_SETTLE_SECONDS = env.int("BLOG_SYNC_SETTLE_SECONDS", default=2)
+BLOG_SYNC_RETENTION_DAYS = env.int("BLOG_SYNC_RETENTION_DAYS", default=30)
+
+# Server-rendered pages (blog/pages.py). Browsers keep a page for max-age
+# and a CDN for the shared max-age, then revalidate with the ETag; while
+# that runs the stale copy may be served. Rendered posts stay in the
+# fragment cache for the fragment timeout, or until the post changes.
+BLOG_PAGE_MAX_AGE = env.int("BLOG_PAGE_MAX_AGE", default=60)
+BLOG_PAGE_SHARED_MAX_AGE = env.int("BLOG_PAGE_SHARED_MAX_AGE", default=300)
+BLOG_PAGE_STALE_WHILE_REVALIDATE = env.int("BLOG_PAGE_STALE_WHILE_REVALIDATE", default=600)
+BLOG_PAGE_FRAGMENT_TIMEOUT = env.int("BLOG_PAGE_FRAGMENT_TIMEOUT", default=24 * 60 * 60)
+
+# Response compression (blog.compression): Brotli if the brotli package is
+# installed and the client accepts it, else gzip. Quality 11 is far too slow
+# for per-request compression; 4-5 is close to it in size.
+BLOG_COMPRESS_MIN_SIZE = env.int("BLOG_COMPRESS_MIN_SIZE", default=1024)
+BLOG_BROTLI_QUALITY = env.int("BLOG_BROTLI_QUALITY", default=5)
+
+# Orphaned image collection (python manage.py collect_orphan_images, also run
+# by the image worker every BLOG_ORPHAN_SWEEP_INTERVAL seconds). Anything
+# younger than the grace period is left alone.
+BLOG_ORPHAN_GRACE_PERIOD = env.int("BLOG_ORPHAN_GRACE_PERIOD", default=24 * 60 * 60)
+BLOG_ORPHAN_SWEEP_INTERVAL = env.int("BLOG_ORPHAN_SWEEP_INTERVAL", default=60 * 60)
\ No newline at end of file
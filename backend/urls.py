@@ -17,25 +17,55 @@ Including another URLconf
 from django.contrib import admin
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.urls import path
-from blog.views import (RegisterView, LoginView, BlogPost, GetBlogs,UpdatePost,DeletePost,SaveBlog,getSavedBlogs,deleteSaveBlog)
+from blog.views import (RegisterView, LoginView, BlogPost, GetBlogs,UpdatePost,DeletePost,SaveBlog,getSavedBlogs,deleteSaveBlog,UploadImage,PresignImageUpload,FinalizeImageUpload,SearchBlogs,GetPopularBlogs,getSavedBlogIds,ThrottledTokenObtainPairView,BatchBlogPost,BatchSaveBlogs,BatchUnsaveBlogs,GetBlogChanges,GetAuthorBlogs)
+from blog import async_views
+from blog import events
+from blog import pages
+from blog import local_storage
+from blog.metrics import metrics_view
 from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
     TokenRefreshView,
 )
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
+    # Server-rendered public pages
+    path('blogs/', pages.blog_list, name='blog_list_page'),
+    path('blogs/<int:id>/', pages.blog_detail, name='blog_detail_page'),
+    # Image files, with BLOG_S3_CLIENT=local only
+    path('media/<path:name>', local_storage.serve_media, name='media'),
     path('api/auth/register', RegisterView.as_view(), name='auth_register'),
     path('api/auth/login', LoginView.as_view(), name='auth_login'),
-     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+     path('api/token/', ThrottledTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/blogs/post', BlogPost.as_view(), name='blog_post'),
+    path('api/blogs/images', UploadImage.as_view(), name='upload_image'),
+    path('api/blogs/images/presign', PresignImageUpload.as_view(), name='presign_image_upload'),
+    path('api/blogs/images/finalize', FinalizeImageUpload.as_view(), name='finalize_image_upload'),
     path('api/blogs/', GetBlogs.as_view(), name='get_blogs'),
+    path('api/blogs/changes', GetBlogChanges.as_view(), name='get_blog_changes'),
+    path('api/blogs/events', events.event_stream, name='blog_events'),
+    path('api/blogs/search', SearchBlogs.as_view(), name='search_blogs'),
+    path('api/blogs/popular', GetPopularBlogs.as_view(), name='get_popular_blogs'),
+    path('api/authors/<int:id>/blogs', GetAuthorBlogs.as_view(), name='get_author_blogs'),
     path('api/blogs/edit', UpdatePost.as_view(), name='update_post'),
     path('api/blogs/delete/<int:id>/', DeletePost.as_view(), name='delete_post'),
     path('api/blogs/save/<int:blogID>/<int:userID>/', SaveBlog.as_view(), name='delete_post'),
     path('api/blogs/saved/<int:userID>/', getSavedBlogs.as_view(), name='get_saved_blogs'),
+    path('api/blogs/saved/<int:userID>/ids', getSavedBlogIds.as_view(), name='get_saved_blog_ids'),
     path('api/blogs/saved/remove/<int:blogID>/', deleteSaveBlog.as_view(), name='remove_saved_blog'),
+    path('api/blogs/batch/post', BatchBlogPost.as_view(), name='batch_blog_post'),
+    path('api/blogs/batch/save', BatchSaveBlogs.as_view(), name='batch_save_blogs'),
+    path('api/blogs/batch/unsave', BatchUnsaveBlogs.as_view(), name='batch_unsave_blogs'),
+    # Async views for ASGI deployments; same requests and responses as above
+    path('api/async/blogs/post', async_views.post_blog, name='async_blog_post'),
+    path('api/async/blogs/', async_views.get_blogs, name='async_get_blogs'),
+    path('api/async/blogs/popular', async_views.get_popular_blogs, name='async_get_popular_blogs'),
+    path('api/async/blogs/edit', async_views.update_post, name='async_update_post'),
+    path('api/async/blogs/delete/<int:id>/', async_views.delete_post, name='async_delete_post'),
+    path('api/async/blogs/save/<int:blogID>/<int:userID>/', async_views.save_blog, name='async_save_blog'),
+    path('api/async/blogs/saved/<int:userID>/', async_views.get_saved_blogs, name='async_get_saved_blogs'),
     
 ]
 
@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
 
 
 class BlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blog'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+
+        from .authentication import user_deleted, user_saved, user_saving
+        from .metrics import install_query_recorder
+        from .models import Blog
+        from .sync import blog_deleted
+        connection_created.connect(install_query_recorder)
+        pre_save.connect(user_saving, sender=User)
+        post_save.connect(user_saved, sender=User)
+        post_delete.connect(user_deleted, sender=User)
+        post_delete.connect(blog_deleted, sender=Blog)
@@ -0,0 +1,279 @@
+import json
+import logging
+from functools import wraps
+from uuid import uuid4
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from . import cache as feed_cache
+from . import s3
+from . import services
+from .authentication import TokenUserAuthentication
+from .models import Blog, Image, SavedBlog
+from .pagination import BlogFeedPagination, PopularFeedPagination, SavedBlogPagination
+from .serializers import BlogValuesSerializer, SavedBlogSerializer
+
+logger = logging.getLogger(__name__)
+
+# Async versions of the hot blog endpoints, mounted under /api/async/ and
+# served by an ASGI server (e.g. ``uvicorn backend.asgi:application``).
+#
+# Reads use the async ORM and cache APIs, and S3 calls go through
+# s3.acall(), so a request waiting on the database or S3 holds no worker.
+# Writes that need a transaction run in services.* on a thread through
+# sync_to_async, as Django's async ORM has no async transactions. Responses
+# match the APIView versions in views.py.
+
+
+async def authenticate(request):
+    """The user for the request's Bearer token, or None."""
+    try:
+        result = await TokenUserAuthentication().aauthenticate(request)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    return result[0] if result else None
+
+
+def login_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request.user = await authenticate(request)
+        if request.user is None:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def get_data(request):
+    """The form or JSON object the request carries as ``(data, None)``, else ``(None, error response)``."""
+    if request.content_type != 'application/json':
+        return request.POST, None
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError as e:
+        # As DRF's JSONParser answers for the APIView versions
+        return None, JsonResponse({"detail": f"JSON parse error - {e}"}, status=400)
+    if not isinstance(data, dict):
+        return None, JsonResponse({"detail": "Expected a JSON object."}, status=400)
+    return data, None
+
+
+async def upload_image(img_data, ext):
+    # Inline upload, so the image is ready as soon as the post exists
+    filename = f"{uuid4()}.{ext}"
+    await s3.acall(
+        'put_object',
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=s3.image_key(filename),
+        Body=img_data,
+        ContentType=f"image/{ext}",
+    )
+    return filename
+
+
+async def paginated_blogs(request, queryset, pagination_class, serialize):
+    paginator = pagination_class()
+    try:
+        page = await paginator.apaginate_queryset(queryset, Request(request))
+    except NotFound as e:
+        return None, JsonResponse({"detail": str(e.detail)}, status=404)
+    return paginator.get_paginated_data(serialize(page)), None
+
+
+def values_serializer(request):
+    try:
+        return BlogValuesSerializer.from_query(request.GET), None
+    except ValueError as e:
+        return None, JsonResponse({"error": str(e)}, status=400)
+
+
+@require_http_methods(['GET'])
+async def get_blogs(request):
+    serializer, error = values_serializer(request)
+    if error is not None:
+        return error
+    cache_key, entry = await feed_cache.aget_feed_page(Request(request))
+    if entry is None:
+        blogs = serializer.values(Blog.objects.all(), 'id')
+        data, error = await paginated_blogs(request, blogs, BlogFeedPagination, serializer.many)
+        if error is not None:
+            return error
+        entry = await feed_cache.aset_feed_page(cache_key, data)
+
+    headers = feed_cache.feed_page_headers(entry)
+    if feed_cache.feed_page_not_modified(request, entry):
+        return HttpResponse(status=304, headers=headers)
+    return JsonResponse(entry['data'], headers=headers)
+
+
+@require_http_methods(['GET'])
+async def get_popular_blogs(request):
+    serializer, error = values_serializer(request)
+    if error is not None:
+        return error
+    blogs = serializer.values(Blog.objects.all(), 'save_count', 'id')
+    data, error = await paginated_blogs(request, blogs, PopularFeedPagination, serializer.many)
+    return error or JsonResponse(data)
+
+
+@require_http_methods(['GET'])
+async def get_saved_blogs(request, userID):
+    blogs = SavedBlog.objects.filter(saved_by_id=userID).select_related('blog__author', 'blog__image')
+    data, error = await paginated_blogs(request, blogs, SavedBlogPagination, lambda page: SavedBlogSerializer(page, many=True).data)
+    return error or JsonResponse(data)
+
+
+def _stored_image(filename, ext, digest):
+    # The image with the bytes, after upload_image() put them at filename if
+    # given; None if nothing has them yet
+    if filename is None:
+        return services.find_image(digest)
+    return services.add_uploaded_image(filename, f"image/{ext}", content_hash=digest)
+
+
+@sync_to_async
+def _create_post(author_id, title, content, image, filename=None, ext=None, digest=None):
+    with transaction.atomic():
+        if image is None:
+            image = _stored_image(filename, ext, digest)
+            if image is None:
+                return None
+        return services.create_post(author_id, title, content, image)
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+@login_required
+async def post_blog(request):
+    data, error = get_data(request)
+    if error is not None:
+        return error
+    image_id = data.get('imageID')
+
+    if image_id is None:
+        try:
+            ext, img_data = services.decode_base64_image(data.get('image'))
+        except ValueError:
+            return JsonResponse({"error": "Invalid image data"}, status=400)
+
+    author_id = data.get('userID')
+    if str(author_id) != str(request.user.id):
+        try:
+            author_id = await User.objects.values_list('id', flat=True).aget(id=author_id)
+        except (User.DoesNotExist, ValueError):
+            return JsonResponse({"error": "User not found"}, status=404)
+
+    if image_id is not None:
+        try:
+            blog_image = await sync_to_async(services.get_uploaded_image)(image_id, request.user)
+        except (Image.DoesNotExist, ValueError):
+            return JsonResponse({"error": "Image not found."}, status=404)
+        new_post = await _create_post(author_id, data.get('title'), data.get('content'), blog_image)
+    else:
+        # Bytes that are already stored aren't uploaded again
+        digest = services.image_digest(img_data)
+        new_post = await _create_post(author_id, data.get('title'), data.get('content'), None, digest=digest)
+        if new_post is None:
+            try:
+                filename = await upload_image(img_data, ext)
+            except Exception as e:
+                logger.error(f"Image upload failed: {e}")
+                return JsonResponse({"error": "Image upload failed"}, status=500)
+            new_post = await _create_post(author_id, data.get('title'), data.get('content'), None, filename, ext, digest)
+
+    return JsonResponse({"message": "Blog posted successfully!", "post_id": new_post.id, "image_status": new_post.image.status}, status=201)
+
+
+@sync_to_async
+def _update_post(blog_post, title, content, new_image, filename=None, ext=None, digest=None):
+    with transaction.atomic():
+        if digest is not None:
+            new_image = _stored_image(filename, ext, digest)
+            if new_image is None:
+                return None
+        return services.update_post(blog_post, title, content, image=new_image)
+
+
+@csrf_exempt
+@require_http_methods(['PUT'])
+@login_required
+async def update_post(request):
+    data, error = get_data(request)
+    if error is not None:
+        return error
+    image_base64 = data.get('image')
+    image_id = data.get('imageID')
+    blog_id = data.get('id')
+    logger.info(f"Updating blog post with ID: {blog_id}")
+
+    try:
+        blog_post = await Blog.objects.select_related('image').aget(id=blog_id, author_id=request.user.id)
+    except (Blog.DoesNotExist, ValueError):
+        return JsonResponse({"error": "Blog post not found or you do not have permission to edit it."}, status=404)
+
+    new_image = None
+    ext = digest = None
+    if image_id is not None:
+        try:
+            new_image = await sync_to_async(services.get_uploaded_image)(image_id, request.user)
+        except (Image.DoesNotExist, ValueError):
+            return JsonResponse({"error": "Image not found."}, status=404)
+    elif image_base64:
+        try:
+            ext, img_data = services.decode_base64_image(image_base64)
+        except ValueError:
+            logger.error("Image decoding failed")
+            return JsonResponse({"error": "Invalid image data"}, status=400)
+        digest = services.image_digest(img_data)
+
+    # Unchanged bytes find the post's own image, and nothing is uploaded
+    title, content = data.get('title'), data.get('content')
+    updated = await _update_post(blog_post, title, content, new_image, ext=ext, digest=digest)
+    if updated is None:
+        try:
+            filename = await upload_image(img_data, ext)
+        except Exception as e:
+            logger.error(f"Image upload failed: {e}")
+            return JsonResponse({"error": "Image upload failed"}, status=500)
+        updated = await _update_post(blog_post, title, content, new_image, filename, ext, digest)
+    blog_post = updated
+    logger.info(f"Blog post with ID {blog_id} updated successfully")
+    return JsonResponse({"message": "Blog post updated successfully!", "post_id": blog_post.id, "image_status": blog_post.image.status}, status=200)
+
+
+@csrf_exempt
+@require_http_methods(['DELETE'])
+@login_required
+async def delete_post(request, id):
+    try:
+        blog = await Blog.objects.select_related('image').aget(pk=id, author_id=request.user.id)
+    except Blog.DoesNotExist:
+        return JsonResponse({"error": "Blog post not found or you do not have permission to delete it."}, status=404)
+
+    await sync_to_async(services.delete_post)(blog)
+    logger.info(f"Deleted blog post with ID {id}.")
+    return JsonResponse({"message": "Blog post deleted successfully!"}, status=204)
+
+
+@csrf_exempt
+@require_http_methods(['PUT'])
+async def save_blog(request, blogID, userID):
+    try:
+        blog = await Blog.objects.aget(pk=blogID)
+        user = await User.objects.aget(pk=userID)
+    except Blog.DoesNotExist:
+        return JsonResponse({"error": "Blog post not found or you do not have permission to delete it."}, status=404)
+    except User.DoesNotExist:
+        return JsonResponse({"error": "User not found."}, status=404)
+
+    blog_saved, created = await sync_to_async(services.save_blog)(blog, user)
+    return JsonResponse({"message": "Blog post saved successfully!", "post_id": blog_saved.id}, status=200)
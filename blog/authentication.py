@@ -0,0 +1,256 @@
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser as SimpleJWTTokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Revocation
+from .routers import PRIMARY
+
+# JWT authentication without a users-table query per request.
+#
+# The access token already carries the user id and username (see
+# CustomTokenObtainPairSerializer), so request.user is a TokenUser built from
+# its claims. What the database lookup used to catch, a user deactivated or
+# deleted after the token was issued, is covered by the revocation list:
+# Revocation rows that reject a user's tokens issued before a point in time,
+# or a single token by its jti. A refresh token passes its iat on to the
+# access tokens it mints, so a user's entry must outlive their refresh tokens
+# too: it lasts the longer of the two token lifetimes, and /api/token/refresh/
+# checks it as well (RevocationCheckedTokenRefreshSerializer in serializers.py).
+#
+# The rows live in the database, so no eviction or per-process cache can
+# lose one. Each process keeps a copy of the unexpired rows and reloads it
+# from the primary every BLOG_AUTH_REVOCATION_REFRESH seconds, so a
+# revocation made by another process takes up to that long to apply. If the
+# copy can't be reloaded, requests with a token fail instead of going
+# through unchecked.
+#
+# Entries come from User post_save/post_delete, so code that deactivates
+# users with QuerySet.update() or deletes them in bulk without signals must
+# call revoke_user() for each of them itself.
+#
+# With BLOG_AUTH_USER_CACHE_TTL > 0, request.user is instead the real User,
+# kept in a per-process cache for that many seconds.
+
+REVOKED_USER_KEY = 'user:{}'
+REVOKED_TOKEN_KEY = 'jti:{}'
+USER_CACHE_SIZE = 10000
+
+
+class TokenUser(SimpleJWTTokenUser):
+    # Integer ids, like User.pk; simplejwt puts the id in the token as a string
+    @cached_property
+    def id(self):
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+
+def _lifetime():
+    lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+    return int(lifetime.total_seconds())
+
+
+class RevocationList:
+    """This process's copy of the unexpired revocations, as ``{key: revoked_at}``."""
+
+    def __init__(self):
+        self.entries = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def _stale(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at >= settings.BLOG_AUTH_REVOCATION_REFRESH
+
+    def get(self):
+        if self._stale():
+            with self.lock:
+                if self._stale():
+                    self.load()
+        return self.entries
+
+    async def aget(self):
+        if self._stale():
+            return await sync_to_async(self.get)()
+        return self.entries
+
+    def load(self):
+        loaded_at = time.monotonic()
+        # From the primary, so a lagging replica can't hide a revocation. A
+        # DatabaseError goes up to the request: no token is trusted unchecked.
+        rows = Revocation.objects.using(PRIMARY).filter(expires_at__gt=timezone.now()).values_list('key', 'revoked_at')
+        self.entries = dict(rows)
+        self.loaded_at = loaded_at
+
+    def set(self, key, revoked_at):
+        # This process applies its own revocations right away
+        with self.lock:
+            self.entries = {**self.entries, key: revoked_at}
+
+    def discard(self, key):
+        with self.lock:
+            self.entries = {k: v for k, v in self.entries.items() if k != key}
+
+
+_revocations = RevocationList()
+
+
+def _revoke(key, revoked_at, expires_at):
+    Revocation.objects.bulk_create(
+        [Revocation(key=key, revoked_at=revoked_at, expires_at=expires_at)],
+        update_conflicts=True,
+        unique_fields=['key'],
+        update_fields=['revoked_at', 'expires_at'],
+    )
+    _revocations.set(key, revoked_at)
+
+
+def revoke_user(user_id):
+    """Reject every access and refresh token issued to the user until now."""
+    _revoke(REVOKED_USER_KEY.format(user_id), int(time.time()), timezone.now() + timedelta(seconds=_lifetime()))
+    _user_cache.evict(user_id)
+
+
+def unrevoke_user(user_id):
+    """Accept the user's tokens again, e.g. once they are reactivated."""
+    key = REVOKED_USER_KEY.format(user_id)
+    Revocation.objects.filter(key=key).delete()
+    _revocations.discard(key)
+    _user_cache.evict(user_id)
+
+
+def revoke_token(token):
+    """Reject one access token, e.g. on logout."""
+    remaining = int(token['exp'] - time.time())
+    if remaining > 0:
+        expires_at = timezone.now() + timedelta(seconds=remaining)
+        _revoke(REVOKED_TOKEN_KEY.format(token[api_settings.JTI_CLAIM]), int(time.time()), expires_at)
+
+
+def prune_revocations():
+    return Revocation.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+def _revocation_keys(token, user_id):
+    return REVOKED_USER_KEY.format(user_id), REVOKED_TOKEN_KEY.format(token.get(api_settings.JTI_CLAIM))
+
+
+def _revoked(token, revoked, user_key, token_key):
+    if token_key in revoked:
+        return True
+    # Same-second tokens count as revoked; iat only has second precision
+    return user_key in revoked and token.get('iat', 0) <= revoked[user_key]
+
+
+def is_revoked(token, user_id):
+    return _revoked(token, _revocations.get(), *_revocation_keys(token, user_id))
+
+
+async def ais_revoked(token, user_id):
+    return _revoked(token, await _revocations.aget(), *_revocation_keys(token, user_id))
+
+
+class UserCache:
+    """Recently authenticated users, for BLOG_AUTH_USER_CACHE_TTL seconds."""
+
+    def __init__(self):
+        self.users = {}
+        self.lock = threading.Lock()
+
+    def get(self, user_id, ttl):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.users.get(user_id)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        user = User.objects.filter(pk=user_id).first()
+        with self.lock:
+            if len(self.users) >= USER_CACHE_SIZE:
+                self.users.clear()
+            self.users[user_id] = (now + ttl, user)
+        return user
+
+    def evict(self, user_id):
+        with self.lock:
+            self.users.pop(user_id, None)
+
+
+_user_cache = UserCache()
+
+
+def _token_user_id(validated_token):
+    try:
+        return int(validated_token[api_settings.USER_ID_CLAIM])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidToken("Token contained no recognizable user identification")
+
+
+def _check_user(user):
+    if user is None:
+        raise AuthenticationFailed("User not found", code="user_not_found")
+    if not user.is_active:
+        raise AuthenticationFailed("User is inactive", code="user_inactive")
+    return user
+
+
+class TokenUserAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        user_id = _token_user_id(validated_token)
+        if is_revoked(validated_token, user_id):
+            raise AuthenticationFailed("Token has been revoked", code="token_revoked")
+
+        ttl = settings.BLOG_AUTH_USER_CACHE_TTL
+        if not ttl:
+            return TokenUser(validated_token)
+        return _check_user(_user_cache.get(user_id, ttl))
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views; only a user cache miss leaves the event loop."""
+        header = self.get_header(request)
+        raw_token = header and self.get_raw_token(header)
+        if not raw_token:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        user_id = _token_user_id(validated_token)
+        if await ais_revoked(validated_token, user_id):
+            raise AuthenticationFailed("Token has been revoked", code="token_revoked")
+
+        ttl = settings.BLOG_AUTH_USER_CACHE_TTL
+        if not ttl:
+            return TokenUser(validated_token), validated_token
+        user = await sync_to_async(_user_cache.get)(user_id, ttl)
+        return _check_user(user), validated_token
+
+
+# Connected to User pre_save, post_save and post_delete in apps.py
+
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    # Only a save that turns is_active on lifts a revocation; any other save
+    # of an active user, e.g. a profile edit, leaves it in place
+    instance._blog_reactivated = (
+        instance.is_active
+        and instance.pk is not None
+        and (update_fields is None or 'is_active' in update_fields)
+        and User.objects.using(PRIMARY).filter(pk=instance.pk, is_active=False).exists()
+    )
+
+
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    _user_cache.evict(instance.pk)
+    if update_fields is not None and 'is_active' not in update_fields:
+        return  # e.g. the last_login update on every login
+    if not instance.is_active:
+        revoke_user(instance.pk)
+    elif getattr(instance, '_blog_reactivated', False):
+        unrevoke_user(instance.pk)
+
+
+def user_deleted(sender, instance, **kwargs):
+    revoke_user(instance.pk)
@@ -0,0 +1,386 @@
+import gzip
+import json
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import cache as feed_cache
+from . import s3
+from . import search
+from .metrics import DB_CONNECTIONS
+from .counters import reconcile_save_counts
+from .models import Blog, Image, SavedBlog
+from .compression import brotli
+from .pagination import BlogFeedPagination
+from .serializers import BlogSerializer, BlogValuesSerializer
+
+# Load test for the blog API; run by ``python manage.py benchmark_api``.
+#
+# Seeds a throwaway database, then times each scenario in-process through the
+# Django test client (where per-request query counts are captured too) and/or
+# over HTTP against a threaded server with concurrent clients, counting the
+# database connections it opens. Queries above
+# a scenario's budget, or a p95 above the saved baseline, are regressions.
+
+PASSWORD = 'benchmark-password'
+COMPACT_FIELDS = 'id,title,excerpt,thumbnail'
+# 1x1 PNG, for post requests
+PNG_BASE64 = 'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='
+
+
+class Scenario:
+    def __init__(self, name, make_request, max_queries, before=None, max_requests=None, expected=None):
+        self.name = name
+        self.make_request = make_request  # (fixture, i) -> (method, path, body, token)
+        self.max_queries = max_queries
+        self.before = before  # untimed, runs before every request
+        self.max_requests = max_requests
+        self.expected = expected  # statuses that aren't errors; by default anything below 400
+
+    def is_error(self, status):
+        return status not in self.expected if self.expected else status >= 400
+
+
+def _clear_feed_cache():
+    feed_cache.get_feed_cache().clear()
+
+
+def _feed(fixture, i):
+    return 'GET', '/api/blogs/', None, None
+
+
+def _feed_compact(fixture, i):
+    return 'GET', f'/api/blogs/?fields={COMPACT_FIELDS}', None, None
+
+
+def _feed_deep(fixture, i):
+    return 'GET', f"/api/blogs/?cursor={fixture['deep_cursor']}", None, None
+
+
+def _saved(fixture, i):
+    user_id = fixture['user_ids'][i % len(fixture['user_ids'])]
+    return 'GET', f'/api/blogs/saved/{user_id}/', None, None
+
+
+def _login(fixture, i):
+    username = fixture['usernames'][i % len(fixture['usernames'])]
+    return 'POST', '/api/auth/login', {'username': username, 'password': PASSWORD}, None
+
+
+def _login_attack(fixture, i):
+    # Password guessing against one account; throttled after a few failures
+    return 'POST', '/api/auth/login', {'username': 'attack-target', 'password': f'guess{i}'}, None
+
+
+def _post(fixture, i):
+    user_id, token, _ = fixture['authors'][i % len(fixture['authors'])]
+    body = {'title': f'Benchmark post {i}', 'content': 'Posted by the benchmark.', 'image': PNG_BASE64, 'userID': user_id}
+    return 'POST', '/api/blogs/post', body, token
+
+
+def _edit(fixture, i):
+    _, token, blog_id = fixture['authors'][i % len(fixture['authors'])]
+    body = {'id': blog_id, 'title': f'Edited {i}', 'content': 'Edited by the benchmark.'}
+    return 'PUT', '/api/blogs/edit', body, token
+
+
+# Budgets are what each request costs today; raise one only on purpose.
+SCENARIOS = {
+    scenario.name: scenario for scenario in [
+        # Cache cleared first, so every request builds the page
+        Scenario('feed', _feed, max_queries=1, before=_clear_feed_cache),
+        Scenario('feed_compact', _feed_compact, max_queries=1, before=_clear_feed_cache),
+        Scenario('feed_deep', _feed_deep, max_queries=1, before=_clear_feed_cache),
+        Scenario('feed_cached', _feed, max_queries=0),
+        Scenario('saved', _saved, max_queries=1),
+        # Password hashing dominates; capped so a default run stays short
+        Scenario('login', _login, max_queries=1, max_requests=20),
+        Scenario('login_attack', _login_attack, max_queries=1, expected=(401, 429)),
+        Scenario('post', _post, max_queries=13),
+        Scenario('edit', _edit, max_queries=8),
+    ]
+}
+
+
+def seed(users=100, blogs=1000, saves=10, rng=None):
+    """Create ``users`` users, ``blogs`` blogs and up to ``saves`` saves per user."""
+    rng = rng or random.Random(0)
+    password = make_password(PASSWORD)  # hashed once, shared by every user
+    User.objects.bulk_create(
+        [User(username=f'bench{i}', password=password) for i in range(users)], batch_size=1000
+    )
+    user_ids = list(User.objects.filter(username__startswith='bench').values_list('id', flat=True))
+
+    images = Image.objects.bulk_create(
+        [Image(url=s3.image_url(f'bench{i}.png'), public_id=f'bench{i}.png', status=Image.READY, ref_count=1) for i in range(blogs)],
+        batch_size=1000,
+    )
+    Blog.objects.bulk_create(
+        [
+            Blog(title=f'Benchmark blog {i}', content=f'Seeded content for blog {i}. ' * 20, image=image, author_id=rng.choice(user_ids))
+            for i, image in enumerate(images)
+        ],
+        batch_size=1000,
+    )
+    blog_ids = list(Blog.objects.values_list('id', flat=True))
+    SavedBlog.objects.bulk_create(
+        [
+            SavedBlog(saved_by_id=user_id, blog_id=blog_id)
+            for user_id in user_ids
+            for blog_id in rng.sample(blog_ids, min(saves, len(blog_ids)))
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    reconcile_save_counts()
+    search.rebuild_index()
+
+
+def build_fixture(authors=20):
+    users = list(User.objects.filter(username__startswith='bench').order_by('id'))
+    first_blogs = {}
+    for blog_id, author_id in Blog.objects.order_by('id').values_list('id', 'author_id'):
+        first_blogs.setdefault(author_id, blog_id)
+    writers = [user for user in users if user.id in first_blogs][:authors]
+
+    # Cursor for the page halfway down the feed
+    middle = Blog.objects.order_by('-id').values_list('id', flat=True)[Blog.objects.count() // 2]
+    return {
+        'user_ids': [user.id for user in users],
+        'usernames': [user.username for user in users],
+        'authors': [(user.id, str(RefreshToken.for_user(user).access_token), first_blogs[user.id]) for user in writers],
+        'deep_cursor': BlogFeedPagination().encode_cursor([middle]),
+    }
+
+
+class ClientDriver:
+    """In-process requests through the test client, counting queries."""
+    name = 'client'
+
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method, path, body, token):
+        headers = {'HTTP_ACCEPT_ENCODING': 'gzip, br'}
+        if token:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = self.client.generic(
+                method, path, json.dumps(body) if body is not None else '', content_type='application/json', **headers
+            )
+            elapsed = time.perf_counter() - start
+        return response.status_code, elapsed, len(queries), len(response.content)
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class _PooledWSGIServer(WSGIServer):
+    """Serves requests on a fixed set of threads, like gunicorn's gthread
+    workers, so persistent database connections outlive a request."""
+
+    def __init__(self, *args, threads, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threads = threads
+        self.pool = ThreadPoolExecutor(threads, thread_name_prefix='benchmark-http')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def close_connections(self):
+        # One task per thread; the barrier stops a thread from taking two
+        barrier = threading.Barrier(self.threads)
+
+        def close():
+            barrier.wait()
+            connections.close_all()
+
+        wait([self.pool.submit(close) for _ in range(self.threads)])
+
+    def server_close(self):
+        super().server_close()
+        self.close_connections()
+        self.pool.shutdown()
+
+
+class LiveDriver:
+    """Requests over HTTP to a WSGI server with ``threads`` threads in this process."""
+    name = 'live'
+
+    def __init__(self, threads=8):
+        self.server = _PooledWSGIServer(('127.0.0.1', 0), _QuietHandler, allow_reuse_address=False, threads=threads)
+        self.server.set_app(WSGIHandler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        host, port = self.server.server_address
+        self.base_url = f'http://{host}:{port}'
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def request(self, method, path, body, token):
+        headers = {'Content-Type': 'application/json', 'Accept-Encoding': 'gzip, br'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req) as response:
+                size = len(response.read())
+                status = response.status
+        except urllib.error.HTTPError as e:
+            size = len(e.read())
+            status = e.code
+        return status, time.perf_counter() - start, None, size
+
+
+def _percentile(sorted_values, percent):
+    index = min(len(sorted_values) - 1, max(0, round(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(driver, scenario, fixture, requests, concurrency=1):
+    requests = min(requests, scenario.max_requests or requests)
+    samples = []
+    lock = threading.Lock()
+
+    def one(i):
+        if scenario.before:
+            scenario.before()
+        result = driver.request(*scenario.make_request(fixture, i))
+        with lock:
+            samples.append(result)
+
+    # Untimed, so one-off costs (first connection, a cold cache) don't skew the numbers
+    if scenario.before:
+        scenario.before()
+    driver.request(*scenario.make_request(fixture, requests))
+
+    opened = DB_CONNECTIONS.value(connection.alias)
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(one, range(requests)))
+    else:
+        for i in range(requests):
+            one(i)
+    wall = time.perf_counter() - start
+    opened = DB_CONNECTIONS.value(connection.alias) - opened
+
+    latencies = sorted(elapsed for _, elapsed, _, _ in samples)
+    queries = [count for _, _, count, _ in samples if count is not None]
+    return {
+        'requests': requests,
+        'errors': sum(1 for status, _, _, _ in samples if scenario.is_error(status)),
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p95_ms': _percentile(latencies, 95) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+        'mean_ms': statistics.fmean(latencies) * 1000,
+        'throughput': requests / wall if wall else 0.0,
+        'queries': max(queries) if queries else None,
+        'connections': opened,
+        'bytes': round(statistics.fmean(size for _, _, _, size in samples)),
+    }
+
+
+def find_regressions(results, baseline=None, tolerance=0.25):
+    """Messages for errors, query budgets exceeded and p95s ``tolerance`` above the baseline."""
+    problems = []
+    for mode, scenarios in results.items():
+        for name, result in scenarios.items():
+            label = f'{mode}/{name}'
+            if result['errors']:
+                problems.append(f"{label}: {result['errors']} of {result['requests']} requests failed")
+            budget = SCENARIOS[name].max_queries
+            if result['queries'] is not None and result['queries'] > budget:
+                problems.append(f"{label}: {result['queries']} queries per request, budget is {budget}")
+            previous = (baseline or {}).get(mode, {}).get(name)
+            if previous and result['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                problems.append(f"{label}: p95 {result['p95_ms']:.1f}ms, baseline {previous['p95_ms']:.1f}ms")
+    return problems
+
+
+def format_report(results):
+    lines = [f"{'scenario':<20}{'reqs':>6}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'queries':>9}{'conns':>7}{'bytes':>9}"]
+    for mode, scenarios in results.items():
+        for name, r in scenarios.items():
+            queries = '-' if r['queries'] is None else r['queries']
+            lines.append(
+                f"{mode + '/' + name:<20}{r['requests']:>6}{r['errors']:>5}{r['p50_ms']:>9.1f}"
+                f"{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['throughput']:>9.1f}{queries:>9}{r.get('connections', '-'):>7}{r.get('bytes', '-'):>9}"
+            )
+    return '\n'.join(lines)
+
+
+def measure_serialization(posts=1000, repeat=5):
+    """
+    CPU time to fetch and serialize ``posts`` posts, and to render them to
+    JSON, per serialization path, scaled to 1000 posts; best of ``repeat``.
+    Also the body size, raw and compressed.
+    """
+    posts = min(posts, Blog.objects.count())
+    full, compact = BlogValuesSerializer(), BlogValuesSerializer(COMPACT_FIELDS.split(','))
+    paths = {
+        'serializer': lambda: BlogSerializer(Blog.objects.select_related('author', 'image')[:posts], many=True).data,
+        'values': lambda: full.many(full.values(Blog.objects.all())[:posts]),
+        'values_compact': lambda: compact.many(compact.values(Blog.objects.all())[:posts]),
+    }
+    scale = 1000 / posts if posts else 0
+    results = {}
+    for name, build in paths.items():
+        serialize = render = float('inf')
+        for _ in range(repeat):
+            start = time.process_time()
+            data = build()
+            built = time.process_time()
+            body = JSONRenderer().render(data)
+            serialize = min(serialize, built - start)
+            render = min(render, time.process_time() - built)
+        results[name] = {
+            'serialize_ms': serialize * 1000 * scale,
+            'render_ms': render * 1000 * scale,
+            'bytes': len(body),
+            'gzip_bytes': len(gzip.compress(body)),
+            'br_bytes': len(brotli.compress(body, quality=5)) if brotli else None,
+        }
+    return posts, results
+
+
+def format_serialization_report(posts, results):
+    lines = [
+        f"Serialization of {posts} posts, CPU ms per 1000 posts",
+        f"{'path':<16}{'serialize':>11}{'render':>9}{'bytes':>10}{'gzip':>9}{'br':>9}",
+    ]
+    for name, r in results.items():
+        lines.append(
+            f"{name:<16}{r['serialize_ms']:>11.1f}{r['render_ms']:>9.1f}{r['bytes']:>10}"
+            f"{r['gzip_bytes']:>9}{r['br_bytes'] if r['br_bytes'] is not None else '-':>9}"
+        )
+    return '\n'.join(lines)
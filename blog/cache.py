@@ -0,0 +1,142 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.response import Response
+
+from .routers import max_staleness
+
+# Every cached feed page key embeds two generation tokens. Bumping a token
+# orphans all pages keyed on it; they then age out of the cache on their own.
+#
+# - FEED_VERSION_KEY covers the whole feed and is bumped when an existing post
+#   changes or goes away.
+# - FEED_HEAD_KEY covers only first pages (no cursor). With keyset paging a new
+#   post can only appear on a first page, so creating a post leaves every
+#   cursor page cached.
+#
+# Saves and unsaves bump neither: they are the most frequent writes, and would
+# empty the cache each time. A cached page's save_count can therefore lag by
+# up to BLOG_FEED_CACHE_TIMEOUT; /api/blogs/popular is not cached and is current.
+FEED_VERSION_KEY = 'blog:feed:version'
+FEED_HEAD_KEY = 'blog:feed:head'
+
+
+def get_feed_cache():
+    return caches[settings.BLOG_FEED_CACHE]
+
+
+def _new_token():
+    return str(time.time_ns())
+
+
+KEYS = [FEED_VERSION_KEY, FEED_HEAD_KEY]
+
+
+def _generations(cache):
+    tokens = cache.get_many(KEYS)
+    for key in KEYS:
+        if key not in tokens:
+            # Tokens are never reused, so losing one to eviction just starts
+            # a fresh generation instead of resurrecting stale pages.
+            cache.add(key, _new_token(), None)
+            tokens[key] = cache.get(key)
+    return tokens[FEED_VERSION_KEY], tokens[FEED_HEAD_KEY]
+
+
+async def _agenerations(cache):
+    tokens = await cache.aget_many(KEYS)
+    for key in KEYS:
+        if key not in tokens:
+            await cache.aadd(key, _new_token(), None)
+            tokens[key] = await cache.aget(key)
+    return tokens[FEED_VERSION_KEY], tokens[FEED_HEAD_KEY]
+
+
+def get_generations():
+    """The current ``(version, head)`` tokens, e.g. for ETags of pages built from the feed."""
+    return _generations(get_feed_cache())
+
+
+def _page_key(request, version, head):
+    if request.query_params.get('cursor'):
+        head = 'cursor'
+    # The absolute URI covers the cursor, page size and host of the next link.
+    uri = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'blog:feed:page:{version}:{head}:{uri}'
+
+
+def _entry(data):
+    body = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
+    return {
+        'data': data,
+        'etag': quote_etag(hashlib.md5(body.encode()).hexdigest()),
+    }
+
+
+def get_feed_page(request):
+    """Return ``(cache_key, entry)`` for this feed request; entry is None on a miss."""
+    cache = get_feed_cache()
+    cache_key = _page_key(request, *_generations(cache))
+    return cache_key, cache.get(cache_key)
+
+
+async def aget_feed_page(request):
+    cache = get_feed_cache()
+    cache_key = _page_key(request, *await _agenerations(cache))
+    return cache_key, await cache.aget(cache_key)
+
+
+def _page_timeout(cache_key):
+    # A page read from a replica soon after a change may predate it; keep it
+    # only until the replica has surely caught up, not for the full timeout
+    staleness = max_staleness()
+    if staleness:
+        version, head = cache_key.split(':')[3:5]
+        newest = max(int(version), 0 if head == 'cursor' else int(head))
+        if time.time_ns() - newest < staleness * 1e9:
+            return staleness
+    return settings.BLOG_FEED_CACHE_TIMEOUT
+
+
+def set_feed_page(cache_key, data):
+    entry = _entry(data)
+    get_feed_cache().set(cache_key, entry, _page_timeout(cache_key))
+    return entry
+
+
+async def aset_feed_page(cache_key, data):
+    entry = _entry(data)
+    await get_feed_cache().aset(cache_key, entry, _page_timeout(cache_key))
+    return entry
+
+
+def feed_page_headers(entry):
+    return {'ETag': entry['etag'], 'Cache-Control': 'no-cache'}
+
+
+def feed_page_not_modified(request, entry):
+    # Weak comparison: compressed responses carry the ETag as W/"..."
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    return entry['etag'] in {etag.removeprefix('W/') for etag in etags}
+
+
+def feed_page_response(request, entry):
+    headers = feed_page_headers(entry)
+    if feed_page_not_modified(request, entry):
+        return Response(status=304, headers=headers)
+    return Response(entry['data'], headers=headers)
+
+
+def invalidate_feed_head():
+    # A post was created.
+    get_feed_cache().set(FEED_HEAD_KEY, _new_token(), None)
+
+
+def invalidate_feed():
+    # A post was edited or deleted.
+    get_feed_cache().set(FEED_VERSION_KEY, _new_token(), None)
@@ -0,0 +1,157 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import s3
+from .authentication import prune_revocations
+from .images import VARIANTS_DIR
+from .models import Image, PendingDeletion, SweepState
+from .sync import prune_tombstones
+
+logger = logging.getLogger(__name__)
+
+# S3 accepts at most this many keys per delete_objects call
+DELETE_BATCH_SIZE = 1000
+BUCKET_SWEEP = 'bucket_sweep'
+
+
+def image_keys(image):
+    """Every bucket key that belongs to an image: the original and its variants."""
+    return [s3.image_key(image.public_id)] + [s3.image_key(variant['file']) for variant in image.variants]
+
+
+def enqueue_key_deletion(keys):
+    PendingDeletion.objects.bulk_create(
+        [PendingDeletion(key=key) for key in keys],
+        ignore_conflicts=True,
+    )
+
+
+def delete_images(images):
+    """Delete image rows now and queue their bucket keys for the worker."""
+    images = list(images)
+    with transaction.atomic():
+        enqueue_key_deletion([key for image in images for key in image_keys(image)])
+        Image.objects.filter(pk__in=[image.pk for image in images]).delete()
+
+
+def delete_pending_keys(batch_size=DELETE_BATCH_SIZE, max_batches=None):
+    """
+    Remove queued keys from the bucket, up to 1000 per ``delete_objects``.
+
+    A row is only dropped once S3 has confirmed that key, so keys that failed,
+    or that a crashed run never reached, are retried on the next run.
+    """
+    batch_size = min(batch_size, DELETE_BATCH_SIZE)
+    deleted = 0
+    batches = 0
+    last_id = 0
+    while max_batches is None or batches < max_batches:
+        pending = list(
+            PendingDeletion.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'key')[:batch_size]
+        )
+        if not pending:
+            break
+        last_id = pending[-1][0]
+        batches += 1
+
+        response = s3.client.delete_objects(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Delete={'Objects': [{'Key': key} for _, key in pending], 'Quiet': True},
+        )
+        failed = {error['Key'] for error in response.get('Errors', [])}
+        for error in response.get('Errors', []):
+            logger.error("Failed to delete %s from S3: %s", error['Key'], error.get('Message'))
+        done = [pk for pk, key in pending if key not in failed]
+        PendingDeletion.objects.filter(pk__in=done).delete()
+        deleted += len(done)
+    if deleted:
+        logger.info(f"Deleted {deleted} objects from S3")
+    return deleted
+
+
+def collect_orphan_rows(grace):
+    """Queue deletion of images that no blog uses and that are older than ``grace``."""
+    cutoff = timezone.now() - grace
+    collected = 0
+    while True:
+        # No blog, and not waiting on the worker either
+        orphans = list(
+            Image.objects.filter(blog__isnull=True, jobs__isnull=True, created_at__lt=cutoff)
+            .order_by('id')[:DELETE_BATCH_SIZE]
+        )
+        if not orphans:
+            break
+        delete_images(orphans)
+        collected += len(orphans)
+    if collected:
+        logger.info(f"Collected {collected} orphaned image rows")
+    return collected
+
+
+def _owner(name):
+    # "<public_id>" for originals, "variants/<public_id>/<width>w.<fmt>" for variants
+    if name.startswith(VARIANTS_DIR):
+        return name[len(VARIANTS_DIR):].split('/', 1)[0]
+    return name
+
+
+def sweep_bucket(grace, max_pages=None):
+    """
+    Queue deletion of bucket keys under media/blog_images/ that no image owns.
+
+    The listing position is saved after every page, so an interrupted sweep
+    resumes where it stopped; a finished sweep starts over next time. Keys
+    newer than ``grace`` are left alone, as they may belong to an upload that
+    is still being finalized.
+    """
+    state, _ = SweepState.objects.get_or_create(name=BUCKET_SWEEP)
+    cutoff = timezone.now() - grace
+    queued = 0
+    pages = 0
+    while max_pages is None or pages < max_pages:
+        params = {'Bucket': settings.AWS_STORAGE_BUCKET_NAME, 'Prefix': s3.IMAGE_PREFIX, 'MaxKeys': DELETE_BATCH_SIZE}
+        if state.value:
+            params['StartAfter'] = state.value
+        page = s3.client.list_objects_v2(**params)
+        pages += 1
+        objects = [obj for obj in page.get('Contents', []) if obj['LastModified'] < cutoff]
+
+        names = {obj['Key'][len(s3.IMAGE_PREFIX):] for obj in objects}
+        owners = dict(
+            Image.objects.filter(public_id__in={_owner(name) for name in names}).values_list('public_id', 'variants')
+        )
+        orphans = []
+        for name in names:
+            owner = _owner(name)
+            if owner not in owners:
+                orphans.append(name)
+            elif name != owner and name not in {variant['file'] for variant in owners[owner]}:
+                # A variant from an older width/format configuration
+                orphans.append(name)
+
+        with transaction.atomic():
+            enqueue_key_deletion([s3.image_key(name) for name in orphans])
+            contents = page.get('Contents', [])
+            state.value = contents[-1]['Key'] if page.get('IsTruncated') and contents else ''
+            state.save()
+        queued += len(orphans)
+        if not state.value:
+            break
+    if queued:
+        logger.info(f"Queued {queued} orphaned bucket keys for deletion")
+    return queued
+
+
+def collect_garbage(grace=None, scan_bucket=True, max_pages=None):
+    if grace is None:
+        grace = timedelta(seconds=settings.BLOG_ORPHAN_GRACE_PERIOD)
+    rows = collect_orphan_rows(grace)
+    keys = sweep_bucket(grace, max_pages) if scan_bucket else 0
+    deleted = delete_pending_keys()
+    tombstones = prune_tombstones()
+    revocations = prune_revocations()
+    return rows, keys, deleted, tombstones, revocations
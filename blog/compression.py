@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; without it responses are gzipped
+    brotli = None
+
+re_accepts_br = _lazy_re_compile(r"\bbr\b")
+# Images and other binary bodies are already compressed, or served by sendfile;
+# gzip would hold server-sent events back until its buffer filled
+re_compressible = _lazy_re_compile(r"^(text/(?!event-stream)|application/(json|javascript|xml)|image/svg\+xml)")
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compress text and JSON bodies of at least BLOG_COMPRESS_MIN_SIZE bytes:
+    with Brotli when the client accepts it and the brotli package is
+    installed, otherwise with gzip as GZipMiddleware does.
+    """
+
+    def process_response(self, request, response):
+        if not re_compressible.search(response.get("Content-Type", "")):
+            return response
+        if not response.streaming and len(response.content) < settings.BLOG_COMPRESS_MIN_SIZE:
+            return response
+        accepts_br = re_accepts_br.search(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if brotli is None or not accepts_br or response.streaming or response.has_header("Content-Encoding"):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        compressed = brotli.compress(response.content, quality=settings.BLOG_BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(compressed))
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
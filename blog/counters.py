@@ -0,0 +1,42 @@
+import logging
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Blog, SavedBlog
+
+logger = logging.getLogger(__name__)
+
+
+def add_saves(blog_id, delta):
+    # Relative update, so concurrent saves of the same blog don't lose counts
+    blogs = Blog.objects.filter(pk=blog_id)
+    if delta < 0:
+        blogs = blogs.filter(save_count__gte=-delta)
+    blogs.update(save_count=F('save_count') + delta)
+
+
+def reconcile_save_counts(batch_size=1000):
+    """
+    Repair ``Blog.save_count`` drift against the actual SavedBlog rows.
+
+    Walks the blog table in primary key ranges so every statement touches at
+    most ``batch_size`` blogs, and only rewrites the rows that are off.
+    Returns the number of blogs fixed.
+    """
+    saves = SavedBlog.objects.filter(blog=OuterRef('pk')).order_by().values('blog').annotate(n=Count('pk')).values('n')
+    actual = Coalesce(Subquery(saves), 0)
+    fixed = 0
+    last_id = 0
+    while True:
+        ids = list(Blog.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        last_id = ids[-1]
+        with transaction.atomic():
+            drifted = Blog.objects.filter(pk__in=ids).alias(actual=actual).exclude(save_count=F('actual'))
+            fixed += Blog.objects.filter(pk__in=list(drifted.values_list('pk', flat=True))).update(save_count=actual)
+    if fixed:
+        logger.warning(f"Repaired save counts of {fixed} blogs")
+    return fixed
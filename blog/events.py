@@ -0,0 +1,251 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django.views.decorators.http import require_GET
+
+from .routers import PRIMARY
+
+logger = logging.getLogger(__name__)
+
+# Real-time feed events, streamed as server-sent events by event_stream
+# (/api/blogs/events) when the app is served by backend/asgi.py.
+#
+# The blog writes in services.py publish compact create, update and delete
+# events ({"id", "author", "updated_at"}) once they commit. The broker
+# (BLOG_EVENTS_BROKER) carries them to every process serving streams, where
+# the hub hands them to each open stream. An event is formatted once, whatever
+# the number of streams, and an idle stream is a parked coroutine with an
+# empty buffer: no thread, no database connection.
+#
+# Each stream buffers at most BLOG_EVENTS_BUFFER events while its client
+# can't keep up, then gets a "reset" event and is closed. "reset" means
+# events may have been missed; clients catch up through /api/blogs/changes.
+
+RESET = b'event: reset\ndata: {}\n\n'
+PING = b': ping\n\n'
+LISTEN_RETRY_SECONDS = 5
+NOTIFY_BATCH_SIZE = 50
+
+
+def _frame(event):
+    data = json.dumps({key: value for key, value in event.items() if key != 'type'}, cls=DjangoJSONEncoder)
+    return f"event: {event['type']}\ndata: {data}\n\n".encode()
+
+
+class Subscription:
+    # One stream's buffer; only touched on its event loop
+    def __init__(self, limit):
+        self.frames = deque()
+        self.limit = limit
+        self.ready = asyncio.Event()
+        self.overflowed = False
+
+    def push(self, frames):
+        if self.overflowed:
+            return
+        if len(self.frames) + len(frames) > self.limit:
+            # Don't hold events for a client that isn't reading them
+            self.overflowed = True
+            self.frames.clear()
+        else:
+            self.frames.extend(frames)
+        self.ready.set()
+
+    async def get(self, timeout):
+        """The buffered frames, or an empty list after ``timeout`` seconds without any."""
+        if not self.frames and not self.overflowed:
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.ready.clear()
+        frames = list(self.frames)
+        self.frames.clear()
+        return frames
+
+
+class Hub:
+    # The streams open in this process, by event loop
+    def __init__(self):
+        self.loops = {}
+        self.lock = threading.Lock()
+
+    def count(self):
+        with self.lock:
+            return sum(len(subscriptions) for subscriptions in self.loops.values())
+
+    def subscribe(self):
+        subscription = Subscription(settings.BLOG_EVENTS_BUFFER)
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            self.loops.setdefault(loop, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            subscriptions = self.loops.get(loop, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.loops.pop(loop, None)
+
+    def deliver(self, frames):
+        """Hand ``frames`` to every stream; safe to call from any thread."""
+        with self.lock:
+            loops = [(loop, tuple(subscriptions)) for loop, subscriptions in self.loops.items()]
+        for loop, subscriptions in loops:
+            try:
+                # One callback per loop, however many streams it serves
+                loop.call_soon_threadsafe(_push_all, subscriptions, frames)
+            except RuntimeError:
+                with self.lock:
+                    self.loops.pop(loop, None)  # Closed
+
+
+def _push_all(subscriptions, frames):
+    for subscription in subscriptions:
+        subscription.push(frames)
+
+
+hub = Hub()
+
+
+class LocalBroker:
+    """Delivers within this process only; for a single ASGI process, and tests."""
+
+    def publish(self, events):
+        hub.deliver([_frame(event) for event in events])
+
+    def start(self):
+        pass
+
+
+class PostgresBroker:
+    """
+    Fans events out to every process through LISTEN/NOTIFY on the primary.
+
+    Each process serving streams holds one listening connection, opened by
+    a thread on its first stream; publishers just NOTIFY.
+    """
+
+    def __init__(self):
+        self.channel = settings.BLOG_EVENTS_CHANNEL
+        self.started = False
+        self.lock = threading.Lock()
+
+    def publish(self, events):
+        # NOTIFY payloads are capped at 8000 bytes; an event is ~100
+        with connections[PRIMARY].cursor() as cursor:
+            for start in range(0, len(events), NOTIFY_BATCH_SIZE):
+                batch = events[start:start + NOTIFY_BATCH_SIZE]
+                cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, json.dumps(batch, cls=DjangoJSONEncoder)])
+
+    def start(self):
+        with self.lock:
+            if not self.started:
+                self.started = True
+                threading.Thread(target=self.listen, name='blog-events-listener', daemon=True).start()
+
+    def listen(self):
+        import psycopg
+        from psycopg import sql
+
+        connected_before = False
+        while True:
+            try:
+                params = connections[PRIMARY].get_connection_params()
+                with psycopg.connect(**params, autocommit=True) as connection:
+                    connection.execute(sql.SQL('LISTEN {}').format(sql.Identifier(self.channel)))
+                    if connected_before:
+                        # Whatever was sent while reconnecting is lost
+                        hub.deliver([RESET])
+                    connected_before = True
+                    for notify in connection.notifies():
+                        hub.deliver([_frame(event) for event in json.loads(notify.payload)])
+            except Exception as e:
+                logger.warning(f"Event listener lost its connection, retrying in {LISTEN_RETRY_SECONDS}s: {e}")
+                time.sleep(LISTEN_RETRY_SECONDS)
+
+
+BROKERS = {
+    'local': LocalBroker,
+    'postgres': PostgresBroker,
+}
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                name = settings.BLOG_EVENTS_BROKER
+                _broker = (BROKERS.get(name) or import_string(name))()
+    return _broker
+
+
+def blog_event(kind, blog, blog_id=None):
+    # blog_id for a deleted blog, whose pk delete() has cleared
+    return {
+        'type': kind,
+        'id': blog_id or blog.pk,
+        'author': blog.author_id,
+        'updated_at': timezone.now() if kind == 'delete' else blog.updated_at,
+    }
+
+
+def publish(events):
+    """Publish ``blog_event()`` events; call once the write has committed."""
+    try:
+        get_broker().publish(events)
+    except Exception as e:
+        # The write stands; streaming clients find it through /api/blogs/changes
+        logger.warning(f"Couldn't publish {len(events)} blog events: {e}")
+
+
+async def _stream():
+    subscription = hub.subscribe()
+    try:
+        # Sent right away, so the client and any proxy see the stream open
+        yield PING
+        while True:
+            frames = await subscription.get(settings.BLOG_EVENTS_HEARTBEAT)
+            if subscription.overflowed:
+                yield RESET
+                return
+            # The heartbeat keeps proxies from closing an idle stream
+            yield b''.join(frames) if frames else PING
+    finally:
+        hub.unsubscribe(subscription)
+
+
+@require_GET
+async def event_stream(request):
+    """Server-sent create, update and delete events of the blog feed."""
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be tied up for as long as the client listens
+        return JsonResponse({"error": "Event streams are served by the ASGI app only."}, status=501)
+    if hub.count() >= settings.BLOG_EVENTS_MAX_CONNECTIONS:
+        return JsonResponse(
+            {"error": "Too many event streams; try again later."},
+            status=503,
+            headers={'Retry-After': str(settings.BLOG_EVENTS_HEARTBEAT)},
+        )
+    get_broker().start()
+    response = StreamingHttpResponse(_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stops nginx holding events back
+    return response
@@ -0,0 +1,55 @@
+import base64
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher
+
+# Django's hashers with their cost parameters taken from settings. Django
+# rehashes a password at the next successful login when it was stored with
+# other parameters, or by a hasher other than the first in PASSWORD_HASHERS,
+# so changing any of these upgrades users as they log in.
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return settings.BLOG_SCRYPT_WORK_FACTOR
+
+    @property
+    def parallelism(self):
+        return settings.BLOG_SCRYPT_PARALLELISM
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        # As Django's, but with room for the parameters being used, which may
+        # be a stored hash's rather than ours: scrypt needs about
+        # 128 * r * (N + p) bytes, and OpenSSL refuses more than 32 MB by default.
+        self._check_encode_args(password, salt)
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        hash_ = hashlib.scrypt(
+            password.encode(), salt=salt.encode(), n=n, r=r, p=p,
+            maxmem=128 * r * (n + p) + 1024 * 1024, dklen=64,
+        )
+        hash_ = base64.b64encode(hash_).decode('ascii').strip()
+        return '%s$%d$%s$%d$%d$%s' % (self.algorithm, n, salt, r, p, hash_)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return settings.BLOG_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.BLOG_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.BLOG_ARGON2_PARALLELISM
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.BLOG_PBKDF2_ITERATIONS
@@ -0,0 +1,73 @@
+import io
+import logging
+
+from django.conf import settings
+
+from . import s3
+
+try:
+    from PIL import Image as PILImage
+except ImportError:  # Pillow is optional; without it only originals are served
+    PILImage = None
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'variants/'
+
+
+def variant_formats():
+    """The configured variant formats this Pillow build can encode."""
+    if PILImage is None:
+        return []
+    PILImage.init()
+    return [fmt for fmt in settings.BLOG_IMAGE_VARIANT_FORMATS if fmt.upper() in PILImage.SAVE]
+
+
+def variant_name(filename, width, fmt):
+    # Grouped under the original's name so the owner of any key is known
+    # without a lookup (see blog/cleanup.py).
+    return f"{VARIANTS_DIR}{filename}/{width}w.{fmt}"
+
+
+def make_variants(filename, data):
+    """
+    Resize an original to each configured width, encode it in each variant
+    format and upload the results next to the original.
+
+    Returns the list stored on ``Image.variants``. Widths larger than the
+    original are clamped to it rather than upscaled.
+    """
+    formats = variant_formats()
+    source = PILImage.open(io.BytesIO(data))
+    widest = max(settings.BLOG_IMAGE_VARIANT_WIDTHS)
+    # Lets the JPEG decoder scale down while decoding, which is far cheaper
+    # than decoding at full size and resizing afterwards.
+    source.draft('RGB', (widest, widest))
+    has_alpha = 'A' in source.getbands() or 'transparency' in source.info
+    source = source.convert('RGBA' if has_alpha else 'RGB')
+
+    variants = []
+    for width in sorted({min(width, source.width) for width in settings.BLOG_IMAGE_VARIANT_WIDTHS}):
+        height = max(1, round(source.height * width / source.width))
+        resized = source if width == source.width else source.resize(
+            (width, height), PILImage.Resampling.LANCZOS, reducing_gap=3.0
+        )
+        for fmt in formats:
+            buffer = io.BytesIO()
+            resized.save(buffer, format=fmt.upper(), quality=settings.BLOG_IMAGE_VARIANT_QUALITY)
+            name = variant_name(filename, width, fmt)
+            s3.client.put_object(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                Key=s3.image_key(name),
+                Body=buffer.getvalue(),
+                ContentType=f"image/{fmt}",
+            )
+            variants.append({
+                'width': width,
+                'height': height,
+                'format': fmt,
+                'file': name,
+                'url': s3.image_url(name),
+                'size': buffer.tell(),
+            })
+    return variants
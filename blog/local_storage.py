@@ -0,0 +1,278 @@
+import hashlib
+import io
+import mimetypes
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlencode
+from uuid import uuid4
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core import signing
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+
+from . import s3
+
+# Image objects on local disk, for single-node and test deployments
+# (BLOG_S3_CLIENT=local). LocalFileS3 answers the same boto3 calls as
+# InMemoryS3, keeping each object in BLOG_LOCAL_STORAGE_ROOT/<bucket>/<key>,
+# and serve_media hands them out at BLOG_MEDIA_URL. Files go out through
+# FileResponse, so a WSGI server with wsgi.file_wrapper (gunicorn) sends
+# them with sendfile instead of copying them through Python.
+
+mimetypes.add_type('image/webp', '.webp')
+mimetypes.add_type('image/avif', '.avif')
+
+PRESIGN_SALT = 'blog.local_storage.presign'
+TEMP_PREFIX = '.tmp-'
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def _not_found(operation):
+    return ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, operation)
+
+
+def _content_type(key):
+    return mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+
+def _etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+class LocalFileS3:
+    def __init__(self, root):
+        self.root = Path(root).resolve()
+
+    def path(self, Bucket, Key):
+        path = (self.root / Bucket / Key).resolve()
+        # Keys come from clients too; none may reach outside the bucket
+        if not path.is_relative_to(self.root / Bucket) or path.name.startswith(TEMP_PREFIX):
+            raise ClientError({'Error': {'Code': 'InvalidKey', 'Message': 'Invalid key'}}, 'Path')
+        return path
+
+    def _write(self, path, write):
+        # Readers only ever see a complete file: write aside, then rename over
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=path.parent, prefix=TEMP_PREFIX, delete=False) as file:
+            try:
+                write(file)
+            except BaseException:
+                os.unlink(file.name)
+                raise
+        os.replace(file.name, path)
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, **kwargs):
+        path = self.path(Bucket, Key)
+        if isinstance(Body, (bytes, bytearray, memoryview)):
+            self._write(path, lambda file: file.write(Body))
+        else:
+            self._write(path, lambda file: shutil.copyfileobj(Body, file, COPY_CHUNK_SIZE))
+        return {'ETag': _etag(path.stat())}
+
+    def put_stream(self, Bucket, Key, stream, max_size):
+        """Write ``stream`` to the object; raises ValueError past ``max_size`` bytes, leaving the old object."""
+        def write(file):
+            size = 0
+            while chunk := stream.read(COPY_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise ValueError("Object too large")
+                file.write(chunk)
+        path = self.path(Bucket, Key)
+        self._write(path, write)
+        return path.stat()
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        try:
+            os.unlink(self.path(Bucket, Key))
+        except FileNotFoundError:
+            pass
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        for obj in Delete['Objects']:
+            self.delete_object(Bucket, obj['Key'])
+        if Delete.get('Quiet'):
+            return {}
+        return {'Deleted': [{'Key': obj['Key']} for obj in Delete['Objects']]}
+
+    def list_objects_v2(self, Bucket, Prefix='', StartAfter='', MaxKeys=1000, **kwargs):
+        bucket = self.root / Bucket
+        # Only walk the directory the prefix points into
+        top = bucket / Prefix.rpartition('/')[0]
+        keys = []
+        for dirpath, dirnames, filenames in os.walk(top):
+            relative = Path(dirpath).relative_to(bucket).as_posix()
+            base = '' if relative == '.' else relative + '/'
+            keys += [
+                base + name for name in filenames
+                if not name.startswith(TEMP_PREFIX) and (base + name).startswith(Prefix) and base + name > StartAfter
+            ]
+        keys.sort()
+        contents = []
+        for key in keys[:MaxKeys]:
+            try:
+                stat = (bucket / key).stat()
+            except FileNotFoundError:
+                continue  # Deleted since the walk
+            contents.append({'Key': key, 'Size': stat.st_size, 'LastModified': datetime.fromtimestamp(stat.st_mtime, timezone.utc)})
+        return {'Contents': contents, 'KeyCount': len(contents), 'IsTruncated': len(keys) > MaxKeys}
+
+    def _stat(self, Bucket, Key, operation):
+        try:
+            return self.path(Bucket, Key).stat()
+        except FileNotFoundError:
+            raise _not_found(operation)
+
+    def head_object(self, Bucket, Key, **kwargs):
+        stat = self._stat(Bucket, Key, 'HeadObject')
+        return {
+            'ContentLength': stat.st_size,
+            'ContentType': _content_type(Key),
+            'ETag': _etag(stat),
+            'LastModified': datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+        }
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        try:
+            file = open(self.path(Bucket, Key), 'rb')
+        except FileNotFoundError:
+            raise _not_found('GetObject')
+        size = os.fstat(file.fileno()).st_size
+        if Range:
+            # Only the range is read; the file is handed back otherwise, for
+            # the caller to read and close like botocore's StreamingBody
+            with file:
+                start, stop = s3.byte_range(Range, size, 'GetObject')
+                file.seek(start)
+                body = io.BytesIO(file.read(stop - start))
+            return {'Body': body, 'ContentLength': stop - start, 'ContentType': _content_type(Key)}
+        return {'Body': file, 'ContentLength': size, 'ContentType': _content_type(Key)}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600, **kwargs):
+        url = f"{settings.BLOG_MEDIA_URL}{Params['Key']}"
+        if ClientMethod != 'put_object':
+            return url
+        token = self._sign(Params['Key'], Params.get('ContentType'), ExpiresIn)
+        return f"{url}?{urlencode({'upload': token})}"
+
+    def generate_presigned_post(self, Bucket, Key, Fields=None, Conditions=None, ExpiresIn=3600, **kwargs):
+        content_type = (Fields or {}).get('Content-Type')
+        return {
+            'url': f"{settings.BLOG_MEDIA_URL}{Key}",
+            'fields': {**(Fields or {}), 'key': Key, 'policy': self._sign(Key, content_type, ExpiresIn)},
+        }
+
+    def _sign(self, key, content_type, expires_in):
+        return signing.dumps({'key': key, 'type': content_type, 'exp': int(time.time()) + expires_in}, salt=PRESIGN_SALT)
+
+    def _multipart_dir(self, upload_id):
+        return self.root / '.multipart' / upload_id
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None, **kwargs):
+        upload_id = str(uuid4())
+        self._multipart_dir(upload_id).mkdir(parents=True)
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        etag = f'"{hashlib.md5(Body).hexdigest()}"'
+        (self._multipart_dir(UploadId) / str(int(PartNumber))).write_bytes(Body)
+        return {'ETag': etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        parts = self._multipart_dir(UploadId)
+
+        def write(file):
+            for part in MultipartUpload['Parts']:
+                with open(parts / str(int(part['PartNumber'])), 'rb') as source:
+                    shutil.copyfileobj(source, file, COPY_CHUNK_SIZE)
+        self._write(self.path(Bucket, Key), write)
+        shutil.rmtree(parts, ignore_errors=True)
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        shutil.rmtree(self._multipart_dir(UploadId), ignore_errors=True)
+        return {}
+
+
+def get_local_client():
+    client = s3.client
+    client = getattr(client, 'client', client)  # Unwrap InstrumentedClient
+    return client if isinstance(client, LocalFileS3) else None
+
+
+def _verify_upload(token, key, content_type):
+    try:
+        claims = signing.loads(token or '', salt=PRESIGN_SALT)
+    except signing.BadSignature:
+        return False
+    return claims['key'] == key and claims['type'] in (None, content_type) and claims['exp'] >= time.time()
+
+
+@csrf_exempt
+def serve_media(request, name):
+    """
+    Image objects of the local storage driver.
+
+    GET and HEAD serve the file; PUT and POST take uploads made with the
+    driver's presigned targets, as S3 would.
+    """
+    storage = get_local_client()
+    if storage is None:
+        raise Http404
+    bucket, key = settings.AWS_STORAGE_BUCKET_NAME, f"media/{name}"
+    try:
+        path = storage.path(bucket, key)
+    except ClientError:
+        raise Http404
+    if request.method in ('GET', 'HEAD'):
+        return _serve_file(request, path)
+    if request.method == 'PUT':
+        if not _verify_upload(request.GET.get('upload'), key, request.content_type):
+            return HttpResponse(status=403)
+        return _store_upload(storage, bucket, key, request)
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if upload is None or request.POST.get('key') != key:
+            return HttpResponse(status=400)
+        if not _verify_upload(request.POST.get('policy'), key, request.POST.get('Content-Type')):
+            return HttpResponse(status=403)
+        return _store_upload(storage, bucket, key, upload, status=204)
+    return HttpResponseNotAllowed(['GET', 'HEAD', 'PUT', 'POST'])
+
+
+def _serve_file(request, path):
+    try:
+        file = open(path, 'rb')
+    except (FileNotFoundError, IsADirectoryError):
+        raise Http404
+    stat = os.fstat(file.fileno())
+
+    # Answers If-None-Match / If-Modified-Since before the file is sent
+    @condition(etag_func=lambda request: _etag(stat), last_modified_func=lambda request: datetime.fromtimestamp(stat.st_mtime, timezone.utc))
+    def respond(request):
+        return FileResponse(file, content_type=_content_type(path.name))
+
+    response = respond(request)
+    if not isinstance(response, FileResponse):
+        file.close()
+    return response
+
+
+def _store_upload(storage, bucket, key, stream, status=200):
+    try:
+        stat = storage.put_stream(bucket, key, stream, settings.BLOG_UPLOAD_MAX_SIZE)
+    except ValueError:
+        return HttpResponse(status=413)
+    response = HttpResponse(status=status)
+    response['ETag'] = _etag(stat)
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
@@ -0,0 +1,103 @@
+import json
+import os
+import random
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from blog import benchmark
+from blog import s3
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database and time the blog API through the test client and a live server. "
+        "Exits non-zero on failed requests, query budgets exceeded or p95 regressions against --baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--blogs', type=int, default=1000)
+        parser.add_argument('--saves', type=int, default=10, help="Saved blogs per user.")
+        parser.add_argument('--requests', type=int, default=100, help="Requests per scenario (login is capped at 20).")
+        parser.add_argument('--concurrency', type=int, default=8, help="Concurrent clients against the live server.")
+        parser.add_argument('--scenarios', default=','.join(benchmark.SCENARIOS), help="Comma-separated scenario names.")
+        parser.add_argument('--mode', choices=['client', 'live', 'both'], default='both')
+        parser.add_argument(
+            '--conn-max-age', type=int,
+            help="Override CONN_MAX_AGE for the run, e.g. 0 to compare against a connection per request.",
+        )
+        parser.add_argument(
+            '--serialization', action='store_true',
+            help="Also report the CPU time of each feed serialization path per 1000 posts.",
+        )
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for the data set.")
+        parser.add_argument('--baseline', help="JSON results of an earlier run to compare p95 latency against.")
+        parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p95 slowdown over the baseline, as a fraction.")
+        parser.add_argument('--output', help="Write the results as JSON here, e.g. to use as the next baseline.")
+
+    def handle(self, *args, **options):
+        names = [name for name in options['scenarios'].split(',') if name]
+        unknown = set(names) - set(benchmark.SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        # Everything runs offline: objects go to an in-memory bucket, rows
+        # to a test database that is dropped afterwards.
+        real_client, s3.client = s3.client, s3.InMemoryS3()
+        if connection.vendor == 'sqlite' and not connection.settings_dict['TEST']['NAME']:
+            # Concurrent writes to a shared in-memory database fail with
+            # "table is locked" instead of waiting their turn.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.gettempdir(), 'blog_benchmark.sqlite3')
+        if options['conn_max_age'] is not None:
+            connection.settings_dict['CONN_MAX_AGE'] = options['conn_max_age']
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(f"Seeding {options['users']} users, {options['blogs']} blogs, {options['saves']} saves per user")
+            benchmark.seed(options['users'], options['blogs'], options['saves'], random.Random(options['seed']))
+            fixture = benchmark.build_fixture()
+            # All requests come from one address, so only the per-user login limit applies
+            with override_settings(BLOG_LOGIN_IP_ATTEMPTS=0):
+                results = self.run(names, fixture, options)
+            if options['serialization']:
+                serialization = benchmark.measure_serialization()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            s3.client = real_client
+
+        self.stdout.write(benchmark.format_report(results))
+        if options['serialization']:
+            self.stdout.write(benchmark.format_serialization_report(*serialization))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+        problems = benchmark.find_regressions(results, baseline, options['tolerance'])
+        if problems:
+            raise CommandError("Benchmark regressions:\n" + '\n'.join(problems))
+
+    def run(self, names, fixture, options):
+        results = {}
+        if options['mode'] in ('client', 'both'):
+            driver = benchmark.ClientDriver()
+            results['client'] = {
+                name: benchmark.run_scenario(driver, benchmark.SCENARIOS[name], fixture, options['requests'])
+                for name in names
+            }
+        if options['mode'] in ('live', 'both'):
+            driver = benchmark.LiveDriver(threads=options['concurrency'])
+            try:
+                results['live'] = {
+                    name: benchmark.run_scenario(driver, benchmark.SCENARIOS[name], fixture, options['requests'], options['concurrency'])
+                    for name in names
+                }
+            finally:
+                driver.close()
+        return results
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog.cleanup import collect_garbage
+
+
+class Command(BaseCommand):
+    help = "Delete image rows no blog uses and bucket objects no image owns, in batches of up to 1000 keys, and prune old blog tombstones and expired token revocations."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=settings.BLOG_ORPHAN_GRACE_PERIOD,
+            help="Leave images and objects younger than this many seconds alone.",
+        )
+        parser.add_argument('--skip-bucket-scan', action='store_true', help="Only collect orphaned image rows.")
+        parser.add_argument('--max-pages', type=int, default=None, help="Stop the bucket scan after this many listing pages; the next run resumes.")
+
+    def handle(self, *args, **options):
+        rows, keys, deleted, tombstones, revocations = collect_garbage(
+            grace=timedelta(seconds=options['grace']),
+            scan_bucket=not options['skip_bucket_scan'],
+            max_pages=options['max_pages'],
+        )
+        self.stdout.write(f"Collected {rows} image row(s), found {keys} orphaned key(s), deleted {deleted} object(s), pruned {tombstones} tombstone(s) and {revocations} revocation(s)")
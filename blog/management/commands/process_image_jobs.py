@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog.cleanup import collect_garbage, delete_pending_keys
+from blog.tasks import process_image_jobs
+
+
+class Command(BaseCommand):
+    help = "Upload queued blog images to S3, build their variants and delete removed images, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the due jobs once and exit.")
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--workers', type=int, default=1, help="Threads working on a batch in parallel.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--no-sweep', action='store_true', help="Don't collect orphaned images periodically.")
+
+    def handle(self, *args, **options):
+        next_sweep = time.monotonic() + settings.BLOG_ORPHAN_SWEEP_INTERVAL
+        while True:
+            processed = process_image_jobs(options['batch_size'], options['workers'])
+            if processed:
+                self.stdout.write(f"Processed {processed} image job(s)")
+                continue
+
+            # Queue is idle: remove deleted images from S3, and now and then
+            # look for orphans.
+            if not options['no_sweep'] and time.monotonic() >= next_sweep:
+                collect_garbage()
+                next_sweep = time.monotonic() + settings.BLOG_ORPHAN_SWEEP_INTERVAL
+            else:
+                delete_pending_keys()
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from blog.counters import reconcile_save_counts
+
+
+class Command(BaseCommand):
+    help = "Recount saves per blog and repair drifted save_count values. Meant to run periodically, e.g. from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fixed = reconcile_save_counts(options['batch_size'])
+        self.stdout.write(f"Repaired {fixed} blog(s)")
@@ -0,0 +1,265 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+# Per-request timings in Prometheus histograms, served by metrics_view.
+#
+# MetricsMiddleware times every request and records its response size. For a
+# sampled share of requests (BLOG_METRICS_SAMPLE_RATE) it also counts the
+# database queries and S3 calls made on its behalf, and logs the queries of
+# any sampled request slower than BLOG_SLOW_REQUEST_MS. The numbers live in
+# this process, so each worker process is its own scrape target.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+SLOW_LOG_QUERIES = 50  # most queries kept for a slow-request log line
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = {labels: list(values) for labels, values in self.series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = _labels(self.labels, label_values)
+            prefix = labels + ',' if labels else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {values[-1]}')
+            lines.append(f'{self.name}_sum{{{labels}}} {values[-2]}')
+            lines.append(f'{self.name}_count{{{labels}}} {values[-1]}')
+        return '\n'.join(lines)
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount, *label_values):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        with self.lock:
+            return self.values.get(label_values, 0)
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self.lock:
+            values = dict(self.values)
+        for label_values, value in sorted(values.items()):
+            lines.append(f'{self.name}{{{_labels(self.labels, label_values)}}} {value}')
+        return '\n'.join(lines)
+
+
+def _labels(names, values):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in zip(names, values))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_SECONDS = Histogram('blog_request_duration_seconds', 'Wall time per request.', ('view', 'method', 'status'), LATENCY_BUCKETS)
+RESPONSE_BYTES = Histogram('blog_response_size_bytes', 'Response body size.', ('view',), SIZE_BUCKETS)
+DB_QUERIES = Histogram('blog_request_db_queries', 'Database queries per sampled request.', ('view',), COUNT_BUCKETS)
+DB_SECONDS = Histogram('blog_request_db_seconds', 'Time in database queries per sampled request.', ('view',), LATENCY_BUCKETS)
+S3_CALLS = Histogram('blog_request_s3_calls', 'S3 calls per sampled request.', ('view',), COUNT_BUCKETS)
+S3_SECONDS = Histogram('blog_s3_call_duration_seconds', 'Latency of S3 calls.', ('operation',), LATENCY_BUCKETS)
+DB_CONNECTIONS = Counter('blog_db_connections_opened_total', 'Database connections opened, or taken from the pool with BLOG_DB_POOL.', ('alias',))
+METRICS = [REQUEST_SECONDS, RESPONSE_BYTES, DB_QUERIES, DB_SECONDS, S3_CALLS, S3_SECONDS, DB_CONNECTIONS]
+
+# Read from psycopg_pool's get_stats() at scrape time, for BLOG_DB_POOL.
+# Counters are left out of the stats until they are non-zero.
+POOL_GAUGES = [
+    ('pool_max', 'blog_db_pool_max_size', 'Most connections the pool may open.'),
+    ('pool_size', 'blog_db_pool_size', 'Connections in the pool, in use or idle.'),
+    ('pool_available', 'blog_db_pool_available', 'Idle connections in the pool.'),
+    ('requests_waiting', 'blog_db_pool_requests_waiting', 'Requests waiting for a connection right now.'),
+]
+POOL_COUNTERS = [
+    ('requests_num', 1, 'blog_db_pool_requests_total', 'Connections requested from the pool.'),
+    ('requests_queued', 1, 'blog_db_pool_requests_queued_total', 'Requests that had to wait for a connection.'),
+    ('requests_wait_ms', 0.001, 'blog_db_pool_wait_seconds_total', 'Time spent waiting for a connection.'),
+    ('requests_errors', 1, 'blog_db_pool_timeouts_total', 'Requests that timed out waiting for a connection.'),
+    ('connections_num', 1, 'blog_db_pool_connections_total', 'Connections the pool opened.'),
+]
+
+
+def pool_stats():
+    from django.db import connections
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            stats[alias] = pool.get_stats()
+    return stats
+
+
+def expose_pool_stats():
+    stats = pool_stats()
+    if not stats:
+        return ''
+    lines = []
+    for key, name, help in POOL_GAUGES:
+        lines += [f'# HELP {name} {help}', f'# TYPE {name} gauge']
+        lines += [f'{name}{{alias="{alias}"}} {values.get(key, 0)}' for alias, values in sorted(stats.items())]
+    for key, scale, name, help in POOL_COUNTERS:
+        lines += [f'# HELP {name} {help}', f'# TYPE {name} counter']
+        lines += [f'{name}{{alias="{alias}"}} {values.get(key, 0) * scale}' for alias, values in sorted(stats.items())]
+    return '\n'.join(lines)
+
+
+class RequestStats:
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.s3_calls = 0
+        self.s3_seconds = 0.0
+        self.queries = []
+
+
+# Stats of the sampled request being served. sync_to_async copies the
+# context into its thread, so queries run there are counted too.
+_current = contextvars.ContextVar('blog_request_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper installed on every database connection (see apps.py)."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        stats.db_queries += 1
+        stats.db_seconds += elapsed
+        if len(stats.queries) < SLOW_LOG_QUERIES:
+            stats.queries.append((elapsed, sql))
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    DB_CONNECTIONS.inc(1, connection.alias)
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def record_s3_call(operation, seconds):
+    S3_SECONDS.observe(seconds, operation)
+    stats = _current.get()
+    if stats is not None:
+        stats.s3_calls += 1
+        stats.s3_seconds += seconds
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+def _response_size(response):
+    if response.streaming:
+        return None
+    return len(response.content)
+
+
+def _start(request):
+    stats = None
+    if random.random() < settings.BLOG_METRICS_SAMPLE_RATE:
+        stats = RequestStats()
+    return stats, _current.set(stats), time.perf_counter()
+
+
+def _finish(request, response, stats, token, start):
+    elapsed = time.perf_counter() - start
+    _current.reset(token)
+    view = _view_name(request)
+    REQUEST_SECONDS.observe(elapsed, view, request.method, response.status_code)
+    size = _response_size(response)
+    if size is not None:
+        RESPONSE_BYTES.observe(size, view)
+    if stats is None:
+        return
+    DB_QUERIES.observe(stats.db_queries, view)
+    DB_SECONDS.observe(stats.db_seconds, view)
+    S3_CALLS.observe(stats.s3_calls, view)
+    if elapsed * 1000 >= settings.BLOG_SLOW_REQUEST_MS:
+        queries = '\n'.join(f"  {seconds * 1000:.1f}ms {sql}" for seconds, sql in stats.queries)
+        logger.warning(
+            f"Slow request {request.method} {request.path} ({view}) took {elapsed * 1000:.0f}ms: "
+            f"{stats.db_queries} queries in {stats.db_seconds * 1000:.0f}ms, "
+            f"{stats.s3_calls} S3 calls in {stats.s3_seconds * 1000:.0f}ms\n{queries}"
+        )
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.path == '/metrics':
+            return self.get_response(request)
+        stats, token, start = _start(request)
+        response = self.get_response(request)
+        _finish(request, response, stats, token, start)
+        return response
+
+    async def __acall__(self, request):
+        if request.path == '/metrics':
+            return await self.get_response(request)
+        stats, token, start = _start(request)
+        response = await self.get_response(request)
+        _finish(request, response, stats, token, start)
+        return response
+
+
+def metrics_view(request):
+    # Open unless BLOG_METRICS_TOKEN is set, then scrapers send it as a Bearer token
+    if settings.BLOG_METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {settings.BLOG_METRICS_TOKEN}':
+        return HttpResponse(status=403)
+    body = '\n'.join([metric.expose() for metric in METRICS] + [expose_pool_stats()]).rstrip('\n') + '\n'
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
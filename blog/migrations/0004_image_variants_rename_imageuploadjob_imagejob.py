@@ -0,0 +1,38 @@
+# Generated by Django 5.1.2 on 2026-10-17 18:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_image_uploaded_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='variants',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RenameModel(
+            old_name='ImageUploadJob',
+            new_name='ImageJob',
+        ),
+        migrations.AddField(
+            model_name='imagejob',
+            name='kind',
+            field=models.CharField(choices=[('upload', 'Upload'), ('variants', 'Variants')], default='upload', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='imagejob',
+            name='data',
+            field=models.BinaryField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='imagejob',
+            name='image',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='blog.image'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.2 on 2026-10-17 19:30
+
+from django.db import migrations
+
+FTS_TABLE = 'blog_blog_fts'
+PG_DOCUMENT = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(content, '')), 'B')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("ALTER TABLE blog_blog ADD COLUMN search_vector tsvector")
+        schema_editor.execute(f"UPDATE blog_blog SET search_vector = {PG_DOCUMENT}")
+        schema_editor.execute("CREATE INDEX blog_blog_search_vector_idx ON blog_blog USING GIN (search_vector)")
+    elif vendor == 'sqlite':
+        schema_editor.execute(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, content, tokenize='porter unicode61')")
+        schema_editor.execute(f"INSERT INTO {FTS_TABLE} (rowid, title, content) SELECT id, title, content FROM blog_blog")
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS blog_blog_search_vector_idx")
+        schema_editor.execute("ALTER TABLE blog_blog DROP COLUMN IF EXISTS search_vector")
+    elif vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_image_created_at_alter_image_public_id_pendingdeletion_sweepstate'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
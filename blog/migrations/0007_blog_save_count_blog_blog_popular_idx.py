@@ -0,0 +1,34 @@
+# Generated by Django 5.1.2 on 2026-10-17 18:54
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_saves(apps, schema_editor):
+    Blog = apps.get_model('blog', 'Blog')
+    SavedBlog = apps.get_model('blog', 'SavedBlog')
+    saves = SavedBlog.objects.filter(blog=OuterRef('pk')).order_by().values('blog').annotate(n=Count('pk')).values('n')
+    Blog.objects.update(save_count=Coalesce(Subquery(saves), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_blog_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='save_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_saves, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(fields=['-save_count', '-id'], name='blog_popular_idx'),
+        ),
+    ]
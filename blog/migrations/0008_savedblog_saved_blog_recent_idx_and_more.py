@@ -0,0 +1,44 @@
+# Generated by Django 5.1.2 on 2026-10-17 18:55
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_saves(apps, schema_editor):
+    # Keep the first save of each (user, blog) pair and recount the blogs involved
+    Blog = apps.get_model('blog', 'Blog')
+    SavedBlog = apps.get_model('blog', 'SavedBlog')
+    duplicates = (
+        SavedBlog.objects.values('saved_by', 'blog')
+        .annotate(first=Min('id'), n=Count('id'))
+        .filter(n__gt=1)
+        .order_by()
+    )
+    blog_ids = set()
+    for row in duplicates:
+        SavedBlog.objects.filter(saved_by=row['saved_by'], blog=row['blog']).exclude(id=row['first']).delete()
+        blog_ids.add(row['blog'])
+    saves = SavedBlog.objects.filter(blog=OuterRef('pk')).order_by().values('blog').annotate(n=Count('pk')).values('n')
+    Blog.objects.filter(pk__in=blog_ids).update(save_count=Coalesce(Subquery(saves), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_blog_save_count_blog_blog_popular_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_saves, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='savedblog',
+            index=models.Index(fields=['saved_by', '-saved_at', '-id'], name='saved_blog_recent_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='savedblog',
+            constraint=models.UniqueConstraint(fields=('saved_by', 'blog'), name='unique_saved_blog'),
+        ),
+    ]
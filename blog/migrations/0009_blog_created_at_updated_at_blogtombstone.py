@@ -0,0 +1,49 @@
+# Generated by Django 5.1.2 on 2026-10-17 21:40
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_timestamps(apps, schema_editor):
+    # Blogs get their image along with them, so its creation time is the best guess
+    Blog = apps.get_model('blog', 'Blog')
+    Image = apps.get_model('blog', 'Image')
+    created = Subquery(Image.objects.filter(pk=OuterRef('image_id')).values('created_at')[:1])
+    Blog.objects.update(created_at=created, updated_at=created)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_savedblog_saved_blog_recent_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_timestamps, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(fields=['updated_at', 'id'], name='blog_sync_idx'),
+        ),
+        migrations.CreateModel(
+            name='BlogTombstone',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('deleted_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['deleted_at', 'id'], name='blog_tombstone_sync_idx')],
+            },
+        ),
+    ]
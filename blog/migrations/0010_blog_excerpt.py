@@ -0,0 +1,40 @@
+# Generated by Django 5.1.2 on 2026-10-17 22:30
+
+from django.db import migrations, models
+
+
+def make_excerpt(content, length=160):
+    # Copy of blog.models.make_excerpt as of this migration
+    text = ' '.join((content or '').split())
+    if len(text) <= length:
+        return text
+    cut = text[:length].rsplit(' ', 1)[0] or text[:length]
+    return cut + '…'
+
+
+def fill_excerpts(apps, schema_editor):
+    Blog = apps.get_model('blog', 'Blog')
+    batch = []
+    for blog in Blog.objects.only('id', 'content').iterator(chunk_size=1000):
+        blog.excerpt = make_excerpt(blog.content)
+        batch.append(blog)
+        if len(batch) == 1000:
+            Blog.objects.bulk_update(batch, ['excerpt'])
+            batch = []
+    Blog.objects.bulk_update(batch, ['excerpt'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_blog_created_at_updated_at_blogtombstone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='excerpt',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
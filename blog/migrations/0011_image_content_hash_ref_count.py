@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-17 19:27
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_refs(apps, schema_editor):
+    Image = apps.get_model('blog', 'Image')
+    Blog = apps.get_model('blog', 'Blog')
+    blogs = Blog.objects.filter(image=OuterRef('pk')).order_by().values('image').annotate(count=Count('id')).values('count')
+    Image.objects.update(ref_count=Coalesce(Subquery(blogs), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_blog_excerpt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='ref_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_refs, migrations.RunPython.noop),
+    ]
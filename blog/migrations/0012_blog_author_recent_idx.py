@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-17 19:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_image_content_hash_ref_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='blog_author_recent_idx'),
+        ),
+    ]
@@ -1,17 +1,129 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+EXCERPT_LENGTH = 160
+
+
+def make_excerpt(content, length=EXCERPT_LENGTH):
+    # Whitespace collapsed and cut at a word boundary, for list views
+    text = ' '.join((content or '').split())
+    if len(text) <= length:
+        return text
+    cut = text[:length].rsplit(' ', 1)[0] or text[:length]
+    return cut + '…'
+
 class Image(models.Model):  # Inherit from models.Model
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
+
     url = models.URLField()
-    public_id = models.CharField(max_length=100)
+    public_id = models.CharField(max_length=100, db_index=True)  # File name under media/blog_images/
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=READY)  # Upload state of the bytes behind url
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="uploaded_images")  # Set for images uploaded ahead of a post
+    variants = models.JSONField(default=list, blank=True)  # Resized/re-encoded copies, see blog/images.py
+    # SHA-256 of the original, so identical uploads share one image. Unknown
+    # for presigned uploads and older rows, and cleared when an upload fails.
+    content_hash = models.CharField(max_length=64, null=True, blank=True, unique=True)
+    ref_count = models.PositiveIntegerField(default=0)  # Blogs using the image, see services.release_images
+    created_at = models.DateTimeField(auto_now_add=True)
 
 class Blog(models.Model):
     title = models.CharField(max_length=100)
     content = models.TextField(max_length=1000)
+    excerpt = models.CharField(max_length=200, blank=True)  # Start of content, kept current by save(); see make_excerpt
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     image = models.ForeignKey(Image, on_delete=models.CASCADE)
+    save_count = models.PositiveIntegerField(default=0)  # Denormalized count of SavedBlog rows, see blog/counters.py
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Also bumped when the image's status or variants change; not by saves
+
+    class Meta:
+        indexes = [
+            # Backs the popular feed's keyset ordering
+            models.Index(fields=['-save_count', '-id'], name='blog_popular_idx'),
+            # Backs /api/blogs/changes
+            models.Index(fields=['updated_at', 'id'], name='blog_sync_idx'),
+            # Backs /api/authors/<id>/blogs and the author's profile counts
+            models.Index(fields=['author', '-created_at', '-id'], name='blog_author_recent_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.excerpt = make_excerpt(self.content)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'excerpt'}
+        super().save(*args, **kwargs)
+
+class BlogTombstone(models.Model):
+    # Left behind by a deleted blog so syncing clients learn about the
+    # deletion (see blog/sync.py). Kept for BLOG_SYNC_RETENTION_DAYS.
+    id = models.BigIntegerField(primary_key=True)  # The deleted blog's id
+    deleted_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='blog_tombstone_sync_idx'),
+        ]
 
 class SavedBlog(models.Model):
     blog = models.ForeignKey(Blog, on_delete=models.CASCADE)  # Link to Blog instead of duplicating fields
     saved_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="saved_blogs")  # User who saved the blog
     saved_at = models.DateTimeField(auto_now_add=True)  # Optional: Timestamp for when the blog was saved
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['saved_by', 'blog'], name='unique_saved_blog'),
+        ]
+        indexes = [
+            # Backs the saved-blogs listing: one user's saves, newest first
+            models.Index(fields=['saved_by', '-saved_at', '-id'], name='saved_blog_recent_idx'),
+        ]
+
+class ImageJob(models.Model):
+    # Background work on an image, run by the image worker (see blog/tasks.py
+    # and the process_image_jobs command). An upload job pushes the decoded
+    # bytes to S3 and then becomes a variants job for the same image.
+    UPLOAD = 'upload'
+    VARIANTS = 'variants'
+    KIND_CHOICES = [
+        (UPLOAD, 'Upload'),
+        (VARIANTS, 'Variants'),
+    ]
+
+    image = models.ForeignKey(Image, on_delete=models.CASCADE, related_name="jobs")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=UPLOAD)
+    key = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    data = models.BinaryField(blank=True)  # Empty when the original is already in S3
+    attempts = models.PositiveIntegerField(default=0)
+    run_at = models.DateTimeField(db_index=True)  # Not picked up before this time; also the claim lease
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+class PendingDeletion(models.Model):
+    # Bucket key waiting to be removed by the image worker in a batched
+    # delete_objects call (see blog/cleanup.py). Rows are only removed once
+    # S3 confirms, so an interrupted run picks up where it left off.
+    key = models.CharField(max_length=255, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+class SweepState(models.Model):
+    # Resume point of a long-running sweep, e.g. the last bucket key checked
+    name = models.CharField(max_length=50, unique=True)
+    value = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class Revocation(models.Model):
+    # Rejects JWTs (see blog/authentication.py): a user's tokens issued up to
+    # revoked_at, or the one token with a jti. Kept in the database rather
+    # than a cache, which could evict it and let the tokens through again;
+    # pruned once expires_at has passed and no token it rejects is valid.
+    key = models.CharField(max_length=255, unique=True)  # user:<id> or jti:<jti>
+    revoked_at = models.BigIntegerField()  # Unix seconds, compared with the tokens' iat
+    expires_at = models.DateTimeField(db_index=True)
@@ -0,0 +1,100 @@
+import hashlib
+from calendar import timegm
+
+from django.conf import settings
+from django.http import Http404
+from django.shortcuts import get_object_or_404, render
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+
+from . import cache as feed_cache
+from .models import Blog
+from .pagination import BlogFeedPagination
+from .serializers import image_srcset, image_thumbnail
+
+# Server-rendered public pages: the feed at /blogs/ and a post at /blogs/<id>/.
+#
+# Posts are rendered into the fragment cache once per version (id and
+# updated_at), so a page is mostly cached fragments put together. Responses
+# carry an ETag, and a post also Last-Modified, for conditional GETs, plus
+# Cache-Control that lets browsers and a CDN keep them. The feed's ETag comes
+# from the feed cache generations (see cache.py), so revalidating it costs a
+# cache read and no query.
+
+TEMPLATE_VERSION = 1  # Part of ETags and fragment keys; bump when the templates change
+CARD_FIELDS = (
+    'id', 'title', 'excerpt', 'created_at', 'updated_at',
+    'author__username', 'image__url', 'image__variants',
+)
+
+
+def _conditional(request, etag, last_modified, build):
+    # 304 when the client's copy is current, else build() the page
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = build()
+    response.setdefault('ETag', etag)
+    if last_modified is not None:
+        response.setdefault('Last-Modified', http_date(last_modified))
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=settings.BLOG_PAGE_MAX_AGE,
+        s_maxage=settings.BLOG_PAGE_SHARED_MAX_AGE,
+        stale_while_revalidate=settings.BLOG_PAGE_STALE_WHILE_REVALIDATE,
+    )
+    return response
+
+
+@require_safe
+def blog_list(request):
+    version, head = feed_cache.get_generations()
+    if request.GET.get('cursor'):
+        head = 'cursor'  # As for feed pages, new posts only change the first page
+    etag = quote_etag(hashlib.md5(f'{TEMPLATE_VERSION}:{version}:{head}:{request.get_full_path()}'.encode()).hexdigest())
+
+    def build():
+        paginator = BlogFeedPagination()
+        try:
+            blogs = paginator.paginate_queryset(Blog.objects.select_related('author', 'image').only(*CARD_FIELDS), Request(request))
+        except NotFound:
+            raise Http404("Invalid cursor")
+        for blog in blogs:
+            blog.thumbnail = image_thumbnail(blog.image.url, blog.image.variants)
+        return render(request, 'blog/blog_list.html', {
+            'blogs': blogs,
+            'next': paginator.get_next_link(),
+            'template_version': TEMPLATE_VERSION,
+            'fragment_timeout': settings.BLOG_PAGE_FRAGMENT_TIMEOUT,
+        })
+
+    return _conditional(request, etag, None, build)
+
+
+@require_safe
+def blog_detail(request, id):
+    updated_at = Blog.objects.filter(pk=id).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        raise Http404("Blog post not found")
+    version = updated_at.timestamp()
+
+    def load():
+        blog = get_object_or_404(Blog.objects.select_related('author', 'image'), pk=id)
+        blog.srcset = image_srcset(blog.image.variants)
+        return blog
+
+    def build():
+        return render(request, 'blog/blog_detail.html', {
+            'blog': SimpleLazyObject(load),
+            'blog_id': id,
+            'version': version,
+            'template_version': TEMPLATE_VERSION,
+            'fragment_timeout': settings.BLOG_PAGE_FRAGMENT_TIMEOUT,
+        })
+
+    etag = quote_etag(f'{TEMPLATE_VERSION}-{id}-{version}')
+    return _conditional(request, etag, timegm(updated_at.utctimetuple()), build)
@@ -0,0 +1,172 @@
+import base64
+import datetime
+import json
+from operator import attrgetter
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # Keep full microsecond precision; DjangoJSONEncoder rounds datetimes to
+    # milliseconds, which would make the seek skip rows.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek ("keyset") pagination over a fixed ordering.
+
+    Each page is fetched with ``WHERE (ordering) < (last row) LIMIT n`` instead
+    of an OFFSET, so a page costs the same single indexed query no matter how
+    deep into the table the client is. The last ordering field should be unique
+    (usually ``id``) so that every row has a distinct position.
+    """
+    ordering = ('-id',)
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_results(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # For async views; the rows are fetched without blocking the event loop
+        return self.paginate_results([obj async for obj in self.get_page_queryset(queryset, request)])
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset)
+
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_seek_filter(position))
+        # Fetch one extra row to know whether there is a next page.
+        return queryset[:self.page_size + 1]
+
+    def paginate_results(self, results):
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+        self.next_position = self.get_position(results[-1]) if self.has_next else None
+        return results
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_first_link(self):
+        url = self.request.build_absolute_uri()
+        return remove_query_param(url, self.cursor_query_param)
+
+    def get_position(self, obj):
+        if isinstance(obj, dict):  # A .values() row
+            return [obj[field.lstrip('-')] for field in self.ordering]
+        return [attrgetter(field.lstrip('-').replace('__', '.'))(obj) for field in self.ordering]
+
+    def get_seek_filter(self, position):
+        # Expands the row comparison (a, b) < (x, y) into
+        # a < x OR (a = x AND b < y), which the database can satisfy
+        # with a range scan on an index over the ordering fields.
+        seek = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            seek |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return seek
+
+    def encode_cursor(self, position):
+        payload = json.dumps(position, cls=CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, queryset):
+        """The position in ``?cursor=``, typed like ``queryset``'s ordering fields; raises NotFound."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padding = '=' * (-len(encoded) % 4)
+            position = json.loads(base64.urlsafe_b64decode(encoded + padding))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # Clients can send anything; only values of the right types reach the filter
+        try:
+            position = [
+                self.get_ordering_field(queryset, field).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        # Cursors carry aware datetimes; a naive one didn't come from a next link
+        if any(value is None or (isinstance(value, datetime.datetime) and timezone.is_naive(value)) for value in position):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_ordering_field(self, queryset, field):
+        name = field.lstrip('-')
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+
+class BlogFeedPagination(KeysetPagination):
+    # Newest first. The primary key index backs this ordering.
+    ordering = ('-id',)
+
+
+class PopularFeedPagination(KeysetPagination):
+    # Most saved first. Save counts move while a client pages, so a post can
+    # show up twice or be skipped; that is fine for a trending list.
+    ordering = ('-save_count', '-id')
+
+
+class AuthorFeedPagination(KeysetPagination):
+    # Newest first, within one author's posts; blog_author_recent_idx backs it
+    ordering = ('-created_at', '-id')
+
+
+class BlogChangesPagination(KeysetPagination):
+    # Oldest change first, resumed from ?since=; see blog/sync.py
+    ordering = ('updated_at', 'id')
+    cursor_query_param = 'since'
+    page_size = 100
+    max_page_size = 500
+
+
+class SavedBlogPagination(KeysetPagination):
+    # Most recently saved first, within one user's saves
+    ordering = ('-saved_at', '-id')
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from rest_framework import serializers
+
+from .routers import PRIMARY
+
+# Author profile summaries for /api/authors/<id>/blogs: the public user fields
+# plus post_count and save_total. A summary is dropped when its author
+# creates, edits or deletes a post (see services.py); save totals also move
+# when other users save the author's posts, which only the timeout catches up
+# with, so BLOG_AUTHOR_PROFILE_TIMEOUT bounds how stale they get.
+PROFILE_KEY = 'blog:author:{}:profile'
+
+datetime = serializers.DateTimeField().to_representation
+
+
+def get_profile_cache():
+    return caches[settings.BLOG_AUTHOR_PROFILE_CACHE]
+
+
+def _summary(author_id):
+    # One aggregate over blog_author_recent_idx. Read from the primary, so a
+    # lagging replica can't get a summary from before the author's last write
+    # cached for the full timeout.
+    author = (
+        User.objects.using(PRIMARY)
+        .filter(pk=author_id)
+        .annotate(post_count=Count('blog'), save_total=Coalesce(Sum('blog__save_count'), 0))
+        # UserSerializer's fields, as in the feed's author objects
+        .values('id', 'username', 'email', 'date_joined', 'post_count', 'save_total')
+        .first()
+    )
+    if author is not None:
+        author['date_joined'] = datetime(author['date_joined'])
+    return author
+
+
+def get_author_profile(author_id):
+    """The author's cached summary, or None if there is no such user."""
+    cache = get_profile_cache()
+    key = PROFILE_KEY.format(author_id)
+    profile = cache.get(key)
+    if profile is None:
+        profile = _summary(author_id)
+        if profile is not None:
+            cache.set(key, profile, settings.BLOG_AUTHOR_PROFILE_TIMEOUT)
+    return profile
+
+
+def invalidate_author_profile(author_id):
+    get_profile_cache().delete(PROFILE_KEY.format(author_id))
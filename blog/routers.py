@@ -0,0 +1,205 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connections
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+# Read replicas (BLOG_DB_REPLICAS, see settings).
+#
+# ReplicaMiddleware lets the reads of a GET or HEAD request go to a replica;
+# the rest of the request's work, and anything run outside a request (the
+# image worker, commands), uses the primary. One replica serves all of a
+# request's reads, so a page never mixes two replicas' states. A successful
+# write pins its user to the primary for BLOG_DB_PIN_SECONDS. Replicas that
+# lag too far behind, or fail their check, are left out until they recover;
+# with none left, reads go to the primary.
+
+PRIMARY = 'default'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_KEY = 'blog:db:pin:{}'
+
+LAG_SQL = {
+    # Caught up when everything received is replayed; an idle primary sends
+    # nothing new, so the last replay time alone would look like lag
+    'postgresql': (
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    ),
+}
+
+
+def max_staleness():
+    """Seconds a replica read may be behind the primary; 0 without replicas."""
+    if not settings.BLOG_DB_REPLICAS:
+        return 0
+    return settings.BLOG_DB_REPLICA_MAX_LAG + settings.BLOG_DB_REPLICA_CHECK_INTERVAL
+
+
+def get_pin_cache():
+    return caches[settings.BLOG_DB_PIN_CACHE]
+
+
+def replica_lag(alias):
+    """Seconds the replica is behind; raises DatabaseError if it can't be reached."""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        # Other databases have no replication to measure; the query still checks the connection
+        cursor.execute(LAG_SQL.get(connection.vendor, 'SELECT 0'))
+        return float(cursor.fetchone()[0] or 0)
+
+
+class ReplicaHealth:
+    def __init__(self):
+        self.checks = {}  # alias -> (checked at, usable)
+        self.lock = threading.Lock()
+
+    def usable(self, alias):
+        checked = self.checks.get(alias)
+        if checked is None or time.monotonic() - checked[0] >= settings.BLOG_DB_REPLICA_CHECK_INTERVAL:
+            # One thread checks; the others go on with the last result, or
+            # the primary while there is none
+            if not self.lock.acquire(blocking=False):
+                return checked is not None and checked[1]
+            try:
+                checked = self.check(alias)
+            finally:
+                self.lock.release()
+        return checked[1]
+
+    def check(self, alias):
+        try:
+            lag = replica_lag(alias)
+            usable = lag <= settings.BLOG_DB_REPLICA_MAX_LAG
+            if not usable:
+                logger.warning(f"Replica {alias} is {lag:.1f}s behind; reading from the others")
+        except DatabaseError as e:
+            usable = False
+            logger.warning(f"Replica {alias} failed its check; reading from the others: {e}")
+        previous = self.checks.get(alias)
+        if usable and previous is not None and not previous[1]:
+            logger.info(f"Replica {alias} is back")
+        self.checks[alias] = checked = (time.monotonic(), usable)
+        return checked
+
+    def choose(self):
+        replicas = [alias for alias in settings.BLOG_DB_REPLICAS if self.usable(alias)]
+        return random.choice(replicas) if replicas else PRIMARY
+
+
+health = ReplicaHealth()
+
+
+def _pin_ids(request):
+    # Who the request acts for: the token's user, and the user the legacy
+    # /saved/<userID>/ style routes name in the path
+    ids = set()
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw = header and auth.get_raw_token(header)
+    if raw:
+        try:
+            ids.add(str(auth.get_validated_token(raw)[api_settings.USER_ID_CLAIM]))
+        except (InvalidToken, KeyError):
+            pass
+    match = getattr(request, 'resolver_match', None)
+    if match is not None and 'userID' in match.kwargs:
+        ids.add(str(match.kwargs['userID']))
+    return ids
+
+
+def pin(request):
+    ids = _pin_ids(request)
+    if ids:
+        get_pin_cache().set_many({PIN_KEY.format(id): True for id in ids}, settings.BLOG_DB_PIN_SECONDS)
+
+
+async def apin(request):
+    ids = _pin_ids(request)
+    if ids:
+        await get_pin_cache().aset_many({PIN_KEY.format(id): True for id in ids}, settings.BLOG_DB_PIN_SECONDS)
+
+
+def is_pinned(request):
+    ids = _pin_ids(request)
+    return bool(ids) and bool(get_pin_cache().get_many([PIN_KEY.format(id) for id in ids]))
+
+
+class ReadState:
+    # The database a safe request reads from, settled on its first read
+    def __init__(self, request):
+        self.request = request
+        self.alias = None
+
+    def read_alias(self):
+        if self.alias is None:
+            self.alias = PRIMARY if is_pinned(self.request) else health.choose()
+        return self.alias
+
+
+_read_state = contextvars.ContextVar('blog_db_read_state', default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _read_state.get()
+        if state is None or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return state.read_alias()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get the schema through replication
+        return db == PRIMARY
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.BLOG_DB_REPLICAS:
+            return self.get_response(request)
+        token = _read_state.set(ReadState(request) if request.method in SAFE_METHODS else None)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_state.reset(token)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            pin(request)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.BLOG_DB_REPLICAS:
+            return await self.get_response(request)
+        # sync_to_async copies the context, so the ORM's threads see this too
+        token = _read_state.set(ReadState(request) if request.method in SAFE_METHODS else None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_state.reset(token)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            await apin(request)
+        return response
@@ -0,0 +1,259 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .metrics import record_s3_call
+
+IMAGE_PREFIX = 'media/blog_images/'
+
+
+def image_key(filename):
+    return f"{IMAGE_PREFIX}{filename}"
+
+
+def image_url(filename):
+    return f"{settings.BLOG_MEDIA_URL}{image_key(filename)}"
+
+
+def byte_range(header, size, operation):
+    """
+    The ``(start, stop)`` slice a ``bytes=`` Range header asks of ``size`` bytes.
+
+    Takes ``a-b``, ``a-`` and the suffix form ``-n``; anything else, or a range
+    that starts past the end, raises S3's InvalidRange ClientError.
+    """
+    first, sep, last = header.removeprefix('bytes=').partition('-')
+    try:
+        if not sep or not (first or last):
+            raise ValueError
+        if not first:
+            start, stop = max(size - int(last), 0), size
+        else:
+            start, stop = int(first), min(int(last) + 1, size) if last else size
+    except ValueError:
+        start, stop = size, size
+    if start >= stop:
+        raise ClientError({'Error': {'Code': 'InvalidRange', 'Message': 'The requested range is not satisfiable'}}, operation)
+    return start, stop
+
+
+class InMemoryS3:
+    """
+    Dict-backed stand-in for the parts of the boto3 S3 client the blog uses.
+
+    Selected with ``BLOG_S3_CLIENT=memory`` so the API and the image worker can
+    run offline, or assigned to ``blog.s3.client`` directly in tests.
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.multipart_uploads = {}
+        self.lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, **kwargs):
+        with self.lock:
+            self.objects[(Bucket, Key)] = self._object(Body, ContentType)
+        return {}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        with self.lock:
+            self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        with self.lock:
+            for obj in Delete['Objects']:
+                self.objects.pop((Bucket, obj['Key']), None)
+        if Delete.get('Quiet'):
+            return {}
+        return {'Deleted': [{'Key': obj['Key']} for obj in Delete['Objects']]}
+
+    def list_objects_v2(self, Bucket, Prefix='', StartAfter='', MaxKeys=1000, **kwargs):
+        with self.lock:
+            keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix) and key > StartAfter)
+            contents = [
+                {'Key': key, 'Size': len(self.objects[(Bucket, key)]['Body']), 'LastModified': self.objects[(Bucket, key)]['LastModified']}
+                for key in keys[:MaxKeys]
+            ]
+        return {'Contents': contents, 'KeyCount': len(contents), 'IsTruncated': len(keys) > MaxKeys}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        obj = self._get(Bucket, Key, 'HeadObject')
+        return {'ContentLength': len(obj['Body']), 'ContentType': obj['ContentType']}
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        body = self._get(Bucket, Key, 'GetObject')['Body']
+        if Range:
+            start, stop = byte_range(Range, len(body), 'GetObject')
+            body = body[start:stop]
+        return {'Body': io.BytesIO(body), 'ContentLength': len(body)}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600, **kwargs):
+        return f"memory://{Params['Bucket']}/{Params['Key']}?method={ClientMethod}&expires={ExpiresIn}"
+
+    def generate_presigned_post(self, Bucket, Key, Fields=None, Conditions=None, ExpiresIn=3600, **kwargs):
+        return {'url': f"memory://{Bucket}", 'fields': {**(Fields or {}), 'key': Key}}
+
+    def _object(self, body, content_type):
+        return {'Body': bytes(body), 'ContentType': content_type, 'LastModified': datetime.now(timezone.utc)}
+
+    def _get(self, Bucket, Key, operation):
+        with self.lock:
+            obj = self.objects.get((Bucket, Key))
+        if obj is None:
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, operation)
+        return obj
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None, **kwargs):
+        upload_id = str(uuid4())
+        with self.lock:
+            self.multipart_uploads[upload_id] = {'Key': (Bucket, Key), 'ContentType': ContentType, 'Parts': {}}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        etag = f'"{hashlib.md5(Body).hexdigest()}"'
+        with self.lock:
+            self.multipart_uploads[UploadId]['Parts'][PartNumber] = (etag, bytes(Body))
+        return {'ETag': etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        with self.lock:
+            upload = self.multipart_uploads.pop(UploadId)
+            body = b''.join(upload['Parts'][part['PartNumber']][1] for part in MultipartUpload['Parts'])
+            self.objects[(Bucket, Key)] = self._object(body, upload['ContentType'])
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        with self.lock:
+            self.multipart_uploads.pop(UploadId, None)
+        return {}
+
+
+class InstrumentedClient:
+    """
+    Times every S3 request made through ``client`` for blog/metrics.py.
+
+    The underlying client is made by ``factory`` on first use rather than at
+    import, so processes that never touch S3 (migrations, most commands)
+    don't pay for building one.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self.factory()
+        return self._client
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        # Presigning is local signing work, not a request
+        if not callable(method) or name.startswith('generate_'):
+            return method
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                record_s3_call(name, time.perf_counter() - start)
+        return call
+
+
+def create_client():
+    return InstrumentedClient(_create_client)
+
+
+def _create_client():
+    if settings.BLOG_S3_CLIENT == 'memory':
+        return InMemoryS3()
+    if settings.BLOG_S3_CLIENT == 'local':
+        from .local_storage import LocalFileS3
+        return LocalFileS3(settings.BLOG_LOCAL_STORAGE_ROOT)
+    if settings.BLOG_S3_CLIENT != 'boto3':
+        return import_string(settings.BLOG_S3_CLIENT)()
+    # Own session: the default one isn't safe to create clients from concurrently
+    return boto3.session.Session().client(
+        's3',
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID or None,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY or None,
+        region_name=settings.AWS_S3_REGION_NAME or None,
+        config=Config(
+            signature_version=settings.AWS_S3_SIGNATURE_VERSION,
+            # Kept-alive connections, enough for the acall() threads and request threads
+            max_pool_connections=settings.BLOG_S3_MAX_POOL_CONNECTIONS,
+            tcp_keepalive=True,
+            connect_timeout=settings.BLOG_S3_CONNECT_TIMEOUT,
+            read_timeout=settings.BLOG_S3_READ_TIMEOUT,
+            retries={'mode': 'standard', 'max_attempts': settings.BLOG_S3_MAX_ATTEMPTS},
+        ),
+    )
+
+
+client = create_client()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.BLOG_S3_MAX_CONCURRENCY, thread_name_prefix='s3')
+    return _executor
+
+
+async def acall(method, **kwargs):
+    """
+    Call ``client.<method>(**kwargs)`` from async code.
+
+    boto3 is blocking, so the call runs on a pool of
+    BLOG_S3_MAX_CONCURRENCY threads; further calls queue for a thread while
+    the event loop carries on, instead of piling up threads and connections.
+    """
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context over, as asyncio.to_thread does
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, getattr(client, method), **kwargs)
+    return await loop.run_in_executor(_get_executor(), call)
+
+
+def call_many(method, calls):
+    """
+    Call ``client.<method>(**kwargs)`` for every kwargs in ``calls`` at once,
+    on the same BLOG_S3_MAX_CONCURRENCY threads as acall().
+
+    Returns the result of each call, or the exception it raised, in order.
+    """
+    executor = _get_executor()
+    futures = [
+        executor.submit(contextvars.copy_context().run, getattr(client, method), **kwargs)
+        for kwargs in calls
+    ]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append(e)
+    return results
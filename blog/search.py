@@ -0,0 +1,140 @@
+import logging
+import re
+
+from django.db import connection
+from django.utils.html import escape
+
+logger = logging.getLogger(__name__)
+
+# Full-text index over Blog title and content.
+#
+# On PostgreSQL a weighted tsvector column on blog_blog with a GIN index; on
+# SQLite an FTS5 table keyed by blog id. Both are created by migration 0006
+# and kept current by index_blog()/remove_blog(), which the write paths call.
+# Other databases fall back to an unindexed substring match.
+FTS_TABLE = 'blog_blog_fts'
+PG_CONFIG = 'english'
+PG_DOCUMENT = (
+    f"setweight(to_tsvector('{PG_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{PG_CONFIG}', coalesce(content, '')), 'B')"
+)
+
+# Highlight delimiters used inside SQL, swapped for <mark> after escaping
+START, STOP = '\x02', '\x03'
+
+
+def _vendor():
+    return connection.vendor
+
+
+def index_blog(blog):
+    index_blogs([blog])
+
+
+def index_blogs(blogs):
+    if not blogs:
+        return
+    with connection.cursor() as cursor:
+        if _vendor() == 'postgresql':
+            cursor.execute(
+                f"UPDATE blog_blog SET search_vector = {PG_DOCUMENT} WHERE id = ANY(%s)",
+                [[blog.pk for blog in blogs]],
+            )
+        elif _vendor() == 'sqlite':
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [[blog.pk] for blog in blogs])
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, content) VALUES (%s, %s, %s)",
+                [[blog.pk, blog.title or '', blog.content or ''] for blog in blogs],
+            )
+
+
+def remove_blog(blog_id):
+    # PostgreSQL keeps the vector on the row itself, so it goes with the row
+    if _vendor() == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [blog_id])
+
+
+def rebuild_index():
+    with connection.cursor() as cursor:
+        if _vendor() == 'postgresql':
+            cursor.execute(f"UPDATE blog_blog SET search_vector = {PG_DOCUMENT}")
+        elif _vendor() == 'sqlite':
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(f"INSERT INTO {FTS_TABLE} (rowid, title, content) SELECT id, title, content FROM blog_blog")
+
+
+def _highlight(text):
+    return escape(text or '').replace(START, '<mark>').replace(STOP, '</mark>')
+
+
+def _fts5_query(query):
+    # Quote every term so user input can't use FTS5 query syntax; terms are ANDed
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+def search(query, limit, offset):
+    """
+    Rank blogs matching ``query``.
+
+    Returns up to ``limit`` dicts with ``id``, ``rank`` (higher is better)
+    and HTML-escaped ``title``/``content`` highlights with ``<mark>`` around
+    the matched terms.
+    """
+    vendor = _vendor()
+    with connection.cursor() as cursor:
+        if vendor == 'postgresql':
+            # Rank and page first, then build headlines for the page rows only
+            cursor.execute(
+                f"""
+                SELECT hit.id, hit.rank,
+                       ts_headline(%s, b.title, hit.query, %s),
+                       ts_headline(%s, b.content, hit.query, %s)
+                FROM (
+                    SELECT blog_blog.id, ts_rank(search_vector, query) AS rank, query
+                    FROM blog_blog, websearch_to_tsquery(%s, %s) query
+                    WHERE search_vector @@ query
+                    ORDER BY rank DESC, blog_blog.id DESC
+                    LIMIT %s OFFSET %s
+                ) hit
+                JOIN blog_blog b ON b.id = hit.id
+                ORDER BY hit.rank DESC, hit.id DESC
+                """,
+                [
+                    PG_CONFIG, f'StartSel={START},StopSel={STOP},HighlightAll=TRUE',
+                    PG_CONFIG, f'StartSel={START},StopSel={STOP},MaxFragments=2,MaxWords=30,MinWords=10',
+                    PG_CONFIG, query, limit, offset,
+                ],
+            )
+            rows = cursor.fetchall()
+        elif vendor == 'sqlite':
+            match = _fts5_query(query)
+            if not match:
+                return []
+            # bm25() is lower-is-better; titles weigh 10x content
+            cursor.execute(
+                f"""
+                SELECT rowid, -bm25({FTS_TABLE}, 10.0, 1.0) AS rank,
+                       highlight({FTS_TABLE}, 0, %s, %s),
+                       snippet({FTS_TABLE}, 1, %s, %s, '…', 30)
+                FROM {FTS_TABLE}
+                WHERE {FTS_TABLE} MATCH %s
+                ORDER BY bm25({FTS_TABLE}, 10.0, 1.0), rowid DESC
+                LIMIT %s OFFSET %s
+                """,
+                [START, STOP, START, STOP, match, limit, offset],
+            )
+            rows = cursor.fetchall()
+        else:
+            from .models import Blog
+            rows = [
+                (pk, 0.0, title, content)
+                for pk, title, content in Blog.objects.filter(title__icontains=query)
+                .order_by('-id').values_list('id', 'title', 'content')[offset:offset + limit]
+            ]
+
+    return [
+        {'id': pk, 'rank': rank, 'title': _highlight(title), 'content': _highlight(content)}
+        for pk, rank, title, content in rows
+    ]
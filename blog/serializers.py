@@ -1,7 +1,12 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import is_revoked
 from .models import Blog, Image, SavedBlog
+from .services import decode_base64_image
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -26,16 +31,128 @@ class LoginSerializer(serializers.Serializer):
     password = serializers.CharField(required=True, write_only=True)
 
 class ImageSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = Image
-        fields = ('id', 'url', 'public_id')
+        fields = ('id', 'url', 'public_id', 'status', 'srcset')
+
+    def get_srcset(self, image):
+        return image_srcset(image.variants)
+
+def image_srcset(variants):
+    # {"webp": "<url> 320w, <url> 640w", ...}, ready for <source srcset>
+    candidates = {}
+    for variant in variants:
+        candidates.setdefault(variant['format'], []).append(f"{variant['url']} {variant['width']}w")
+    return {fmt: ', '.join(urls) for fmt, urls in candidates.items()}
+
+def image_thumbnail(url, variants):
+    # Narrowest variant in the first configured format that has any, else the original
+    for fmt in settings.BLOG_IMAGE_VARIANT_FORMATS:
+        widths = [variant for variant in variants if variant['format'] == fmt]
+        if widths:
+            return min(widths, key=lambda variant: variant['width'])['url']
+    return url
 
 class BlogSerializer(serializers.ModelSerializer):
     image = ImageSerializer()  # Nest the Image serializer here
     author = UserSerializer()
+    thumbnail = serializers.SerializerMethodField()
     class Meta:
         model = Blog
-        fields = ('id', 'title', 'content', 'image', 'author')
+        fields = ('id', 'title', 'content', 'excerpt', 'image', 'thumbnail', 'author', 'save_count', 'created_at', 'updated_at')
+
+    def get_thumbnail(self, blog):
+        return image_thumbnail(blog.image.url, blog.image.variants)
+
+class BlogValuesSerializer:
+    """
+    BlogSerializer's output for rows of ``Blog.objects.values()``, for list
+    responses.
+
+    Skips building and running a DRF field per attribute per post, and with
+    ``fields`` (e.g. from ``?fields=id,title,excerpt,thumbnail``) only the
+    columns those fields need are fetched.
+    """
+    # Field -> columns it reads
+    COLUMNS = {
+        'id': ('id',),
+        'title': ('title',),
+        'content': ('content',),
+        'excerpt': ('excerpt',),
+        'image': ('image__id', 'image__url', 'image__public_id', 'image__status', 'image__variants'),
+        'thumbnail': ('image__url', 'image__variants'),
+        'author': ('author__id', 'author__username', 'author__email', 'author__date_joined'),
+        'save_count': ('save_count',),
+        'created_at': ('created_at',),
+        'updated_at': ('updated_at',),
+    }
+    datetime = serializers.DateTimeField().to_representation
+
+    def __init__(self, fields=None):
+        fields = set(fields or BlogSerializer.Meta.fields)
+        self.fields = [field for field in BlogSerializer.Meta.fields if field in fields]
+
+    @classmethod
+    def from_query(cls, query_params):
+        """For ``?fields=a,b``, or every field without it; raises ValueError on unknown fields."""
+        fields = [field for field in query_params.get('fields', '').split(',') if field]
+        unknown = set(fields) - cls.COLUMNS.keys()
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        return cls(fields)
+
+    def values(self, queryset, *extra):
+        """``queryset.values()`` with the columns the fields need, plus ``extra`` ones (e.g. for ordering)."""
+        columns = [column for field in self.fields for column in self.COLUMNS[field]]
+        return queryset.values(*dict.fromkeys([*columns, *extra]))
+
+    def field(self, name, row):
+        if name == 'image':
+            return {
+                'id': row['image__id'],
+                'url': row['image__url'],
+                'public_id': row['image__public_id'],
+                'status': row['image__status'],
+                'srcset': image_srcset(row['image__variants']),
+            }
+        if name == 'thumbnail':
+            return image_thumbnail(row['image__url'], row['image__variants'])
+        if name == 'author':
+            return {
+                'id': row['author__id'],
+                'username': row['author__username'],
+                'email': row['author__email'],
+                'date_joined': self.datetime(row['author__date_joined']),
+            }
+        if name in ('created_at', 'updated_at'):
+            return self.datetime(row[name])
+        return row[name]
+
+    def to_representation(self, row):
+        return {name: self.field(name, row) for name in self.fields}
+
+    def many(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+class BatchPostSerializer(serializers.Serializer):
+    # One item of BatchBlogPost; like BlogPost, the image is inline or an imageID
+    title = serializers.CharField(max_length=100)
+    content = serializers.CharField(max_length=1000)
+    image = serializers.CharField(required=False)
+    imageID = serializers.IntegerField(required=False)
+
+    def validate_image(self, value):
+        try:
+            return decode_base64_image(value)  # (ext, bytes)
+        except ValueError:
+            raise serializers.ValidationError("Invalid image data")
+
+    def validate(self, attrs):
+        if ('image' in attrs) == ('imageID' in attrs):
+            raise serializers.ValidationError("Give either image or imageID")
+        return attrs
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
@@ -47,9 +164,23 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         
         return token
 
+class RevocationCheckedTokenRefreshSerializer(TokenRefreshSerializer):
+    # Access tokens are trusted without a user lookup (see authentication.py),
+    # so a refresh must not mint one for a revoked, inactive or deleted user
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        if (
+            user_id is None
+            or is_revoked(refresh, user_id)
+            or not User.objects.filter(pk=user_id, is_active=True).exists()
+        ):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        return super().validate(attrs)
+
 class SavedBlogSerializer(serializers.ModelSerializer):
     blog = BlogSerializer()
     saved_by = User()
     class Meta:
         model = SavedBlog
-        fields = ('id', 'blog', 'saved_by')
+        fields = ('id', 'blog', 'saved_by', 'saved_at')
@@ -0,0 +1,351 @@
+import base64
+import hashlib
+import logging
+from collections import Counter, defaultdict
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+
+from . import cache as feed_cache
+from . import events
+from . import profiles
+from . import s3
+from . import search
+from .cleanup import delete_images, enqueue_key_deletion
+from .counters import add_saves
+from .models import Blog, Image, ImageJob, SavedBlog, make_excerpt
+from .tasks import enqueue_image_upload, enqueue_image_variants, enqueue_variants_of_uploads
+
+logger = logging.getLogger(__name__)
+
+# Blog writes shared by the API views and the async views. Each function is
+# atomic on its own and can be combined inside a caller's transaction; feed
+# cache invalidation waits for the outermost commit.
+
+
+def decode_base64_image(image_base64):
+    """Split a ``data:image/<ext>;base64,...`` string into ``(ext, bytes)``; raises ValueError."""
+    try:
+        format, imgstr = image_base64.split(';base64,')
+        return format.split('/')[-1], base64.b64decode(imgstr)
+    except (AttributeError, TypeError):
+        raise ValueError("Invalid image data")
+
+
+def image_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def usable_images(user_id):
+    # Images a user may post with an imageID: their own uploads, and any
+    # image already in a post, which they could otherwise re-upload to get
+    return Image.objects.filter(Q(uploaded_by_id=user_id) | Q(ref_count__gt=0))
+
+
+def get_uploaded_image(image_id, user):
+    return usable_images(user.id).get(pk=image_id)
+
+
+def find_image(digest):
+    """
+    The image already holding the bytes with this digest, or None.
+
+    Locked until the caller's transaction ends, so it can't be released and
+    deleted before the caller's blog references it.
+    """
+    return Image.objects.select_for_update().filter(content_hash=digest).first()
+
+
+def queue_new_image(img_data, ext):
+    """
+    An image for these bytes: the one that already has them, else a new one
+    the image worker uploads (pending until then). Call it inside the
+    transaction that attaches the image to a blog.
+    """
+    digest = image_digest(img_data)
+    with transaction.atomic():
+        image = find_image(digest)
+        if image is not None:
+            return image
+        filename = f"{uuid4()}.{ext}"
+        try:
+            with transaction.atomic():
+                image = Image.objects.create(
+                    url=s3.image_url(filename),
+                    public_id=filename,
+                    status=Image.PENDING,
+                    content_hash=digest
+                )
+        except IntegrityError:
+            # Stored by a concurrent request just now
+            return find_image(digest)
+        enqueue_image_upload(image, img_data, f"image/{ext}")
+    return image
+
+
+def add_uploaded_image(filename, content_type='', uploaded_by_id=None, content_hash=None):
+    """
+    For bytes that are already in S3; only the variants are left to build.
+
+    If an image the uploader may use already has the same bytes, that one is
+    returned and the new object is queued for deletion.
+    """
+    with transaction.atomic():
+        if content_hash is not None:
+            image = find_image(content_hash)
+            if image is not None:
+                if image.ref_count or image.uploaded_by_id == uploaded_by_id:
+                    enqueue_key_deletion([s3.image_key(filename)])
+                    return image
+                # Someone else's unused upload; keep this copy separate
+                content_hash = None
+        try:
+            with transaction.atomic():
+                image = Image.objects.create(
+                    url=s3.image_url(filename),
+                    public_id=filename,
+                    status=Image.READY,
+                    uploaded_by_id=uploaded_by_id,
+                    content_hash=content_hash
+                )
+        except IntegrityError:
+            return add_uploaded_image(filename, content_type, uploaded_by_id, content_hash)
+        enqueue_image_variants(image, content_type)
+    return image
+
+
+def upload_images(uploads):
+    """
+    Put ``(img_data, ext)`` originals in S3 concurrently, ahead of their rows.
+
+    Returns per upload the image that already has its bytes, an unsaved READY
+    Image (shared by identical uploads), or the exception its upload raised.
+    Objects whose rows never get created are removed by the bucket sweep (see
+    cleanup.py).
+    """
+    digests = [image_digest(img_data) for img_data, _ in uploads]
+    images = Image.objects.filter(content_hash__in=digests).in_bulk(field_name='content_hash')
+    new = {}
+    for digest, (img_data, ext) in zip(digests, uploads):
+        if digest not in images and digest not in new:
+            new[digest] = (f"{uuid4()}.{ext}", img_data, ext)
+    results = s3.call_many('put_object', [
+        {
+            'Bucket': settings.AWS_STORAGE_BUCKET_NAME,
+            'Key': s3.image_key(filename),
+            'Body': img_data,
+            'ContentType': f"image/{ext}",
+        }
+        for filename, img_data, ext in new.values()
+    ])
+    for (digest, (filename, _, _)), result in zip(new.items(), results):
+        images[digest] = result if isinstance(result, Exception) else Image(
+            url=s3.image_url(filename), public_id=filename, status=Image.READY, content_hash=digest
+        )
+    return [images[digest] for digest in digests]
+
+
+def _store_uploaded_images(uploads):
+    # Saved images for the ``(image, content_type, data)`` uploads of
+    # upload_images(), by content hash, with their variants queued
+    uploads = {image.content_hash: (image, content_type, data) for image, content_type, data in uploads}
+    # Locked, as in find_image()
+    stored = Image.objects.select_for_update().filter(content_hash__in=uploads).in_bulk(field_name='content_hash')
+    new = []
+    for digest, (image, content_type, data) in uploads.items():
+        if digest in stored:
+            if image.pk is None:
+                # Stored by a concurrent request meanwhile; ours is surplus
+                enqueue_key_deletion([s3.image_key(image.public_id)])
+        elif image.pk is None:
+            new.append((image, content_type, data))
+        else:
+            # Released and deleted since upload_images() found it
+            stored[digest] = queue_new_image(data, content_type.split('/')[-1])
+    try:
+        with transaction.atomic():
+            Image.objects.bulk_create([image for image, _, _ in new])
+    except IntegrityError:
+        # A concurrent request stored some of the same bytes; go one by one
+        for image, content_type, data in new:
+            image.pk = None
+            stored[image.content_hash] = add_uploaded_image(image.public_id, content_type, content_hash=image.content_hash)
+        return stored
+    stored.update((image.content_hash, image) for image, _, _ in new)
+    enqueue_variants_of_uploads(new)
+    return stored
+
+
+def _add_refs(image_ids, sign=1):
+    # One relative update per distinct count, like counters.add_saves
+    by_count = defaultdict(list)
+    for image_id, count in Counter(image_ids).items():
+        by_count[count].append(image_id)
+    for count, ids in by_count.items():
+        images = Image.objects.filter(pk__in=ids)
+        if sign < 0:
+            images = images.filter(ref_count__gte=count)
+        images.update(ref_count=F('ref_count') + sign * count)
+
+
+def release_images(image_ids):
+    """Drop one blog's reference per id; images left without blogs are deleted."""
+    image_ids = list(image_ids)
+    with transaction.atomic():
+        # Locked, so find_image() can't hand out an image about to be deleted
+        images = list(Image.objects.select_for_update().filter(pk__in=image_ids))
+        _add_refs(image_ids, -1)
+        remaining = Counter(image_ids)
+        # The blogs are the source of truth; a count that drifted can't cascade into them
+        unused = Image.objects.filter(
+            pk__in=[image.pk for image in images if image.ref_count <= remaining[image.pk]], blog__isnull=True
+        )
+        delete_images(unused)
+
+
+def create_post(author_id, title, content, image):
+    with transaction.atomic():
+        post = Blog.objects.create(
+            title=title,
+            content=content,
+            image=image,
+            author_id=author_id
+        )
+        _add_refs([image.pk])
+        search.index_blog(post)
+    transaction.on_commit(feed_cache.invalidate_feed_head)
+    transaction.on_commit(lambda: profiles.invalidate_author_profile(author_id))
+    transaction.on_commit(lambda: events.publish([events.blog_event('create', post)]))
+    return post
+
+
+def create_posts(author_id, posts, uploads=()):
+    """
+    Create ``(title, content, image)`` posts with a few queries in total.
+
+    ``uploads`` are ``(image, content_type, data)`` for the images from
+    upload_images() that the posts use; rows are created here for the new
+    ones and their variants queued with the bytes.
+    """
+    with transaction.atomic():
+        stored = _store_uploaded_images(uploads)
+        blogs = Blog.objects.bulk_create([
+            # bulk_create skips Blog.save(), which fills in the excerpt
+            Blog(
+                title=title, content=content, excerpt=make_excerpt(content), author_id=author_id,
+                image=stored.get(image.content_hash, image),
+            )
+            for title, content, image in posts
+        ])
+        _add_refs([blog.image_id for blog in blogs])
+        search.index_blogs(blogs)
+    transaction.on_commit(feed_cache.invalidate_feed_head)
+    transaction.on_commit(lambda: profiles.invalidate_author_profile(author_id))
+    transaction.on_commit(lambda: events.publish([events.blog_event('create', blog) for blog in blogs]))
+    return blogs
+
+
+def update_post(post, title, content, image=None):
+    """Change a post's text and, if ``image`` is given, swap in that image and release the old one."""
+    with transaction.atomic():
+        old_image = None
+        if image is not None and image.pk != post.image_id:
+            old_image = post.image
+            post.image = image
+            _add_refs([image.pk])
+        post.title = title
+        post.content = content
+        # Not save_count, which concurrent saves update in the database
+        post.save(update_fields=['title', 'content', 'image', 'updated_at'])
+        search.index_blog(post)
+        if old_image is not None:
+            release_images([old_image.pk])
+    transaction.on_commit(feed_cache.invalidate_feed)
+    # Not counted in the summary, but edits are the author's writes too
+    transaction.on_commit(lambda: profiles.invalidate_author_profile(post.author_id))
+    transaction.on_commit(lambda: events.publish([events.blog_event('update', post)]))
+    return post
+
+
+def delete_post(post):
+    blog_id = post.pk
+    with transaction.atomic():
+        image = post.image
+        post.delete()
+        search.remove_blog(blog_id)
+        # Deleted if no other blog uses it; its S3 objects are removed in a batch by the image worker
+        release_images([image.pk])
+    transaction.on_commit(feed_cache.invalidate_feed)
+    transaction.on_commit(lambda: profiles.invalidate_author_profile(post.author_id))
+    transaction.on_commit(lambda: events.publish([events.blog_event('delete', post, blog_id)]))
+
+
+# Saves don't invalidate the feed cache; cached pages show save_count up to
+# BLOG_FEED_CACHE_TIMEOUT late (see cache.py)
+
+def save_blog(blog, user):
+    with transaction.atomic():
+        # Saving twice is a no-op that returns the existing save
+        saved, created = SavedBlog.objects.get_or_create(blog=blog, saved_by=user)
+        if created:
+            add_saves(blog.id, 1)
+    return saved, created
+
+
+def unsave_blog(saved):
+    with transaction.atomic():
+        saved.delete()
+        add_saves(saved.blog_id, -1)
+
+
+def save_blogs(user_id, blog_ids):
+    """
+    Save each existing blog of ``blog_ids`` for the user at once.
+
+    Returns ``{blog_id: (saved_id, created)}``; ids without a blog are left out.
+    """
+    blog_ids = set(Blog.objects.filter(pk__in=blog_ids).values_list('id', flat=True))
+    try:
+        with transaction.atomic():
+            saved = dict(SavedBlog.objects.filter(saved_by_id=user_id, blog_id__in=blog_ids).values_list('blog_id', 'id'))
+            new = SavedBlog.objects.bulk_create(
+                [SavedBlog(saved_by_id=user_id, blog_id=blog_id) for blog_id in blog_ids - saved.keys()]
+            )
+            # Every new save adds one, so a single relative update covers them all
+            Blog.objects.filter(pk__in=[save.blog_id for save in new]).update(save_count=F('save_count') + 1)
+    except IntegrityError:
+        # A concurrent save or delete got in first; fall back to one at a time
+        return _save_blogs_one_by_one(user_id, blog_ids)
+    results = {blog_id: (saved_id, False) for blog_id, saved_id in saved.items()}
+    results.update((save.blog_id, (save.id, True)) for save in new)
+    return results
+
+
+def _save_blogs_one_by_one(user_id, blog_ids):
+    results = {}
+    for blog_id in blog_ids:
+        try:
+            with transaction.atomic():
+                saved, created = SavedBlog.objects.get_or_create(blog_id=blog_id, saved_by_id=user_id)
+                if created:
+                    add_saves(blog_id, 1)
+        except IntegrityError:
+            continue  # The blog was deleted meanwhile
+        results[blog_id] = (saved.id, created)
+    return results
+
+
+def unsave_blogs(user_id, blog_ids):
+    """Remove the user's saves of ``blog_ids``; returns ``{blog_id: saved_id}`` of those removed."""
+    with transaction.atomic():
+        # Locked, so a concurrent unsave of the same rows can't take a count off twice
+        removed = dict(
+            SavedBlog.objects.select_for_update()
+            .filter(saved_by_id=user_id, blog_id__in=blog_ids)
+            .values_list('blog_id', 'id')
+        )
+        SavedBlog.objects.filter(pk__in=removed.values()).delete()
+        Blog.objects.filter(pk__in=removed.keys(), save_count__gte=1).update(save_count=F('save_count') - 1)
+    return removed
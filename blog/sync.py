@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Blog, BlogTombstone
+from .routers import max_staleness
+
+# Incremental sync behind /api/blogs/changes.
+#
+# A client keeps the cursor from its last response and asks for what changed
+# after it: blogs whose updated_at moved past it, and tombstones of deleted
+# blogs, each read in (time, id) order off its own index. A deleted blog's id
+# lives on in its tombstone only, so a position is unique across the two.
+#
+# Changes from the last BLOG_SYNC_SETTLE_SECONDS are held back until a later
+# poll, since a transaction that stamped an earlier time may not have
+# committed yet, or reached the replica the read came from. Tombstones are
+# pruned after BLOG_SYNC_RETENTION_DAYS; a cursor older than that could miss
+# deletions, so the client has to start over.
+
+
+class CursorExpired(Exception):
+    pass
+
+
+def retention():
+    return timedelta(days=settings.BLOG_SYNC_RETENTION_DAYS)
+
+
+def get_changes(paginator, request):
+    """
+    The page of changes after ``?since=``, as ``(blogs, deleted_ids, cursor)``.
+
+    ``cursor`` is what the client sends as ``since`` next time, whether or not
+    ``paginator.has_next`` says there is more to fetch right away.
+    """
+    settled = timezone.now() - timedelta(seconds=settings.BLOG_SYNC_SETTLE_SECONDS + max_staleness())
+    blogs = Blog.objects.select_related('author', 'image').filter(updated_at__lt=settled)
+    position = paginator.decode_cursor(request, blogs)
+    if position is not None and position[0] < timezone.now() - retention():
+        raise CursorExpired()
+
+    tombstones = BlogTombstone.objects.annotate(updated_at=F('deleted_at')).filter(updated_at__lt=settled)
+    rows = list(paginator.get_page_queryset(blogs, request)) + list(paginator.get_page_queryset(tombstones, request))
+    rows.sort(key=paginator.get_position)
+    rows = paginator.paginate_results(rows)
+
+    cursor = paginator.encode_cursor(paginator.get_position(rows[-1])) if rows else request.query_params.get('since')
+    return (
+        [row for row in rows if isinstance(row, Blog)],
+        [row.id for row in rows if isinstance(row, BlogTombstone)],
+        cursor,
+    )
+
+
+def touch_image_blogs(image_id):
+    # A blog's image status and variants are part of what clients sync
+    Blog.objects.filter(image_id=image_id).update(updated_at=timezone.now())
+
+
+def prune_tombstones():
+    return BlogTombstone.objects.filter(deleted_at__lt=timezone.now() - retention()).delete()[0]
+
+
+# Connected to Blog post_delete in apps.py, so cascades leave tombstones too
+
+def blog_deleted(sender, instance, **kwargs):
+    BlogTombstone.objects.bulk_create(
+        [BlogTombstone(id=instance.pk, deleted_at=timezone.now())],
+        update_conflicts=True,
+        unique_fields=['id'],
+        update_fields=['deleted_at'],
+    )
@@ -0,0 +1,175 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import cache as feed_cache
+from . import images
+from . import s3
+from .models import Image, ImageJob
+from .sync import touch_image_blogs
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_image_upload(image, data, content_type):
+    # A newer upload for the same image supersedes anything still queued,
+    # and the old variants no longer match the bytes.
+    ImageJob.objects.filter(image=image).delete()
+    Image.objects.filter(pk=image.pk).update(variants=[])
+    image.variants = []
+    return ImageJob.objects.create(
+        image=image,
+        kind=ImageJob.UPLOAD,
+        key=s3.image_key(image.public_id),
+        content_type=content_type,
+        data=data,
+        run_at=timezone.now(),
+    )
+
+
+def enqueue_image_variants(image, content_type=''):
+    # For originals that reached S3 without going through the queue
+    # (streamed or presigned uploads). The worker reads them back from S3.
+    if not images.variant_formats():
+        return None
+    return ImageJob.objects.create(
+        image=image,
+        kind=ImageJob.VARIANTS,
+        key=s3.image_key(image.public_id),
+        content_type=content_type,
+        run_at=timezone.now(),
+    )
+
+
+def enqueue_variants_of_uploads(uploads):
+    # For ``(image, content_type, data)`` originals just put in S3 with their
+    # bytes still at hand, which the worker then doesn't read back
+    if not images.variant_formats():
+        return []
+    now = timezone.now()
+    return ImageJob.objects.bulk_create([
+        ImageJob(
+            image=image,
+            kind=ImageJob.VARIANTS,
+            key=s3.image_key(image.public_id),
+            content_type=content_type,
+            data=data,
+            run_at=now,
+        )
+        for image, content_type, data in uploads
+    ])
+
+
+def claim_image_jobs(limit):
+    """
+    Lease up to ``limit`` due jobs to this worker.
+
+    Claimed jobs have ``run_at`` pushed past the lease, so other workers skip
+    them; if this worker dies the lease runs out and the job is retried.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            ImageJob.objects.select_for_update(skip_locked=True)
+            .filter(run_at__lte=now)
+            .order_by('run_at')[:limit]
+        )
+        lease = now + timedelta(seconds=settings.BLOG_IMAGE_JOB_LEASE)
+        ImageJob.objects.filter(pk__in=[job.pk for job in jobs]).update(run_at=lease)
+    return jobs
+
+
+def run_image_job(job):
+    try:
+        if job.kind == ImageJob.UPLOAD:
+            _upload_original(job)
+        else:
+            _store_variants(job)
+    except Exception as e:
+        _retry_or_fail(job, e)
+        return False
+    feed_cache.invalidate_feed()
+    return True
+
+
+def _upload_original(job):
+    s3.client.put_object(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=job.key,
+        Body=bytes(job.data),
+        ContentType=job.content_type,
+    )
+    with transaction.atomic():
+        # The job row is gone if a newer upload replaced it meanwhile; the
+        # image then stays pending until that one is done.
+        jobs = ImageJob.objects.filter(pk=job.pk)
+        if images.variant_formats():
+            # Keep the bytes so the variants step doesn't read them back from S3
+            current = jobs.update(kind=ImageJob.VARIANTS, attempts=0, run_at=timezone.now(), last_error='')
+        else:
+            current = jobs.delete()[0]
+        if current:
+            Image.objects.filter(pk=job.image_id).update(status=Image.READY)
+            touch_image_blogs(job.image_id)
+    logger.info(f"Uploaded {job.key} to S3")
+
+
+def _store_variants(job):
+    data = bytes(job.data)
+    if not data:
+        with s3.client.get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=job.key)['Body'] as body:
+            data = body.read()
+    variants = images.make_variants(job.image.public_id, data)
+    with transaction.atomic():
+        if ImageJob.objects.filter(pk=job.pk).delete()[0]:
+            Image.objects.filter(pk=job.image_id).update(variants=variants)
+            touch_image_blogs(job.image_id)
+    logger.info(f"Stored {len(variants)} variants of {job.key}")
+
+
+def _retry_or_fail(job, error):
+    attempts = job.attempts + 1
+    if attempts >= settings.BLOG_IMAGE_JOB_MAX_ATTEMPTS:
+        logger.error("Giving up on %s job for %s after %d attempts: %s", job.kind, job.key, attempts, error)
+        with transaction.atomic():
+            if ImageJob.objects.filter(pk=job.pk).delete()[0] and job.kind == ImageJob.UPLOAD:
+                # Without its hash, the next upload of the same bytes gets a fresh image
+                Image.objects.filter(pk=job.image_id).update(status=Image.FAILED, content_hash=None)
+                touch_image_blogs(job.image_id)
+        # Without variants the image is still served from its original
+        feed_cache.invalidate_feed()
+        return
+
+    delay = settings.BLOG_IMAGE_JOB_RETRY_DELAY * 2 ** job.attempts
+    logger.warning("%s job for %s failed (attempt %d), retrying in %ss: %s", job.kind, job.key, attempts, delay, error)
+    ImageJob.objects.filter(pk=job.pk).update(
+        attempts=attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        last_error=str(error),
+    )
+
+
+def _run_in_thread(job):
+    try:
+        return run_image_job(job)
+    finally:
+        # Each pool thread has its own database connection
+        connection.close()
+
+
+def process_image_jobs(limit=10, workers=1):
+    """Run one batch of due jobs and return how many were picked up."""
+    jobs = claim_image_jobs(limit)
+    if workers > 1 and len(jobs) > 1:
+        # Resizing and encoding happen in Pillow with the GIL released, so
+        # threads spread the work across cores.
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_run_in_thread, jobs))
+    else:
+        for job in jobs:
+            run_image_job(job)
+    return len(jobs)
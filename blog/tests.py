@@ -1,3 +1,905 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connections
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import authentication
+from . import cleanup
+from . import events
+from . import local_storage
+from . import routers
+from . import s3
+from . import sync
+from .models import Blog, BlogTombstone, Image, ImageJob, PendingDeletion, Revocation, SavedBlog, SweepState
+from .pagination import BlogChangesPagination
+from .tasks import claim_image_jobs, enqueue_image_upload, process_image_jobs, run_image_job
+
+
+def cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+
+def png(color, size=(1, 1)):
+    buffer = io.BytesIO()
+    PILImage.new('RGB', size, color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def data_url(data):
+    return f"data:image/png;base64,{base64.b64encode(data).decode()}"
+
+
+RED = png('red')
+BLUE = png('blue')
+
+
+# Variants off unless a test turns them on; their encoding isn't what most tests are about
+@override_settings(BLOG_IMAGE_VARIANT_FORMATS=[])
+class BlogTestCase(TestCase):
+    """Runs against an InMemoryS3 bucket (``self.s3``), an empty cache and no revocations, with users ``alice`` and ``bob``."""
+
+    def setUp(self):
+        self.s3 = s3.InMemoryS3()
+        patcher = mock.patch.object(s3, 'client', self.s3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(authentication, '_revocations', authentication.RevocationList())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for cache in caches.all():
+            cache.clear()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client
+
+    def post_blog(self, user, data, title='title'):
+        response = self.client_for(user).post(
+            '/api/blogs/post',
+            {'title': title, 'content': 'content', 'image': data_url(data), 'userID': user.id},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        return Blog.objects.get(pk=response.json()['post_id'])
+
+    def create_blog(self, title='title', author=None):
+        image = Image.objects.create(url='url', public_id=f'{title}.png')
+        return Blog.objects.create(title=title, content='c', author=author or self.alice, image=image)
+
+    def feed(self, url='/api/blogs/', **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+
+class FeedPaginationTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            self.create_blog(f't{i}')
+
+    def test_pages_follow_on_without_gaps_or_duplicates(self):
+        newest_first = list(Blog.objects.order_by('-id').values_list('id', flat=True))
+        page = self.feed('/api/blogs/?page_size=2')
+        # Posts written between requests don't shift the pages that follow
+        self.create_blog('new')
+
+        seen = [blog['id'] for blog in page['results']]
+        while page['next']:
+            page = self.feed(page['next'])
+            seen += [blog['id'] for blog in page['results']]
+
+        self.assertEqual(seen, newest_first)
+
+    def test_malformed_or_tampered_cursor_is_404(self):
+        for value in ['%%%', base64.urlsafe_b64encode(b'not json').decode(), cursor({'id': 1}), cursor([1, 2])]:
+            with self.subTest(cursor=value):
+                self.assertEqual(self.client.get('/api/blogs/', {'cursor': value}).status_code, 404)
+
+    def test_cursor_values_that_dont_fit_the_ordering_are_404(self):
+        for url, param, position in [
+            ('/api/blogs/', 'cursor', ['x']),
+            ('/api/blogs/', 'cursor', [None]),
+            ('/api/blogs/popular', 'cursor', ['x', 1]),
+            (f'/api/authors/{self.alice.id}/blogs', 'cursor', ['x', 1]),
+            ('/api/blogs/changes', 'since', ['2026-01-01T00:00:00', 1]),  # Naive
+            ('/api/blogs/changes', 'since', ['2026-01-01T00:00:00Z', 'x']),
+        ]:
+            with self.subTest(url=url, position=position):
+                self.assertEqual(self.client.get(url, {param: cursor(position)}).status_code, 404)
+
+
+class FeedCacheTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.blog = self.create_blog('first')
+
+    def titles(self, page):
+        return [blog['title'] for blog in page['results']]
+
+    def edit(self, blog, title):
+        # Invalidation waits for the commit, which TestCase never makes
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(self.alice).put('/api/blogs/edit', {'id': blog.id, 'title': title, 'content': 'c'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_pages_are_served_from_the_cache(self):
+        self.feed()
+        Blog.objects.filter(pk=self.blog.pk).update(title='changed behind the cache')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles(self.feed()), ['first'])
+
+    def test_edit_invalidates_first_and_cursor_pages(self):
+        older = self.blog
+        self.create_blog('second')
+        first = self.feed('/api/blogs/?page_size=1')
+        second_url = first['next']
+        self.assertEqual(self.titles(self.feed(second_url)), ['first'])
+
+        self.edit(older, 'edited')
+
+        self.assertEqual(self.titles(self.feed(second_url)), ['edited'])
+        self.assertEqual(self.titles(self.feed('/api/blogs/?page_size=1')), ['second'])
+
+    def test_matching_if_none_match_gets_304(self):
+        etag = self.client.get('/api/blogs/')['ETag']
+
+        response = self.client.get('/api/blogs/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+        self.assertEqual(response['ETag'], etag)
+
+        self.edit(self.blog, 'edited')
+        response = self.client.get('/api/blogs/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(BLOG_IMAGE_JOB_MAX_ATTEMPTS=3, BLOG_IMAGE_JOB_RETRY_DELAY=2, BLOG_IMAGE_JOB_LEASE=300)
+class ImageJobTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.image = Image.objects.create(url='url', public_id='red.png', status=Image.PENDING)
+        self.job = enqueue_image_upload(self.image, RED, 'image/png')
+
+    def test_claimed_job_is_leased_until_it_runs_out(self):
+        self.assertEqual(claim_image_jobs(10), [self.job])
+        self.assertEqual(claim_image_jobs(10), [])
+        self.job.refresh_from_db()
+        self.assertGreater(self.job.run_at, timezone.now() + timedelta(seconds=290))
+
+        # A worker that died holding it: the job comes back once the lease is over
+        ImageJob.objects.update(run_at=timezone.now())
+        self.assertEqual(claim_image_jobs(10), [self.job])
+
+    def test_failing_upload_backs_off_then_marks_image_failed(self):
+        self.image.content_hash = 'hash'
+        self.image.save()
+        with mock.patch.object(self.s3, 'put_object', side_effect=OSError("S3 down")), self.assertLogs('blog.tasks', 'WARNING'):
+            for attempt, delay in [(1, 2), (2, 4)]:
+                before = timezone.now()
+                self.assertFalse(run_image_job(ImageJob.objects.get()))
+                job = ImageJob.objects.get()
+                self.assertEqual((job.attempts, job.last_error), (attempt, "S3 down"))
+                self.assertGreaterEqual(job.run_at, before + timedelta(seconds=delay))
+                self.assertLess(job.run_at, before + timedelta(seconds=delay + 1))
+
+            self.assertFalse(run_image_job(ImageJob.objects.get()))
+
+        self.assertFalse(ImageJob.objects.exists())
+        self.image.refresh_from_db()
+        # A failed image mustn't be handed out as a duplicate
+        self.assertEqual((self.image.status, self.image.content_hash), (Image.FAILED, None))
+
+    def test_posted_image_is_pending_until_the_worker_uploads_it(self):
+        ImageJob.objects.all().delete()
+        blog = self.post_blog(self.alice, BLUE)
+        self.assertEqual(blog.image.status, Image.PENDING)
+        self.assertEqual(self.s3.objects, {})
+
+        self.assertEqual(process_image_jobs(), 1)
+
+        blog.image.refresh_from_db()
+        self.assertEqual(blog.image.status, Image.READY)
+        self.assertFalse(ImageJob.objects.exists())
+        self.assertEqual(self.s3.objects[(settings.AWS_STORAGE_BUCKET_NAME, s3.image_key(blog.image.public_id))]['Body'], BLUE)
+
+
+class PresignedUploadTests(BlogTestCase):
+    def presign(self, data):
+        # Stands in for the client's direct upload to the bucket
+        response = self.client_for(self.alice).post('/api/blogs/images/presign', {'contentType': 'image/png'}, format='json')
+        upload = response.json()
+        self.key = upload['post']['fields']['key']
+        self.s3.put_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=self.key, Body=data, ContentType='image/png')
+        return upload['token']
+
+    def finalize(self, token, user=None):
+        return self.client_for(user or self.alice).post('/api/blogs/images/finalize', {'token': token}, format='json')
+
+    def assertRejected(self, response, status):
+        self.assertEqual(response.status_code, status)
+        self.assertNotIn((settings.AWS_STORAGE_BUCKET_NAME, self.key), self.s3.objects)
+        self.assertFalse(Image.objects.exists())
+
+    def test_object_whose_bytes_dont_match_the_type_is_deleted(self):
+        token = self.presign(b'GIF89a' + RED)
+        with self.assertLogs('blog.views', 'WARNING'):
+            self.assertRejected(self.finalize(token), 415)
+
+    def test_object_over_the_size_limit_is_deleted(self):
+        token = self.presign(RED)
+        with override_settings(BLOG_UPLOAD_MAX_SIZE=len(RED) - 1), self.assertLogs('blog.views', 'WARNING'):
+            self.assertRejected(self.finalize(token), 413)
+
+    def test_token_of_another_user_is_refused(self):
+        token = self.presign(RED)
+        with self.assertLogs('blog.views', 'WARNING'):
+            self.assertEqual(self.finalize(token, self.bob).status_code, 400)
+        self.assertIn((settings.AWS_STORAGE_BUCKET_NAME, self.key), self.s3.objects)
+
+    def test_finalizing_twice_returns_the_same_image(self):
+        token = self.presign(RED)
+
+        first = self.finalize(token)
+        second = self.finalize(token)
+
+        self.assertEqual((first.status_code, second.status_code), (201, 200))
+        self.assertEqual(first.json()['image']['id'], second.json()['image']['id'])
+        image = Image.objects.get()
+        self.assertEqual((image.status, image.uploaded_by_id), (Image.READY, self.alice.id))
+
+
+@override_settings(BLOG_IMAGE_VARIANT_FORMATS=['webp'], BLOG_IMAGE_VARIANT_WIDTHS=[2, 4, 8])
+class ImageVariantTests(BlogTestCase):
+    def test_variants_are_stored_and_served_as_srcset(self):
+        blog = self.post_blog(self.alice, png('red', (4, 4)))
+        process_image_jobs()  # Upload, which queues the variants
+        process_image_jobs()
+
+        image = Image.objects.get(pk=blog.image_id)
+        # 8 is wider than the original, so it's clamped to 4 rather than upscaled
+        self.assertEqual([(v['width'], v['height'], v['format']) for v in image.variants], [(2, 2, 'webp'), (4, 4, 'webp')])
+        for variant in image.variants:
+            body = self.s3.objects[(settings.AWS_STORAGE_BUCKET_NAME, s3.image_key(variant['file']))]['Body']
+            self.assertEqual(PILImage.open(io.BytesIO(body)).format, 'WEBP')
+
+        served = self.feed()['results'][0]
+        small, large = (variant['url'] for variant in image.variants)
+        self.assertEqual(served['image']['srcset'], {'webp': f"{small} 2w, {large} 4w"})
+        self.assertEqual(served['thumbnail'], small)
+
+
+class BucketCleanupTests(BlogTestCase):
+    def put(self, *names):
+        for name in names:
+            self.s3.put_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=s3.image_key(name), Body=b'x')
+
+    def stored(self):
+        return sorted(key[len(s3.IMAGE_PREFIX):] for _, key in self.s3.objects)
+
+    def test_pending_deletions_are_drained_in_batches(self):
+        names = ['a.png', 'b.png', 'c.png', 'd.png', 'e.png']
+        self.put(*names, 'kept.png')
+        cleanup.enqueue_key_deletion([s3.image_key(name) for name in names])
+
+        with mock.patch.object(self.s3, 'delete_objects', wraps=self.s3.delete_objects) as delete_objects:
+            self.assertEqual(cleanup.delete_pending_keys(batch_size=2), 5)
+
+        self.assertEqual([len(call.kwargs['Delete']['Objects']) for call in delete_objects.call_args_list], [2, 2, 1])
+        self.assertEqual(self.stored(), ['kept.png'])
+        self.assertFalse(PendingDeletion.objects.exists())
+
+    def test_keys_s3_failed_to_delete_stay_queued(self):
+        cleanup.enqueue_key_deletion([s3.image_key('a.png'), s3.image_key('b.png')])
+        errors = {'Errors': [{'Key': s3.image_key('b.png'), 'Message': 'Access Denied'}]}
+
+        with mock.patch.object(self.s3, 'delete_objects', return_value=errors), self.assertLogs('blog.cleanup', 'ERROR'):
+            self.assertEqual(cleanup.delete_pending_keys(), 1)
+
+        self.assertEqual(list(PendingDeletion.objects.values_list('key', flat=True)), [s3.image_key('b.png')])
+
+    def test_sweep_queues_orphans_and_resumes_where_it_stopped(self):
+        Image.objects.create(url='url', public_id='a.png')
+        self.put('a.png', 'b.png', 'c.png', 'd.png')
+        queued = lambda: sorted(PendingDeletion.objects.values_list('key', flat=True))
+
+        with mock.patch.object(cleanup, 'DELETE_BATCH_SIZE', 2):
+            # Stopped after one page: its position is kept for the next run
+            cleanup.sweep_bucket(timedelta(0), max_pages=1)
+            self.assertEqual(queued(), [s3.image_key('b.png')])
+            self.assertEqual(SweepState.objects.get(name=cleanup.BUCKET_SWEEP).value, s3.image_key('b.png'))
+
+            with mock.patch.object(self.s3, 'list_objects_v2', wraps=self.s3.list_objects_v2) as list_objects:
+                cleanup.sweep_bucket(timedelta(0), max_pages=1)
+
+        self.assertEqual(list_objects.call_args.kwargs['StartAfter'], s3.image_key('b.png'))
+        self.assertEqual(queued(), [s3.image_key(name) for name in ['b.png', 'c.png', 'd.png']])
+        # Finished, so the next sweep starts over
+        self.assertEqual(SweepState.objects.get(name=cleanup.BUCKET_SWEEP).value, '')
+
+
+class AsyncWriteTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.auth = {'Authorization': f'Bearer {RefreshToken.for_user(self.alice).access_token}'}
+
+    async def test_body_that_isnt_a_json_object_is_400(self):
+        for method, url in [('post', '/api/async/blogs/post'), ('put', '/api/async/blogs/edit')]:
+            for body in ['[]', '"x"', '{"title": ']:
+                with self.subTest(url=url, body=body):
+                    response = await getattr(AsyncClient(), method)(
+                        url, body, content_type='application/json', headers=self.auth)
+                    self.assertEqual(response.status_code, 400)
+        self.assertFalse(await Blog.objects.aexists())
+
+
+class TokenRevocationTests(BlogTestCase):
+    def saved(self, client, user):
+        return client.get(f'/api/blogs/saved/{user.id}/').status_code
+
+    def test_deactivated_users_tokens_are_rejected(self):
+        alice, bob = self.client_for(self.alice), self.client_for(self.bob)
+        self.assertEqual(self.saved(alice, self.alice), 200)
+
+        self.alice.is_active = False
+        self.alice.save()
+
+        self.assertEqual(self.saved(alice, self.alice), 401)
+        self.assertEqual(self.saved(bob, self.bob), 200)
+
+    def test_deactivated_user_cannot_refresh(self):
+        refresh = str(RefreshToken.for_user(self.alice))
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': refresh}).status_code, 200)
+
+        self.alice.is_active = False
+        self.alice.save()
+
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': refresh}).status_code, 401)
+
+    def test_revocation_outlives_the_access_token(self):
+        refresh = str(RefreshToken.for_user(self.alice))
+        self.alice.is_active = False
+        self.alice.save()
+        # A bulk update skips post_save; only the revocation stands in the way
+        User.objects.filter(pk=self.alice.pk).update(is_active=True)
+
+        # Past the access token's lifetime, within the refresh token's
+        later = timezone.now() + timedelta(hours=2)
+        with mock.patch('time.time', return_value=later.timestamp()), mock.patch('django.utils.timezone.now', return_value=later):
+            self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': refresh}).status_code, 401)
+
+    def test_deleted_users_tokens_are_rejected(self):
+        alice = self.client_for(self.alice)
+        user_id = self.alice.id
+        self.alice.delete()
+
+        self.assertEqual(alice.get(f'/api/blogs/saved/{user_id}/').status_code, 401)
+
+    def test_revocation_reaches_other_processes_and_survives_the_cache(self):
+        alice = self.client_for(self.alice)
+        self.alice.is_active = False
+        self.alice.save()
+
+        for cache in caches.all():
+            cache.clear()
+        # Another process, with its own copy of the list
+        with mock.patch.object(authentication, '_revocations', authentication.RevocationList()):
+            self.assertEqual(self.saved(alice, self.alice), 401)
+
+    def test_tokens_are_refused_while_the_list_cant_be_read(self):
+        alice = self.client_for(self.alice)
+        fresh = authentication.RevocationList()
+
+        with mock.patch.object(authentication, '_revocations', fresh), \
+                mock.patch.object(fresh, 'load', side_effect=DatabaseError("primary down")):
+            with self.assertRaises(DatabaseError):
+                self.saved(alice, self.alice)
+
+    def test_only_reactivation_lifts_a_revocation(self):
+        alice = self.client_for(self.alice)
+        self.alice.is_active = False
+        self.alice.save()
+        User.objects.filter(pk=self.alice.pk).update(is_active=True)
+
+        # A profile edit of the (already active) user doesn't count
+        self.alice.refresh_from_db()
+        self.alice.first_name = 'Alice'
+        self.alice.save()
+        self.assertEqual(self.saved(alice, self.alice), 401)
+
+        User.objects.filter(pk=self.alice.pk).update(is_active=False)
+        self.alice.refresh_from_db()
+        self.alice.is_active = True
+        self.alice.save()
+        self.assertEqual(self.saved(alice, self.alice), 200)
+
+    def test_expired_revocations_are_pruned(self):
+        authentication.revoke_user(self.alice.id)
+        Revocation.objects.create(key='jti:old', revoked_at=0, expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(authentication.prune_revocations(), 1)
+        self.assertEqual(list(Revocation.objects.values_list('key', flat=True)), [f'user:{self.alice.id}'])
+
+
+@override_settings(BLOG_LOGIN_IP_ATTEMPTS=0, BLOG_LOGIN_USER_FAILURES=3, BLOG_CLIENT_IP_HEADER='')
+class LoginThrottleTests(BlogTestCase):
+    def login(self, password, username='alice', url='/api/auth/login', **extra):
+        return self.client.post(url, {'username': username, 'password': password}, content_type='application/json', **extra)
+
+    def test_failures_lock_the_username_before_any_hashing(self):
+        for _ in range(3):
+            self.assertEqual(self.login('wrong').status_code, 401)
+
+        with mock.patch('blog.views.authenticate') as authenticate:
+            response = self.login('pw')
+            self.assertEqual(self.login('pw', url='/api/token/').status_code, 429)
+        authenticate.assert_not_called()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(self.login('pw', username='bob').status_code, 200)
+
+    def test_successful_login_clears_the_failures(self):
+        for password in ['wrong', 'wrong', 'pw', 'wrong', 'wrong']:
+            self.login(password)
+
+        self.assertEqual(self.login('pw').status_code, 200)
+
+    @override_settings(BLOG_LOGIN_IP_ATTEMPTS=2, BLOG_LOGIN_USER_FAILURES=0, BLOG_CLIENT_IP_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_attempts_are_limited_per_client_ip(self):
+        # The proxy appends the address it saw; anything before it is the client's say-so
+        for spoofed in ['1.1.1.1', '2.2.2.2']:
+            self.assertEqual(self.login('pw', HTTP_X_FORWARDED_FOR=f'{spoofed}, 10.0.0.1').status_code, 200)
+
+        self.assertEqual(self.login('pw', HTTP_X_FORWARDED_FOR='3.3.3.3, 10.0.0.1').status_code, 429)
+        self.assertEqual(self.login('pw', HTTP_X_FORWARDED_FOR='10.0.0.2').status_code, 200)
+
+
+@override_settings(BLOG_PBKDF2_ITERATIONS=1000, BLOG_SCRYPT_WORK_FACTOR=2**11)
+class PasswordHashUpgradeTests(BlogTestCase):
+    def login_with(self, password_hash):
+        User.objects.filter(pk=self.alice.pk).update(password=password_hash)
+        response = self.client.post('/api/auth/login', {'username': 'alice', 'password': 'pw'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.alice.refresh_from_db()
+        return self.alice.password
+
+    def test_login_rehashes_with_the_configured_hasher(self):
+        self.assertTrue(self.login_with(make_password('pw', hasher='pbkdf2_sha256')).startswith('scrypt$2048$'))
+
+    def test_login_rehashes_with_the_configured_cost(self):
+        with override_settings(BLOG_SCRYPT_WORK_FACTOR=2**10):
+            old = make_password('pw')
+        self.assertTrue(old.startswith('scrypt$1024$'))
+
+        self.assertTrue(self.login_with(old).startswith('scrypt$2048$'))
+
+
+@override_settings(BLOG_BATCH_MAX_ITEMS=4)
+class BatchEndpointTests(BlogTestCase):
+    def test_batches_over_the_item_limit_are_refused_whole(self):
+        client = self.client_for(self.alice)
+        blog = self.create_blog()
+        posts = [{'title': f't{i}', 'content': 'c', 'image': data_url(RED)} for i in range(5)]
+
+        self.assertEqual(client.post('/api/blogs/batch/post', {'posts': posts}, format='json').status_code, 400)
+        self.assertEqual(client.put('/api/blogs/batch/save', {'blogIDs': [blog.id] * 5}, format='json').status_code, 400)
+        self.assertEqual(client.post('/api/blogs/batch/unsave', {'blogIDs': []}, format='json').status_code, 400)
+        self.assertEqual((Blog.objects.count(), SavedBlog.objects.count()), (1, 0))
+
+    def test_batch_post_reports_each_item_and_creates_the_rest(self):
+        put_object = self.s3.put_object
+
+        def flaky_put_object(**kwargs):
+            if kwargs['Body'] == BLUE:
+                raise OSError("S3 down")
+            return put_object(**kwargs)
+
+        posts = [
+            {'title': 'ok', 'content': 'c', 'image': data_url(RED)},
+            {'content': 'no title', 'image': data_url(RED)},
+            {'title': 'not yours', 'content': 'c', 'imageID': self.create_blog(author=self.bob).image_id},
+            {'title': 'upload fails', 'content': 'c', 'image': data_url(BLUE)},
+        ]
+        with mock.patch.object(self.s3, 'put_object', side_effect=flaky_put_object), self.assertLogs('blog.views', 'ERROR'):
+            response = self.client_for(self.alice).post('/api/blogs/batch/post', {'posts': posts}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([result['status'] for result in body['results']], [201, 400, 404, 502])
+        self.assertEqual(body['created'], 1)
+        self.assertEqual(Blog.objects.get(pk=body['results'][0]['post_id']).title, 'ok')
+
+    def test_batch_save_and_unsave_report_missing_blogs(self):
+        client = self.client_for(self.alice)
+        blog = self.create_blog()
+
+        first = client.put('/api/blogs/batch/save', {'blogIDs': [blog.id, blog.id, 999]}, format='json').json()['results']
+        again = client.put('/api/blogs/batch/save', {'blogIDs': [blog.id]}, format='json').json()['results']
+        self.assertEqual([(r['blogID'], r['status'], r.get('created')) for r in first], [(blog.id, 200, True), (999, 404, None)])
+        self.assertEqual(again[0]['created'], False)
+        self.assertEqual(SavedBlog.objects.filter(saved_by=self.alice).count(), 1)
+
+        removed = client.post('/api/blogs/batch/unsave', {'blogIDs': [blog.id, 999]}, format='json').json()['results']
+        self.assertEqual([r['status'] for r in removed], [200, 404])
+        self.assertFalse(SavedBlog.objects.exists())
+
+
+@override_settings(BLOG_SYNC_SETTLE_SECONDS=0, BLOG_SYNC_RETENTION_DAYS=30)
+class BlogChangesTests(BlogTestCase):
+    def changes(self, since=None):
+        response = self.client.get('/api/blogs/changes', {'since': since} if since else {})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        return [blog['id'] for blog in body['upserted']], body['deleted'], body['since']
+
+    def test_edits_and_deletions_since_the_cursor(self):
+        kept, deleted = self.create_blog('kept'), self.create_blog('deleted')
+        upserted, _, since = self.changes()
+        self.assertEqual(upserted, [kept.id, deleted.id])
+
+        deleted_id = deleted.id
+        deleted.delete()
+        kept.title = 'edited'
+        kept.save()
+
+        self.assertEqual(self.changes(since)[:2], ([kept.id], [deleted_id]))
+
+    @override_settings(BLOG_SYNC_SETTLE_SECONDS=60)
+    def test_unsettled_changes_wait_for_a_later_poll(self):
+        self.create_blog()
+        self.assertEqual(self.changes()[:2], ([], []))
+
+    def test_tombstones_are_pruned_after_the_retention_period(self):
+        now = timezone.now()
+        BlogTombstone.objects.bulk_create([
+            BlogTombstone(id=1, deleted_at=now - timedelta(days=31)),
+            BlogTombstone(id=2, deleted_at=now - timedelta(days=29)),
+        ])
+
+        self.assertEqual(sync.prune_tombstones(), 1)
+        self.assertEqual(list(BlogTombstone.objects.values_list('id', flat=True)), [2])
+
+    def test_cursor_older_than_the_retention_period_is_gone(self):
+        paginator = BlogChangesPagination()
+        recent = paginator.encode_cursor([timezone.now() - timedelta(days=29), 1])
+        expired = paginator.encode_cursor([timezone.now() - timedelta(days=31), 1])
+
+        self.assertEqual(self.client.get('/api/blogs/changes', {'since': recent}).status_code, 200)
+        self.assertEqual(self.client.get('/api/blogs/changes', {'since': expired}).status_code, 410)
+
+
+@override_settings(BLOG_MEDIA_URL='/', BLOG_UPLOAD_MAX_SIZE=1024)
+class LocalStorageTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.storage = local_storage.LocalFileS3(root)
+        patcher = mock.patch.object(s3, 'client', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.bucket = settings.AWS_STORAGE_BUCKET_NAME
+        self.key = s3.image_key('red.png')
+
+    def stored(self, key=None, **kwargs):
+        with self.storage.get_object(Bucket=self.bucket, Key=key or self.key, **kwargs)['Body'] as body:
+            return body.read()
+
+    def test_keys_escaping_the_bucket_are_refused(self):
+        outside = self.storage.root / 'secret.png'
+        outside.write_bytes(RED)
+
+        for key in ['../secret.png', 'media/../../secret.png', f'media/blog_images/{local_storage.TEMP_PREFIX}upload']:
+            with self.subTest(key=key), self.assertRaises(ClientError):
+                self.storage.path(self.bucket, key)
+        self.assertEqual(self.client.get('/media/..%2F..%2Fsecret.png').status_code, 404)
+        self.assertEqual(self.client.put('/media/..%2F..%2Fsecret.png', RED, content_type='image/png').status_code, 404)
+        self.assertEqual(outside.read_bytes(), RED)
+
+    def test_files_are_served_with_conditional_get(self):
+        self.storage.put_object(Bucket=self.bucket, Key=self.key, Body=RED)
+
+        response = self.client.get('/media/blog_images/red.png')
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/png'))
+        self.assertEqual(b''.join(response.streaming_content), RED)
+        response.close()
+
+        for header, value in [('HTTP_IF_NONE_MATCH', response['ETag']), ('HTTP_IF_MODIFIED_SINCE', response['Last-Modified'])]:
+            with self.subTest(header=header):
+                self.assertEqual(self.client.get('/media/blog_images/red.png', **{header: value}).status_code, 304)
+        self.assertEqual(self.client.get('/media/blog_images/missing.png').status_code, 404)
+
+    def test_ranges_read_only_what_they_ask_for(self):
+        self.storage.put_object(Bucket=self.bucket, Key=self.key, Body=RED)
+
+        for header, expected in [
+            ('bytes=0-9', RED[:10]), ('bytes=10-', RED[10:]), ('bytes=-5', RED[-5:]),
+            ('bytes=0-100000', RED), ('bytes=-100000', RED),
+        ]:
+            with self.subTest(header=header):
+                self.assertEqual(self.stored(Range=header), expected)
+        for header in [f'bytes={len(RED)}-', 'bytes=9-3', 'bytes=-0', 'bytes=-', 'bytes=x-1', 'bytes=5']:
+            with self.subTest(header=header), self.assertRaises(ClientError) as caught:
+                self.stored(Range=header)
+            self.assertEqual(caught.exception.response['Error']['Code'], 'InvalidRange')
+
+    def test_signed_put_checks_token_type_and_size(self):
+        url = self.storage.generate_presigned_url('put_object', Params={'Bucket': self.bucket, 'Key': self.key, 'ContentType': 'image/png'})
+        other = self.storage.generate_presigned_url('put_object', Params={'Bucket': self.bucket, 'Key': s3.image_key('blue.png')})
+        expired = self.storage.generate_presigned_url('put_object', Params={'Bucket': self.bucket, 'Key': self.key}, ExpiresIn=-1)
+
+        self.assertEqual(self.client.put(url, RED, content_type='image/gif').status_code, 403)
+        self.assertEqual(self.client.put('/media/blog_images/red.png', RED, content_type='image/png').status_code, 403)
+        self.assertEqual(self.client.put(other.replace('blue.png', 'red.png'), RED, content_type='image/png').status_code, 403)
+        self.assertEqual(self.client.put(expired, RED, content_type='image/png').status_code, 403)
+
+        self.assertEqual(self.client.put(url, RED, content_type='image/png').status_code, 200)
+        self.assertEqual(self.stored(), RED)
+        # An oversized upload leaves the object as it was
+        self.assertEqual(self.client.put(url, b'x' * 1025, content_type='image/png').status_code, 413)
+        self.assertEqual(self.stored(), RED)
+
+    def test_signed_post_checks_policy_key_and_size(self):
+        post = self.storage.generate_presigned_post(self.bucket, self.key, Fields={'Content-Type': 'image/png'})
+
+        def upload(data, **fields):
+            return self.client.post(post['url'], {**post['fields'], **fields, 'file': SimpleUploadedFile('red.png', data)}).status_code
+
+        self.assertEqual(upload(RED, policy='forged'), 403)
+        self.assertEqual(upload(RED, key=s3.image_key('blue.png')), 400)
+        self.assertEqual(upload(b'x' * 1025), 413)
+        self.assertEqual(upload(RED), 204)
+        self.assertEqual(self.stored(), RED)
+
+
+class ImageDedupeTests(BlogTestCase):
+    def test_posting_the_same_bytes_twice_shares_one_image(self):
+        first = self.post_blog(self.alice, RED)
+        second = self.post_blog(self.bob, RED)
+
+        self.assertEqual(first.image_id, second.image_id)
+        self.assertEqual(Image.objects.get().ref_count, 2)
+        self.assertEqual(ImageJob.objects.count(), 1)
+
+    def test_batch_dedupes_against_stored_images_and_itself(self):
+        existing = self.post_blog(self.alice, RED)
+        posts = [{'title': f't{i}', 'content': 'c', 'image': data_url(data)} for i, data in enumerate([RED, BLUE, BLUE])]
+
+        response = self.client_for(self.alice).post('/api/blogs/batch/post', {'posts': posts}, format='json')
+
+        self.assertEqual(response.json()['created'], 3)
+        blogs = Blog.objects.exclude(pk=existing.pk).order_by('title')
+        self.assertEqual(blogs[0].image_id, existing.image_id)
+        self.assertEqual(blogs[1].image_id, blogs[2].image_id)
+        self.assertEqual(dict(Image.objects.values_list('pk', 'ref_count')), {existing.image_id: 2, blogs[1].image_id: 2})
+        # Only the new bytes went to S3, once; RED is still queued for the worker
+        self.assertEqual([key for _, key in self.s3.objects], [s3.image_key(blogs[1].image.public_id)])
+
+    def test_shared_image_is_deleted_with_its_last_post(self):
+        first = self.post_blog(self.alice, RED)
+        second = self.post_blog(self.alice, RED)
+        image = first.image
+        client = self.client_for(self.alice)
+
+        client.delete(f'/api/blogs/delete/{first.id}/')
+        self.assertEqual(Image.objects.get(pk=image.pk).ref_count, 1)
+        self.assertFalse(PendingDeletion.objects.exists())
+
+        client.delete(f'/api/blogs/delete/{second.id}/')
+        self.assertFalse(Image.objects.filter(pk=image.pk).exists())
+        self.assertTrue(PendingDeletion.objects.filter(key=s3.image_key(image.public_id)).exists())
+
+    def test_edit_with_unchanged_bytes_uploads_nothing(self):
+        blog = self.post_blog(self.alice, RED)
+        image_id = blog.image_id
+        ImageJob.objects.all().delete()
+
+        with mock.patch.object(self.s3, 'put_object', wraps=self.s3.put_object) as put_object:
+            response = self.client_for(self.alice).put(
+                '/api/blogs/edit', {'id': blog.id, 'title': 'new', 'content': 'c', 'image': data_url(RED)}, format='json'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        put_object.assert_not_called()
+        self.assertFalse(ImageJob.objects.exists())
+        blog.refresh_from_db()
+        self.assertEqual((blog.title, blog.image_id, blog.image.ref_count), ('new', image_id, 1))
+
+    def test_unused_upload_of_another_user_stays_private(self):
+        upload = lambda user: self.client_for(user).post('/api/blogs/images', RED, content_type='image/png').json()['image']
+        alices = upload(self.alice)
+        bobs = upload(self.bob)
+
+        # Bob's identical bytes don't hand him Alice's image
+        self.assertNotEqual(alices['id'], bobs['id'])
+        self.assertIsNone(Image.objects.get(pk=bobs['id']).content_hash)
+        response = self.client_for(self.bob).post(
+            '/api/blogs/post', {'title': 't', 'content': 'c', 'imageID': alices['id'], 'userID': self.bob.id}, format='json'
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(BLOG_DB_REPLICAS=['replica0'], BLOG_DB_REPLICA_MAX_LAG=2, BLOG_DB_REPLICA_CHECK_INTERVAL=3, BLOG_DB_PIN_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+    # Routing decisions only; replica_lag() stands in for asking the replica
+    def setUp(self):
+        for name, value in [('health', routers.ReplicaHealth()), ('replica_lag', mock.Mock(return_value=0))]:
+            patcher = mock.patch.object(routers, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        routers.get_pin_cache().clear()
+        self.router = routers.ReplicaRouter()
+
+    def token(self, user_id):
+        token = AccessToken()
+        token['user_id'] = user_id
+        return {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def request(self, method='get', status=200, **headers):
+        """The ``(read, write)`` databases a view sees, behind ReplicaMiddleware."""
+        databases = []
+
+        def view(request):
+            databases.append((self.router.db_for_read(Blog), self.router.db_for_write(Blog)))
+            return HttpResponse(status=status)
+
+        routers.ReplicaMiddleware(view)(getattr(RequestFactory(), method)('/api/blogs/', **headers))
+        return databases[0]
+
+    def test_safe_requests_read_from_a_replica(self):
+        self.assertEqual(self.request('get'), ('replica0', 'default'))
+        self.assertEqual(self.request('head'), ('replica0', 'default'))
+
+    def test_writes_and_transactions_stay_on_the_primary(self):
+        self.assertEqual(self.request('post'), ('default', 'default'))
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.request('get'), ('default', 'default'))
+        # Outside a request, e.g. the image worker
+        self.assertEqual(self.router.db_for_read(Blog), 'default')
+
+    def test_successful_write_pins_its_user_to_the_primary(self):
+        alice, bob = self.token(1), self.token(2)
+        self.request('post', status=400, **alice)
+        self.assertEqual(self.request(**alice)[0], 'replica0')
+
+        self.request('post', status=201, **alice)
+        self.assertEqual(self.request(**alice)[0], 'default')
+        self.assertEqual(self.request(**bob)[0], 'replica0')
+        self.assertEqual(self.request()[0], 'replica0')
+
+        later = time.time() + 11
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual(self.request(**alice)[0], 'replica0')
+
+    @override_settings(BLOG_DB_REPLICA_CHECK_INTERVAL=0)
+    def test_lagging_or_failing_replica_falls_back_to_the_primary(self):
+        routers.replica_lag.return_value = 30
+        with self.assertLogs('blog.routers', 'WARNING'):
+            self.assertEqual(self.request()[0], 'default')
+
+        routers.replica_lag.side_effect = DatabaseError("connection refused")
+        with self.assertLogs('blog.routers', 'WARNING'):
+            self.assertEqual(self.request()[0], 'default')
+
+        routers.replica_lag.side_effect = None
+        routers.replica_lag.return_value = 0
+        with self.assertLogs('blog.routers', 'INFO'):
+            self.assertEqual(self.request()[0], 'replica0')
+
+    def test_failed_check_is_kept_for_the_check_interval(self):
+        routers.replica_lag.side_effect = DatabaseError("timeout expired")
+        with self.assertLogs('blog.routers', 'WARNING'):
+            self.assertEqual(self.request()[0], 'default')
+        self.assertEqual(self.request()[0], 'default')
+        self.assertEqual(routers.replica_lag.call_count, 1)
+
+        routers.replica_lag.side_effect = None
+        later = time.monotonic() + settings.BLOG_DB_REPLICA_CHECK_INTERVAL
+        with mock.patch('time.monotonic', return_value=later), self.assertLogs('blog.routers', 'INFO'):
+            self.assertEqual(self.request()[0], 'replica0')
+        self.assertEqual(routers.replica_lag.call_count, 2)
+
+
+class EventPublishTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(events, '_broker', events.LocalBroker())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(events, 'hub')
+        self.hub = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def published(self):
+        """The ``(type, id)`` of each event delivered to the hub so far."""
+        delivered = []
+        for (frames,), _ in self.hub.deliver.call_args_list:
+            for frame in frames:
+                kind, data = frame.decode().split('\n')[:2]
+                delivered.append((kind.removeprefix('event: '), json.loads(data.removeprefix('data: '))['id']))
+        return delivered
+
+    def test_each_write_publishes_one_event_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            blog = self.post_blog(self.alice, RED)
+        self.hub.deliver.assert_not_called()
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.published(), [('create', blog.id)])
+
+        client = self.client_for(self.alice)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.put('/api/blogs/edit', {'id': blog.id, 'title': 'new', 'content': 'c', 'image': data_url(RED)}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            client.delete(f'/api/blogs/delete/{blog.id}/')
+
+        self.assertEqual(self.published(), [('create', blog.id), ('update', blog.id), ('delete', blog.id)])
+
+
+@override_settings(BLOG_EVENTS_BROKER='local', BLOG_EVENTS_BUFFER=2, BLOG_EVENTS_MAX_CONNECTIONS=1)
+class EventStreamTests(SimpleTestCase):
+    def setUp(self):
+        # A hub per test; an abandoned stream stays subscribed to its own
+        for name, value in [('hub', events.Hub()), ('_broker', events.LocalBroker())]:
+            patcher = mock.patch.object(events, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def open_stream(self):
+        response = await AsyncClient().get('/api/blogs/events')
+        self.assertEqual(response.status_code, 200)
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), events.PING)  # Subscribed from here on
+        return stream
+
+    def blog_event(self, kind, blog_id):
+        return {'type': kind, 'id': blog_id, 'author': 1, 'updated_at': '2026-01-01T00:00:00Z'}
+
+    async def test_published_events_reach_the_stream(self):
+        stream = await self.open_stream()
+        events.publish([self.blog_event('create', 1), self.blog_event('delete', 1)])
+
+        frames = (await anext(stream)).decode()
+        self.assertEqual(frames.count('event: '), 2)
+        self.assertIn('event: create\ndata: {"id": 1,', frames)
+
+    async def test_overflow_sends_reset_and_closes_the_stream(self):
+        stream = await self.open_stream()
+        events.publish([self.blog_event('create', blog_id) for blog_id in range(3)])
+
+        self.assertEqual(await anext(stream), events.RESET)
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+        self.assertEqual(events.hub.count(), 0)
+
+    async def test_connection_limit_answers_503(self):
+        await self.open_stream()
+
+        response = await AsyncClient().get('/api/blogs/events')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(settings.BLOG_EVENTS_HEARTBEAT))
+
+    def test_wsgi_answers_501(self):
+        self.assertEqual(self.client.get('/api/blogs/events').status_code, 501)
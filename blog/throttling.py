@@ -0,0 +1,79 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Login rate limits, checked before any password is hashed.
+#
+# Every attempt counts against the client's IP; failed attempts also count
+# against the username, whether or not it exists, which stops one account
+# being guessed at from many addresses. Counters are fixed windows in the
+# cache, so they are shared by all processes when the cache is.
+
+IP_KEY = 'blog:login:ip:{}:{}'
+USER_KEY = 'blog:login:user:{}:{}'
+
+
+def get_throttle_cache():
+    return caches[settings.BLOG_LOGIN_THROTTLE_CACHE]
+
+
+def client_ip(request):
+    if settings.BLOG_CLIENT_IP_HEADER:
+        # The last hop was added by our own proxy; earlier ones are client-supplied
+        forwarded = request.META.get(settings.BLOG_CLIENT_IP_HEADER, '')
+        hops = [hop.strip() for hop in forwarded.split(',') if hop.strip()]
+        if hops:
+            return hops[-1]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _window(window):
+    now = time.time()
+    return int(now // window), int(window - now % window) + 1
+
+
+def _user_key(username, window_index):
+    # Usernames can hold characters that cache backends reject in keys
+    return USER_KEY.format(hashlib.md5(str(username).encode()).hexdigest(), window_index)
+
+
+def _incr(cache, key, timeout):
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key)
+    except ValueError:  # expired between add and incr
+        cache.add(key, 1, timeout)
+        return 1
+
+
+def check_login(username, ip):
+    """
+    Count an attempt for ``ip`` and return the seconds the client must wait,
+    or 0 if the attempt may go ahead.
+    """
+    cache = get_throttle_cache()
+    limit = settings.BLOG_LOGIN_USER_FAILURES
+    if limit:
+        index, retry_after = _window(settings.BLOG_LOGIN_USER_WINDOW)
+        if (cache.get(_user_key(username, index)) or 0) >= limit:
+            return retry_after
+    limit = settings.BLOG_LOGIN_IP_ATTEMPTS
+    if limit:
+        index, retry_after = _window(settings.BLOG_LOGIN_IP_WINDOW)
+        if _incr(cache, IP_KEY.format(ip, index), settings.BLOG_LOGIN_IP_WINDOW) > limit:
+            return retry_after
+    return 0
+
+
+def login_failed(username):
+    if settings.BLOG_LOGIN_USER_FAILURES:
+        index, _ = _window(settings.BLOG_LOGIN_USER_WINDOW)
+        _incr(get_throttle_cache(), _user_key(username, index), settings.BLOG_LOGIN_USER_WINDOW)
+
+
+def login_succeeded(username):
+    if settings.BLOG_LOGIN_USER_FAILURES:
+        index, _ = _window(settings.BLOG_LOGIN_USER_WINDOW)
+        get_throttle_cache().delete(_user_key(username, index))
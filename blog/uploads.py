@@ -0,0 +1,262 @@
+import hashlib
+import logging
+from uuid import uuid4
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core import signing
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+from . import s3
+
+logger = logging.getLogger(__name__)
+
+# Accepted content types, their file extension and the leading bytes a file of
+# that type must start with. The declared type is checked against the actual
+# bytes before anything is sent to S3.
+IMAGE_TYPES = {
+    'image/jpeg': ('jpg', (b'\xff\xd8\xff',)),
+    'image/png': ('png', (b'\x89PNG\r\n\x1a\n',)),
+    'image/gif': ('gif', (b'GIF87a', b'GIF89a')),
+    'image/webp': ('webp', (b'RIFF',)),
+}
+SNIFF_LENGTH = 12
+
+
+class UploadRejected(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _matches_signature(content_type, head):
+    if content_type == 'image/webp':
+        return head[:4] == b'RIFF' and head[8:12] == b'WEBP'
+    return head.startswith(IMAGE_TYPES[content_type][1])
+
+
+class StreamingImageUpload:
+    """
+    Streams an image into S3 while it is still being received.
+
+    Incoming chunks are collected into parts of ``BLOG_UPLOAD_PART_SIZE`` and
+    sent as an S3 multipart upload, so at most one part is held in memory
+    however large the image is. Images that fit in a single part are sent with
+    one ``put_object`` instead. The size limit and the content type are
+    enforced as the bytes arrive.
+    """
+
+    def __init__(self, content_type):
+        content_type = (content_type or '').split(';')[0].strip().lower()
+        if content_type not in IMAGE_TYPES:
+            raise UploadRejected(f"Unsupported image type: {content_type or 'none'}", status=415)
+        self.content_type = content_type
+        self.filename = f"{uuid4()}.{IMAGE_TYPES[content_type][0]}"
+        self.key = s3.image_key(self.filename)
+        self.size = 0
+        self.hash = hashlib.sha256()  # Of everything written, for services.add_uploaded_image
+        self.buffer = bytearray()
+        self.checked = False
+        self.upload_id = None
+        self.parts = []
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > settings.BLOG_UPLOAD_MAX_SIZE:
+            self.abort()
+            raise UploadRejected(f"Image exceeds {settings.BLOG_UPLOAD_MAX_SIZE} bytes", status=413)
+        self.hash.update(chunk)
+        self.buffer += chunk
+        if not self.checked and len(self.buffer) >= SNIFF_LENGTH:
+            self._check_signature()
+        part_size = settings.BLOG_UPLOAD_PART_SIZE
+        while len(self.buffer) >= part_size:
+            self._upload_part(bytes(self.buffer[:part_size]))
+            del self.buffer[:part_size]
+
+    def finish(self):
+        if not self.checked:
+            self._check_signature()
+        if self.upload_id is None:
+            s3.client.put_object(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                Key=self.key,
+                Body=bytes(self.buffer),
+                ContentType=self.content_type,
+            )
+        else:
+            if self.buffer:
+                self._upload_part(bytes(self.buffer))
+            s3.client.complete_multipart_upload(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={'Parts': self.parts},
+            )
+        self.buffer = bytearray()
+        logger.info(f"Streamed {self.size} bytes to {self.key}")
+        return self.size
+
+    def abort(self):
+        self.buffer = bytearray()
+        if self.upload_id is None:
+            return
+        try:
+            s3.client.abort_multipart_upload(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                Key=self.key,
+                UploadId=self.upload_id,
+            )
+        except Exception as e:
+            logger.error("Failed to abort multipart upload of %s: %s", self.key, e)
+        self.upload_id = None
+
+    def _check_signature(self):
+        if not _matches_signature(self.content_type, bytes(self.buffer[:SNIFF_LENGTH])):
+            self.abort()
+            raise UploadRejected(f"File content is not {self.content_type}", status=415)
+        self.checked = True
+
+    def _upload_part(self, data):
+        if self.upload_id is None:
+            self.upload_id = s3.client.create_multipart_upload(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                Key=self.key,
+                ContentType=self.content_type,
+            )['UploadId']
+        part_number = len(self.parts) + 1
+        response = s3.client.upload_part(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+
+class StreamedImageFile(UploadedFile):
+    # What ends up in request.FILES: a record of the stored object, no content.
+    def __init__(self, upload):
+        super().__init__(None, upload.filename, upload.content_type, upload.size)
+        self.upload = upload
+
+
+class S3ImageUploadHandler(FileUploadHandler):
+    """Upload handler that streams the multipart ``image`` field into S3."""
+    field_name = 'image'
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        if field_name != self.field_name or getattr(self, 'upload', None) is not None:
+            raise SkipFile()
+        self.upload = StreamingImageUpload(self.content_type)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.upload.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        self.upload.finish()
+        return StreamedImageFile(self.upload)
+
+    def upload_interrupted(self):
+        upload = getattr(self, 'upload', None)
+        if upload is not None:
+            upload.abort()
+
+
+def stream_raw_image(stream, content_type, chunk_size=64 * 1024):
+    """Stream a raw request body (``Content-Type: image/...``) into S3."""
+    upload = StreamingImageUpload(content_type)
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        upload.write(chunk)
+    upload.finish()
+    return upload
+
+
+PRESIGN_SALT = 'blog.uploads.presign'
+
+
+def presign_image_upload(user, content_type):
+    """
+    Issue upload targets the client can send an image to directly.
+
+    The returned token names the key and type the server allowed; finalize
+    only accepts keys it issued to the same user.
+    """
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type not in IMAGE_TYPES:
+        raise UploadRejected(f"Unsupported image type: {content_type or 'none'}", status=415)
+    filename = f"{uuid4()}.{IMAGE_TYPES[content_type][0]}"
+    key = s3.image_key(filename)
+    expiry = settings.BLOG_PRESIGNED_UPLOAD_EXPIRY
+
+    post = s3.client.generate_presigned_post(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=key,
+        Fields={'Content-Type': content_type},
+        Conditions=[
+            {'Content-Type': content_type},
+            ['content-length-range', 1, settings.BLOG_UPLOAD_MAX_SIZE],
+        ],
+        ExpiresIn=expiry,
+    )
+    put_url = s3.client.generate_presigned_url(
+        'put_object',
+        Params={'Bucket': settings.AWS_STORAGE_BUCKET_NAME, 'Key': key, 'ContentType': content_type},
+        ExpiresIn=expiry,
+    )
+    token = signing.dumps({'file': filename, 'type': content_type, 'user': user.id}, salt=PRESIGN_SALT)
+    return {
+        'token': token,
+        'post': post,
+        'put': {'url': put_url, 'headers': {'Content-Type': content_type}},
+        'expires_in': expiry,
+    }
+
+
+def verify_presigned_upload(user, token):
+    """
+    Check the object a client uploaded with a presigned target.
+
+    Returns ``(filename, size)``. An object that breaks the limits is deleted
+    from the bucket before the upload is rejected.
+    """
+    try:
+        claims = signing.loads(token, salt=PRESIGN_SALT, max_age=settings.BLOG_PRESIGNED_UPLOAD_EXPIRY * 2)
+    except (signing.BadSignature, TypeError):
+        raise UploadRejected("Invalid or expired upload token")
+    if claims['user'] != user.id:
+        raise UploadRejected("Invalid or expired upload token")
+
+    filename, content_type = claims['file'], claims['type']
+    key = s3.image_key(filename)
+    try:
+        head = s3.client.head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            raise UploadRejected("Upload not found", status=404)
+        raise
+
+    size = head['ContentLength']
+    problem = None
+    if not 0 < size <= settings.BLOG_UPLOAD_MAX_SIZE:
+        problem = UploadRejected(f"Image exceeds {settings.BLOG_UPLOAD_MAX_SIZE} bytes", status=413)
+    else:
+        first_bytes = s3.client.get_object(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Key=key,
+            Range=f'bytes=0-{SNIFF_LENGTH - 1}',
+        )['Body'].read()
+        if not _matches_signature(content_type, first_bytes):
+            problem = UploadRejected(f"File content is not {content_type}", status=415)
+    if problem is not None:
+        s3.client.delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+        raise problem
+    return filename, size
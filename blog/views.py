@@ -2,29 +2,32 @@ from django.shortcuts import render
 from rest_framework import generics
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.views import APIView
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.permissions import AllowAny,IsAuthenticated
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
-from .serializers import RegisterSerializer, LoginSerializer, UserSerializer, BlogSerializer, CustomTokenObtainPairSerializer, SavedBlogSerializer
+from .serializers import RegisterSerializer, LoginSerializer, UserSerializer, BlogSerializer, CustomTokenObtainPairSerializer, SavedBlogSerializer, ImageSerializer, BatchPostSerializer, BlogValuesSerializer
 from .models import Blog, Image,SavedBlog
-import base64
-from uuid import uuid4
-import boto3
+from .pagination import AuthorFeedPagination, BlogChangesPagination, BlogFeedPagination, PopularFeedPagination, SavedBlogPagination
+from . import cache as feed_cache
+from . import profiles
+from . import s3
+from . import services
+from .tasks import enqueue_image_variants
+from . import search
+from . import sync
+from . import throttling
+from .uploads import S3ImageUploadHandler, UploadRejected, presign_image_upload, stream_raw_image, verify_presigned_upload
 from django.conf import settings
+from django.db import transaction
 import logging
 
 logger = logging.getLogger(__name__)
 # Create your views here.
 
-s3 = boto3.client(
-    's3',
-    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-    region_name=settings.AWS_S3_REGION_NAME
-)
-
-
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = (AllowAny,)
@@ -36,10 +39,17 @@ class LoginView(generics.GenericAPIView):
     def post(self, request, *args, **kwargs):
         username = request.data.get('username')
         password = request.data.get('password')
+
+        # Turn away abusive clients before spending CPU on hashing
+        retry_after = throttling.check_login(username, throttling.client_ip(request))
+        if retry_after:
+            return Response({'detail': 'Too many login attempts. Try again later.'}, status=429, headers={'Retry-After': str(retry_after)})
         
+        # Also rehashes the password if it was stored with an outdated hasher or cost
         user = authenticate(username=username, password=password)
         
         if user is not None:
+            throttling.login_succeeded(username)
             token_serializer = CustomTokenObtainPairSerializer()
             refresh = token_serializer.get_token(user)
             user_serializer = UserSerializer(user)  
@@ -49,70 +59,250 @@ class LoginView(generics.GenericAPIView):
                 'user': user_serializer.data                
             }, status=200)
         else:
+            throttling.login_failed(username)
             return Response({'detail': 'Invalid credentials'}, status=401)
 
+class ThrottledTokenObtainPairView(TokenObtainPairView):
+    # /api/token/ checks passwords too, so it shares LoginView's limits
+    def post(self, request, *args, **kwargs):
+        username = request.data.get('username')
+        retry_after = throttling.check_login(username, throttling.client_ip(request))
+        if retry_after:
+            return Response({'detail': 'Too many login attempts. Try again later.'}, status=429, headers={'Retry-After': str(retry_after)})
+        try:
+            response = super().post(request, *args, **kwargs)
+        except AuthenticationFailed:
+            throttling.login_failed(username)
+            raise
+        throttling.login_succeeded(username)
+        return response
+
 class BlogPost(APIView):
     permission_classes = (IsAuthenticated,)
 
     def post(self, request, *args, **kwargs):
         title = request.data.get('title')
         content = request.data.get('content')
-        image_base64 = request.data.get('image')
+        image_base64 = request.data.get('image')  # Legacy inline upload, prefer imageID
+        image_id = request.data.get('imageID')  # Returned by UploadImage
         user_id = request.data.get('userID')  # Follow Python convention for variable names
 
-        # Decode base64 image
+        if image_id is None:
+            # Decode base64 image
+            try:
+                ext, img_data = services.decode_base64_image(image_base64)
+            except ValueError:
+                return Response({"error": "Invalid image data"}, status=400)
+
+        # Posting as yourself needs no lookup; request.user comes from the token
+        if str(user_id) != str(request.user.id):
+            try:
+                user_id = User.objects.values_list('id', flat=True).get(id=user_id)
+            except (User.DoesNotExist, ValueError):
+                return Response({"error": "User not found"}, status=404)
+
+        if image_id is not None:
+            try:
+                blog_image = services.get_uploaded_image(image_id, request.user)
+            except (Image.DoesNotExist, ValueError):
+                return Response({"error": "Image not found."}, status=404)
+
+        with transaction.atomic():
+            if image_id is None:
+                blog_image = services.queue_new_image(img_data, ext)
+            new_post = services.create_post(user_id, title, content, blog_image)
+
+        return Response({"message": "Blog posted successfully!", "post_id": new_post.id, "image_status": blog_image.status}, status=201)
+
+class UploadImage(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        # Either multipart/form-data with an "image" file field, or the raw
+        # image bytes as the body with Content-Type: image/<type>. Both are
+        # streamed to S3 as they arrive instead of being read into memory.
         try:
-            format, imgstr = image_base64.split(';base64,')
-            ext = format.split('/')[-1]
-            img_data = base64.b64decode(imgstr)
-        except (ValueError, AttributeError):
-            return Response({"error": "Invalid image data"}, status=400)
-
-        # Generate a unique filename
-        filename = f"{uuid4()}.{ext}"
-
-        # Upload to S3
-        s3.put_object(
-            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
-            Key=f"media/blog_images/{filename}",
-            Body=img_data,
-            ContentType=f"image/{ext}",
-        )
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        # Allow some room for multipart headers and boundaries
+        if content_length > settings.BLOG_UPLOAD_MAX_SIZE + 64 * 1024:
+            return Response({"error": f"Image exceeds {settings.BLOG_UPLOAD_MAX_SIZE} bytes"}, status=413)
+
+        try:
+            if request.content_type.startswith('multipart/form-data'):
+                request.upload_handlers = [S3ImageUploadHandler(request)]
+                uploaded = request.FILES.get('image')
+                upload = uploaded.upload if uploaded is not None else None
+            elif request.stream is not None:
+                upload = stream_raw_image(request.stream, request.content_type)
+            else:
+                upload = None
+        except UploadRejected as e:
+            logger.warning("Image upload rejected: %s", e.message)
+            return Response({"error": e.message}, status=e.status)
 
-        # Construct the S3 image URL
-        image_url = f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/media/blog_images/{filename}"
+        if upload is None:
+            return Response({"error": "No image provided"}, status=400)
 
-        # Create the Image object
-        blog_image = Image.objects.create(
-            url=image_url,
-            public_id=filename
+        image = services.add_uploaded_image(
+            upload.filename, upload.content_type, uploaded_by_id=request.user.id, content_hash=upload.hash.hexdigest()
         )
+        return Response({"message": "Image uploaded successfully!", "image": ImageSerializer(image).data}, status=201)
 
-        # Get the User object for the specified user_id
+class GetBlogs(APIView):
+    permission_classes = (AllowAny,)
+    pagination_class = BlogFeedPagination
+    
+    def get(self, request, *args, **kwargs):
         try:
-            author = User.objects.get(id=user_id)
-        except User.DoesNotExist:
-            return Response({"error": "User not found"}, status=404)
-
-        # Create the Blog object
-        new_post = Blog.objects.create(
-            title=title,
-            content=content,
-            image=blog_image,
-            author=author
+            serializer = BlogValuesSerializer.from_query(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        cache_key, entry = feed_cache.get_feed_page(request)
+        if entry is None:
+            # Plain rows with author and image joined in: a single query per
+            # page and no model instances, however long the page is
+            blogs = serializer.values(Blog.objects.all(), 'id')
+            paginator = self.pagination_class()
+            page = paginator.paginate_queryset(blogs, request, view=self)
+            data = paginator.get_paginated_data(serializer.many(page))
+            entry = feed_cache.set_feed_page(cache_key, data)
+
+        return feed_cache.feed_page_response(request, entry)
+
+class GetBlogChanges(APIView):
+    permission_classes = (AllowAny,)
+    pagination_class = BlogChangesPagination
+
+    def get(self, request, *args, **kwargs):
+        # Without ?since= the first page of every blog; after that only what
+        # changed. Keep polling with the returned since, right away while
+        # has_more is true.
+        paginator = self.pagination_class()
+        try:
+            blogs, deleted, since = sync.get_changes(paginator, request)
+        except sync.CursorExpired:
+            return Response({"error": "Sync cursor expired. Sync again without since."}, status=410)
+
+        return Response({
+            "upserted": BlogSerializer(blogs, many=True).data,
+            "deleted": deleted,
+            "since": since,
+            "has_more": paginator.has_next,
+        })
+
+class PresignImageUpload(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        # The client uploads straight to S3 with one of the returned targets,
+        # then calls FinalizeImageUpload with the token to get an imageID.
+        try:
+            upload = presign_image_upload(request.user, request.data.get('contentType'))
+        except UploadRejected as e:
+            return Response({"error": e.message}, status=e.status)
+        return Response(upload, status=200)
+
+class FinalizeImageUpload(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        try:
+            filename, size = verify_presigned_upload(request.user, request.data.get('token'))
+        except UploadRejected as e:
+            logger.warning("Presigned upload rejected: %s", e.message)
+            return Response({"error": e.message}, status=e.status)
+
+        # Finalizing the same token twice returns the same image
+        image, created = Image.objects.get_or_create(
+            public_id=filename,
+            defaults={
+                'url': s3.image_url(filename),
+                'status': Image.READY,
+                'uploaded_by_id': request.user.id,
+            }
         )
+        if created:
+            enqueue_image_variants(image)
+        logger.info(f"Finalized presigned upload {filename} ({size} bytes)")
+        return Response({"message": "Image uploaded successfully!", "image": ImageSerializer(image).data}, status=201 if created else 200)
 
-        return Response({"message": "Blog posted successfully!", "post_id": new_post.id}, status=201)
+class SearchBlogs(APIView):
+    permission_classes = (AllowAny,)
+    page_size = 20
+    max_page_size = 50
 
-class GetBlogs(APIView):
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "Missing search query"}, status=400)
+        try:
+            page = max(1, int(request.query_params.get('page', 1)))
+            page_size = min(self.max_page_size, max(1, int(request.query_params.get('page_size', self.page_size))))
+        except ValueError:
+            return Response({"error": "Invalid page"}, status=400)
+
+        # One extra hit tells us whether there is a next page
+        hits = search.search(query, page_size + 1, (page - 1) * page_size)
+        has_next = len(hits) > page_size
+        hits = hits[:page_size]
+
+        blogs = Blog.objects.select_related('author', 'image').in_bulk([hit['id'] for hit in hits])
+        results = []
+        for hit in hits:
+            blog = blogs.get(hit['id'])
+            if blog is None:
+                continue
+            data = BlogSerializer(blog).data
+            data['rank'] = hit['rank']
+            data['highlight'] = {'title': hit['title'], 'content': hit['content']}
+            results.append(data)
+
+        next_link = None
+        if has_next:
+            next_link = replace_query_param(request.build_absolute_uri(), 'page', page + 1)
+        return Response({"next": next_link, "results": results})
+
+class GetPopularBlogs(APIView):
     permission_classes = (AllowAny,)
-    
+    pagination_class = PopularFeedPagination
+
     def get(self, request, *args, **kwargs):
-        blogs = Blog.objects.all()
-        serializer = BlogSerializer(blogs, many=True)
-       
-        
-        return Response(serializer.data)
+        try:
+            serializer = BlogValuesSerializer.from_query(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        # Walks blog_popular_idx, so a page costs the same however many blogs there are
+        blogs = serializer.values(Blog.objects.all(), 'save_count', 'id')
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(blogs, request, view=self)
+
+        return paginator.get_paginated_response(serializer.many(page))
+
+class GetAuthorBlogs(APIView):
+    permission_classes = (AllowAny,)
+    pagination_class = AuthorFeedPagination
+
+    def get(self, request, id, *args, **kwargs):
+        try:
+            serializer = BlogValuesSerializer.from_query(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        profile = profiles.get_author_profile(id)
+        if profile is None:
+            return Response({"error": "Author not found."}, status=404)
+
+        # One query per page on blog_author_recent_idx, with image and author joined in
+        blogs = serializer.values(Blog.objects.filter(author_id=id), 'created_at', 'id')
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(blogs, request, view=self)
+        data = paginator.get_paginated_data(serializer.many(page))
+
+        return Response({"author": profile, **data})
 
 class UpdatePost(APIView):
     permission_classes = (IsAuthenticated,)
@@ -120,53 +310,42 @@ class UpdatePost(APIView):
     def put(self, request, *args, **kwargs):
         title = request.data.get('title')
         content = request.data.get('content')
-        image_base64 = request.data.get('image')
+        image_base64 = request.data.get('image')  # Legacy inline upload, prefer imageID
+        image_id = request.data.get('imageID')  # Returned by UploadImage
         blog_id = request.data.get('id')
         logger.info(f"Updating blog post with ID: {blog_id}")
 
         try:
-            blog_post = Blog.objects.get(id=blog_id, author=request.user)
+            blog_post = Blog.objects.select_related('image').get(id=blog_id, author_id=request.user.id)
             blog_image = blog_post.image
         except Blog.DoesNotExist:
             return Response({"error": "Blog post not found or you do not have permission to edit it."}, status=404)
         except Image.DoesNotExist:
             return Response({"error": "Image not found."}, status=404)
 
-        blog_post.title = title
-        blog_post.content = content
-
-        if image_base64:
+        new_image = None
+        if image_id is not None:
+            try:
+                new_image = services.get_uploaded_image(image_id, request.user)
+            except (Image.DoesNotExist, ValueError):
+                return Response({"error": "Image not found."}, status=404)
+            blog_image = new_image
+        elif image_base64:
             try:
-                format, imgstr = image_base64.split(';base64,')
-                ext = format.split('/')[-1]
-                img_data = base64.b64decode(imgstr)
+                ext, img_data = services.decode_base64_image(image_base64)
                 logger.info("Image decoded successfully")
-            except (ValueError, AttributeError) as e:
+            except ValueError:
                 logger.error("Image decoding failed")
                 return Response({"error": "Invalid image data"}, status=400)
 
-            filename = blog_image.public_id
-            try:
-                s3.put_object(
-                    Bucket=settings.AWS_STORAGE_BUCKET_NAME,
-                    Key=f"media/blog_images/{filename}",
-                    Body=img_data,
-                    ContentType=f"image/{ext}",
-                )
-                logger.info("Image uploaded successfully to S3")
-            except Exception as e:
-                logger.error("S3 upload failed: %s", str(e))
-                return Response({"error": "Image upload failed"}, status=500)
-
-            image_url = f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/media/blog_images/{filename}"
-            blog_image.url = image_url
-            blog_image.save()
-            logger.info(f"Image URL updated in database: {image_url}")
-
-        blog_post.save()
+        with transaction.atomic():
+            if new_image is None and image_base64:
+                # Unchanged bytes find the post's own image, and nothing is uploaded
+                new_image = blog_image = services.queue_new_image(img_data, ext)
+            services.update_post(blog_post, title, content, image=new_image)
         logger.info(f"Blog post with ID {blog_id} updated successfully")
 
-        return Response({"message": "Blog post updated successfully!", "post_id": blog_post.id}, status=200)
+        return Response({"message": "Blog post updated successfully!", "post_id": blog_post.id, "image_status": blog_image.status}, status=200)
 
 class DeletePost(APIView):
     permission_classes = (IsAuthenticated,)
@@ -176,25 +355,8 @@ class DeletePost(APIView):
        
         try:
             # Retrieve the blog post
-            blog = Blog.objects.get(pk=blog_id, author=request.user)
-            image = blog.image  # Access the related Image instance
-            
-            # Delete the image from S3
-            try:
-                s3.delete_object(
-                    Bucket=settings.AWS_STORAGE_BUCKET_NAME,
-                    Key=f"media/blog_images/{image.public_id}"
-                )
-                logger.info(f"Deleted image {image.public_id} from S3.")
-                
-                # Delete the image record from the database
-                image.delete()
-            except Exception as e:
-                logger.error(f"Failed to delete image from S3: {e}")
-                return Response({"error": "Failed to delete image from S3"}, status=500)
-            
-            # Delete the blog post
-            blog.delete()
+            blog = Blog.objects.select_related('image').get(pk=blog_id, author_id=request.user.id)
+            services.delete_post(blog)
             logger.info(f"Deleted blog post with ID {blog_id}.")
             return Response({"message": "Blog post deleted successfully!"}, status=204)
         
@@ -212,10 +374,8 @@ class SaveBlog(APIView):
         try:
             blog = Blog.objects.get(pk=blogID)
             user = User.objects.get(pk=userID)
-            blog_saved = SavedBlog.objects.create(
-                blog = blog,
-                saved_by = user
-            )
+            # Saving twice is a no-op that returns the existing save
+            blog_saved, created = services.save_blog(blog, user)
             
             return Response({"message": "Blog post saved successfully!", "post_id": blog_saved.id}, status=200)
         except Blog.DoesNotExist:
@@ -225,13 +385,36 @@ class SaveBlog(APIView):
 
 class getSavedBlogs(APIView):
     permission_classes = (AllowAny,)
+    pagination_class = SavedBlogPagination
+
     def get(self, request, *args, **kwargs):
         userID = self.kwargs.get('userID')
-        blogs = SavedBlog.objects.filter(saved_by_id=userID)
-        serializer = SavedBlogSerializer(blogs, many=True)
-       
-        
-        return Response(serializer.data)
+        # One indexed query per page, with each blog's author and image joined in
+        blogs = SavedBlog.objects.filter(saved_by_id=userID).select_related('blog__author', 'blog__image')
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(blogs, request, view=self)
+        serializer = SavedBlogSerializer(page, many=True)
+
+        return paginator.get_paginated_response(serializer.data)
+
+class getSavedBlogIds(APIView):
+    permission_classes = (AllowAny,)
+    max_ids = 200
+
+    def get(self, request, *args, **kwargs):
+        # Which of ?ids=1,2,3 the user has saved, in one query, so a feed
+        # page can mark its saved cards. Maps blog id to the SavedBlog id
+        # that deleteSaveBlog takes.
+        userID = self.kwargs.get('userID')
+        try:
+            blog_ids = {int(blog_id) for blog_id in request.query_params.get('ids', '').split(',') if blog_id}
+        except ValueError:
+            return Response({"error": "Invalid blog ids"}, status=400)
+        if len(blog_ids) > self.max_ids:
+            return Response({"error": f"At most {self.max_ids} ids per request"}, status=400)
+
+        saved = SavedBlog.objects.filter(saved_by_id=userID, blog_id__in=blog_ids).values_list('blog_id', 'id')
+        return Response({"saved": {blog_id: saved_id for blog_id, saved_id in saved}})
 
 class deleteSaveBlog(APIView):
     permission_classes = (IsAuthenticated,)
@@ -239,10 +422,125 @@ class deleteSaveBlog(APIView):
     def delete(self, request, *args, **kwargs):
         blogID = self.kwargs.get('blogID')
         
-        blog = SavedBlog.objects.get(pk = blogID)
+        try:
+            blog = SavedBlog.objects.get(pk = blogID)
+        except SavedBlog.DoesNotExist:
+            return Response({"error": "Saved blog not found."}, status=404)
         
-        blog.delete()
+        services.unsave_blog(blog)
         
         return Response({"message": "Blog removed from saved!", "post_id": blog.id}, status=200)
-        
-        
\ No newline at end of file
+
+
+def get_batch(request, key):
+    # (items, None) for a list of up to BLOG_BATCH_MAX_ITEMS under key, else (None, error response)
+    items = request.data.get(key) if isinstance(request.data, dict) else None
+    if not isinstance(items, list) or not items:
+        return None, Response({"error": f"Expected a non-empty list of {key}"}, status=400)
+    if len(items) > settings.BLOG_BATCH_MAX_ITEMS:
+        return None, Response({"error": f"At most {settings.BLOG_BATCH_MAX_ITEMS} {key} per request"}, status=400)
+    return items, None
+
+def get_batch_blog_ids(request):
+    blog_ids, error = get_batch(request, 'blogIDs')
+    if error:
+        return None, error
+    try:
+        # Repeats are dropped, results keep the order of first appearance
+        return list(dict.fromkeys(int(blog_id) for blog_id in blog_ids)), None
+    except (TypeError, ValueError):
+        return None, Response({"error": "Invalid blog ids"}, status=400)
+
+class BatchBlogPost(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        # {"posts": [{"title", "content", "image" or "imageID"}, ...]}, posted
+        # as the signed-in user. Items are checked one by one and the valid
+        # ones created together; results[i] tells how posts[i] went.
+        posts, error = get_batch(request, 'posts')
+        if error:
+            return error
+
+        results = [None] * len(posts)
+        valid = []
+        for index, item in enumerate(posts):
+            serializer = BatchPostSerializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {"index": index, "status": 400, "error": serializer.errors}
+
+        # Uploaded images, in one query
+        image_ids = [data['imageID'] for _, data in valid if 'imageID' in data]
+        uploaded = services.usable_images(request.user.id).in_bulk(image_ids)
+        inline = [(index, data) for index, data in valid if 'image' in data]
+        # Inline images go to S3 concurrently, before the rows; bytes already
+        # stored, or repeated in the batch, are uploaded once at most
+        stored = services.upload_images([(data['image'][1], data['image'][0]) for _, data in inline])
+        stored = {index: image for (index, _), image in zip(inline, stored)}
+
+        new_posts = []
+        created_for = []
+        uploads = []
+        for index, data in valid:
+            if 'imageID' in data:
+                image = uploaded.get(data['imageID'])
+                if image is None:
+                    results[index] = {"index": index, "status": 404, "error": "Image not found."}
+                    continue
+            else:
+                image = stored[index]
+                if isinstance(image, Exception):
+                    logger.error(f"Batch image upload failed: {image}")
+                    results[index] = {"index": index, "status": 502, "error": "Image upload failed."}
+                    continue
+                ext, img_data = data['image']
+                uploads.append((image, f"image/{ext}", img_data))
+            new_posts.append((data['title'], data['content'], image))
+            created_for.append(index)
+
+        blogs = services.create_posts(request.user.id, new_posts, uploads) if new_posts else []
+        for index, blog in zip(created_for, blogs):
+            results[index] = {"index": index, "status": 201, "post_id": blog.id, "image_status": blog.image.status}
+        logger.info(f"Batch of {len(posts)} posts, {len(blogs)} created")
+
+        return Response({"created": len(blogs), "results": results}, status=200)
+
+class BatchSaveBlogs(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def put(self, request, *args, **kwargs):
+        # {"blogIDs": [...]}, saved for the signed-in user; saving twice is a no-op
+        blog_ids, error = get_batch_blog_ids(request)
+        if error:
+            return error
+
+        saved = services.save_blogs(request.user.id, blog_ids)
+        results = []
+        for blog_id in blog_ids:
+            if blog_id in saved:
+                saved_id, created = saved[blog_id]
+                results.append({"blogID": blog_id, "status": 200, "post_id": saved_id, "created": created})
+            else:
+                results.append({"blogID": blog_id, "status": 404, "error": "Blog post not found."})
+
+        return Response({"results": results}, status=200)
+
+class BatchUnsaveBlogs(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        # {"blogIDs": [...]}, removed from the signed-in user's saved blogs
+        blog_ids, error = get_batch_blog_ids(request)
+        if error:
+            return error
+
+        removed = services.unsave_blogs(request.user.id, blog_ids)
+        results = [
+            {"blogID": blog_id, "status": 200, "post_id": removed[blog_id]} if blog_id in removed
+            else {"blogID": blog_id, "status": 404, "error": "Saved blog not found."}
+            for blog_id in blog_ids
+        ]
+
+        return Response({"results": results}, status=200)